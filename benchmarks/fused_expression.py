@@ -0,0 +1,90 @@
+"""Compare fused expression evaluation against a chain of operator closures.
+
+Evaluates a 10-node band math expression over a single 4096x4096 window of
+in-memory uint16 bands, reporting wall time and peak traced memory.
+
+    python benchmarks/fused_expression.py
+"""
+import time
+import tracemalloc
+from copy import copy
+from typing import Callable
+
+import numpy as np
+from rasterio.coords import BoundingBox
+from rio_tiler.constants import WGS84_CRS
+from rio_tiler.models import ImageData
+
+from geoproc.server.image import EXPRESSION_OPERATORS, Image
+
+SIZE = 4096
+BOUNDS = (-60.0, -35.0, -59.0, -34.0)
+REPEAT = 5
+
+
+def array_image(data: np.ndarray) -> Image:
+    mask = np.full(data.shape[1:], 255, dtype=np.uint8)
+
+    def _part(bounds, dst_crs, height, width, indexes):
+        return ImageData(data, mask, bounds=BoundingBox(*bounds), crs=dst_crs)
+
+    return Image(_part, dtype=data.dtype, band_names=["B1"])
+
+
+def closure_operator(method_name: str) -> Callable[[Image, Image], Image]:
+    # Chain of closures, as operators were evaluated before fusion
+    def _operator(a: Image, b: Image) -> Image:
+        def _part(*args):
+            a_data, b_data = a.part(*args), b.part(*args)
+            new_img_data = copy(a_data)
+            new_img_data.data = getattr(a_data.data, method_name)(b_data.data)
+            new_img_data.mask = np.maximum(a_data.mask, b_data.mask)
+            return new_img_data
+
+        return Image(_part, dtype=np.float64, band_names=["B1"])
+
+    return _operator
+
+
+def build(a: Image, b: Image, c: Image, op: Callable[[str], Callable]) -> Image:
+    add, sub, mul, div, gt = (
+        op(name) for name in ("__add__", "__sub__", "__mul__", "__truediv__", "__gt__")
+    )
+    ndvi = div(sub(a, b), add(a, b))
+    ratio = div(mul(c, a), add(b, c))
+    return gt(sub(mul(ndvi, ratio), c), add(a, c))
+
+
+def fused_operator(method_name: str) -> Callable[[Image, Image], Image]:
+    assert method_name in EXPRESSION_OPERATORS
+    return lambda a, b: a._operator(method_name, b)
+
+
+def measure(image: Image) -> tuple[float, float]:
+    times = []
+    peaks = []
+    for _ in range(REPEAT):
+        tracemalloc.start()
+        start = time.perf_counter()
+        image.part(BOUNDS, WGS84_CRS, SIZE, SIZE)
+        times.append(time.perf_counter() - start)
+        peaks.append(tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+    return min(times), max(peaks) / 2**20
+
+
+def main():
+    rng = np.random.default_rng(42)
+    a, b, c = (
+        array_image(rng.integers(1, 10000, (1, SIZE, SIZE), dtype=np.uint16))
+        for _ in range(3)
+    )
+
+    print(f"{SIZE}x{SIZE} window, 10-node expression, best of {REPEAT}")
+    for name, op in (("closures", closure_operator), ("fused", fused_operator)):
+        seconds, peak = measure(build(a, b, c, op))
+        print(f"{name:>10}: {seconds * 1000:8.1f} ms {peak:8.1f} MiB peak")
+
+
+if __name__ == "__main__":
+    main()
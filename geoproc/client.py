@@ -1,6 +1,24 @@
-from typing import Optional, Any
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import (
+    Any,
+    AsyncIterator,
+    Callable,
+    Iterator,
+    NamedTuple,
+    Optional,
+    Union,
+)
 
 import httpx
+import numpy as np
+import numpy.typing as npt
 
 from geoproc.image import Image
 from geoproc.types import BBox
@@ -8,30 +26,193 @@ from geoproc.models import VisualizationParams
 
 
 class APIClient:
-    def __init__(self, url: str = "http://localhost:8000"):
+    """Client of the geoproc server.
+
+    Requests go through a single `httpx.Client`, so connections are pooled
+    and kept alive between requests. The client can be used as a context
+    manager to close its connections when done. HTTP/2 requires the `h2`
+    package (`pip install httpx[http2]`).
+    """
+
+    def __init__(
+        self,
+        url: str = "http://localhost:8000",
+        *,
+        http2: bool = False,
+        max_connections: int = 100,
+        timeout: Optional[float] = 5.0,
+        info_cache_size: int = 4096,
+    ):
         self.url = url
+        self._client = httpx.Client(
+            http2=http2,
+            limits=httpx.Limits(max_connections=max_connections),
+            timeout=timeout,
+        )
+        self._infos = _InfoCache(info_cache_size)
+
+    def close(self) -> None:
+        self._client.close()
+
+    def __enter__(self) -> APIClient:
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        self.close()
+
+    def _send(self, request: _Request) -> Any:
+        send = getattr(self._client, request.method)
+        r = send(f"{self.url}{request.path}", **request.options)
+        return request.decode(r)
 
     def get_map(
         self,
         image: Image,
         vis_params: Optional[VisualizationParams] = None,
     ) -> dict[str, str]:
-        vis_dict = vis_params and vis_params.dict()
-        r = httpx.post(
-            f"{self.url}/map",
-            json={"image_graph": image.graph, "vis_params": vis_dict},
-        )
-        res = r.json()
-        if r.is_error:
-            raise RuntimeError(res["detail"])
-        return res["detail"]
+        return self._send(_map_request(image, vis_params))
+
+    def get_preview(
+        self,
+        image: Image,
+        vis_params: Optional[VisualizationParams] = None,
+        *,
+        max_size: int = 1024,
+    ) -> bytes:
+        """Render a PNG preview of a whole image, with at most `max_size`
+        pixels on its largest side."""
+        return self._send(_preview_request(image, vis_params, max_size))
 
     def get_info(self, image: Image) -> dict[str, Any]:
-        r = httpx.post(f"{self.url}/info", json=image.graph)
-        res = r.json()
-        if r.is_error:
-            raise RuntimeError(res["detail"])
-        return res["detail"]
+        """Get the info of an image.
+
+        Info only depends on the image graph, so it is memoized by a hash of
+        the graph.
+        """
+        key = graph_key(image.graph)
+        info = self._infos.get(key)
+        if info is None:
+            info = self._send(_info_request(image))
+            self._infos.set(key, info)
+        return info
+
+    def get_infos(self, images: list[Image]) -> list[dict[str, Any]]:
+        """Get the info of many images in a single request.
+
+        Only images whose info is not memoized yet are sent, each distinct
+        graph once.
+        """
+        keys = [graph_key(image.graph) for image in images]
+        infos = {key: self._infos.get(key) for key in keys}
+        missing = {k: img.graph for k, img in zip(keys, images) if infos[k] is None}
+        if missing:
+            items = self._send(_info_batch_request(list(missing.values())))
+            for key, item in zip(missing, items):
+                infos[key] = _info_item(item)
+                self._infos.set(key, infos[key])
+        return [infos[key] for key in keys]
+
+    def get_statistics(
+        self,
+        image: Image,
+        *,
+        scale: Optional[float] = None,
+        max_size: int = 1024,
+        bins: int = 10,
+        percentiles: list[int] = [2, 98],
+        workers: int = 1,
+    ) -> dict[str, dict[str, Any]]:
+        """Compute per-band statistics of an image.
+
+        Without `scale`, statistics are approximated from the image evaluated
+        at a coarse scale, with at most `max_size` pixels on its largest side.
+        """
+        return self._send(
+            _statistics_request(image, scale, max_size, bins, percentiles, workers)
+        )
+
+    def sample(
+        self,
+        image: Image,
+        points: Union[npt.ArrayLike, dict[str, Any]],
+        *,
+        crs: str = "epsg:4326",
+        scale: Optional[float] = None,
+        workers: int = 1,
+    ) -> dict[str, np.ma.MaskedArray]:
+        """Sample an image at many points in a single request.
+
+        `points` is either an array of (x, y) coordinates in `crs`, or a
+        GeoJSON Point, MultiPoint, Feature or FeatureCollection of points.
+        Returns a masked array of values by band, in the same order as the
+        points, with points outside the image masked.
+        """
+        return self._send(_sample_request(image, points, crs, scale, workers))
+
+    def get_array(
+        self,
+        image: Image,
+        *,
+        tile: Optional[tuple[int, int, int]] = None,
+        tilesize: int = 256,
+        bounds: Optional[BBox] = None,
+        bounds_crs: str = "epsg:4326",
+        crs: Optional[str] = None,
+        width: Optional[int] = None,
+        height: Optional[int] = None,
+        bands: Optional[list[str]] = None,
+        compress: bool = False,
+    ) -> Optional[dict[str, Any]]:
+        """Read the raw values of an image over a tile (z, x, y) or over
+        `bounds` (in `bounds_crs`) at `width` x `height` pixels, in `crs`
+        (defaults to the image CRS).
+
+        Returns a dict with the "data" array (bands, height, width), its
+        "mask" (height, width, 0 for masked pixels), "band_names", "bounds"
+        and "crs", or None if the tile is outside of the image. Arrays are
+        read-only views of the response body, decoded without copies.
+        """
+        return self._send(
+            _array_request(
+                image,
+                tile=tile,
+                tilesize=tilesize,
+                bounds=bounds,
+                bounds_crs=bounds_crs,
+                crs=crs,
+                width=width,
+                height=height,
+                bands=bands,
+                compress=compress,
+            )
+        )
+
+    def zonal_statistics(
+        self,
+        image: Image,
+        features: dict[str, Any],
+        *,
+        crs: str = "epsg:4326",
+        scale: Optional[float] = None,
+        workers: int = 1,
+    ) -> Iterator[dict[str, Any]]:
+        """Compute per-band count, sum, mean, min and max of an image over
+        each feature of a GeoJSON FeatureCollection.
+
+        Results are streamed by the server as they are done, and yielded as
+        dicts with the feature "index", its "id" and its "stats" by band, not
+        necessarily in feature order.
+        """
+        request = _zonal_statistics_request(image, features, crs, scale, workers)
+        with self._client.stream(
+            "POST", f"{self.url}{request.path}", **request.options
+        ) as r:
+            if r.is_error:
+                r.read()
+                _raise_for_error(r)
+            for line in r.iter_lines():
+                if line:
+                    yield json.loads(line)
 
     def export(
         self,
@@ -42,17 +223,569 @@ class APIClient:
         crs: str,
         bounds: Optional[BBox] = None,
         path: str,
+        precision: Optional[str] = None,
+        workers: int = 1,
+        executor: str = "thread",
+        block: bool = True,
     ) -> dict:
-        data = {
-            "image": image.graph,
-            "scale": scale,
-            "in_crs": in_crs,
-            "crs": crs,
-            "bounds": bounds,
-            "path": path,
-        }
-        r = httpx.post(f"{self.url}/export", json=data, timeout=30 * 60)
-        res = r.json()
-        if r.is_error:
-            raise RuntimeError(res["detail"])
-        return res
+        """Export an image on the server.
+
+        By default the request blocks until the export is written. If `block`
+        is false, submit it as a background job and return the job instead.
+        Jobs are tracked by the server process that accepted them, so only
+        poll them when the server runs a single worker process.
+        """
+        return self._send(
+            _export_request(
+                image,
+                scale=scale,
+                in_crs=in_crs,
+                crs=crs,
+                bounds=bounds,
+                path=path,
+                precision=precision,
+                workers=workers,
+                executor=executor,
+                block=block,
+            )
+        )
+
+    def seed(
+        self,
+        map_id: str,
+        *,
+        min_zoom: int,
+        max_zoom: int,
+        bounds: Optional[BBox] = None,
+        workers: int = 4,
+        block: bool = True,
+        poll_interval: float = 1.0,
+        progress: Optional[Callable[[int, int], None]] = None,
+    ) -> dict:
+        """Render the tiles of a map into the server's tile cache.
+
+        Tiles within `bounds` (in WGS84, defaults to the image bounds) from
+        `min_zoom` to `max_zoom` are rendered as a background job. If `block`
+        is false, return the submitted job right away. Otherwise, poll the
+        job until it finishes, calling `progress` with the tiles done so far.
+        Jobs are tracked by the server process that accepted them, so only
+        poll them (`block`, `get_job`, `wait_job`) when the server runs a
+        single worker process.
+        """
+        job = self._send(_seed_request(map_id, min_zoom, max_zoom, bounds, workers))
+        if not block:
+            return job
+        return self.wait_job(job["id"], poll_interval=poll_interval, progress=progress)
+
+    def get_job(self, id: str) -> dict:
+        return self._send(_Request("get", f"/jobs/{id}", _detail))
+
+    def cancel_job(self, id: str) -> dict:
+        return self._send(_Request("delete", f"/jobs/{id}", _detail))
+
+    def wait_job(
+        self,
+        id: str,
+        *,
+        poll_interval: float = 1.0,
+        progress: Optional[Callable[[int, int], None]] = None,
+    ) -> dict:
+        while True:
+            job = self.get_job(id)
+            if _job_finished(job, progress):
+                return job
+            time.sleep(poll_interval)
+
+
+class AsyncAPIClient:
+    """Asynchronous client of the geoproc server, with the same methods as
+    `APIClient`, for submitting many requests concurrently.
+
+    Requests go through a single `httpx.AsyncClient`, so connections are
+    pooled and kept alive between requests.
+    """
+
+    def __init__(
+        self,
+        url: str = "http://localhost:8000",
+        *,
+        http2: bool = False,
+        max_connections: int = 100,
+        timeout: Optional[float] = 5.0,
+        info_cache_size: int = 4096,
+    ):
+        self.url = url
+        self._client = httpx.AsyncClient(
+            http2=http2,
+            limits=httpx.Limits(max_connections=max_connections),
+            timeout=timeout,
+        )
+        self._infos = _InfoCache(info_cache_size)
+        # Info requests waiting to be sent in the next batch, by graph key
+        self._info_batch: dict[str, tuple[Any, asyncio.Future]] = {}
+        # Batches being sent. The event loop only keeps weak references to
+        # tasks, so they are kept here until done.
+        self._info_tasks: set[asyncio.Future] = set()
+
+    async def close(self) -> None:
+        await self._client.aclose()
+
+    async def __aenter__(self) -> AsyncAPIClient:
+        return self
+
+    async def __aexit__(self, *args: Any) -> None:
+        await self.close()
+
+    async def _send(self, request: _Request) -> Any:
+        send = getattr(self._client, request.method)
+        r = await send(f"{self.url}{request.path}", **request.options)
+        return request.decode(r)
+
+    async def get_map(
+        self,
+        image: Image,
+        vis_params: Optional[VisualizationParams] = None,
+    ) -> dict[str, str]:
+        return await self._send(_map_request(image, vis_params))
+
+    async def get_preview(
+        self,
+        image: Image,
+        vis_params: Optional[VisualizationParams] = None,
+        *,
+        max_size: int = 1024,
+    ) -> bytes:
+        return await self._send(_preview_request(image, vis_params, max_size))
+
+    async def get_info(self, image: Image) -> dict[str, Any]:
+        """Get the info of an image.
+
+        Info is memoized by a hash of the image graph. Concurrent calls are
+        sent together to the server, in a single batch request.
+        """
+        key = graph_key(image.graph)
+        info = self._infos.get(key)
+        if info is not None:
+            return info
+        pending = self._info_batch.get(key)
+        if pending is None:
+            if not self._info_batch:
+                task = asyncio.ensure_future(self._send_info_batch())
+                self._info_tasks.add(task)
+                task.add_done_callback(self._info_tasks.discard)
+            future = asyncio.get_running_loop().create_future()
+            pending = self._info_batch[key] = (image.graph, future)
+        return await asyncio.shield(pending[1])
+
+    async def get_infos(self, images: list[Image]) -> list[dict[str, Any]]:
+        return list(await asyncio.gather(*(self.get_info(img) for img in images)))
+
+    async def _send_info_batch(self) -> None:
+        # Let every coroutine that is ready to run add its request to the
+        # batch before sending it
+        await asyncio.sleep(0)
+        batch, self._info_batch = self._info_batch, {}
+        try:
+            graphs = [graph for graph, _ in batch.values()]
+            items = await self._send(_info_batch_request(graphs))
+        except Exception as err:
+            for _, future in batch.values():
+                future.set_exception(err)
+            return
+        for (key, (_, future)), item in zip(batch.items(), items):
+            try:
+                info = _info_item(item)
+            except RuntimeError as err:
+                future.set_exception(err)
+                continue
+            self._infos.set(key, info)
+            future.set_result(info)
+
+    async def get_statistics(
+        self,
+        image: Image,
+        *,
+        scale: Optional[float] = None,
+        max_size: int = 1024,
+        bins: int = 10,
+        percentiles: list[int] = [2, 98],
+        workers: int = 1,
+    ) -> dict[str, dict[str, Any]]:
+        return await self._send(
+            _statistics_request(image, scale, max_size, bins, percentiles, workers)
+        )
+
+    async def sample(
+        self,
+        image: Image,
+        points: Union[npt.ArrayLike, dict[str, Any]],
+        *,
+        crs: str = "epsg:4326",
+        scale: Optional[float] = None,
+        workers: int = 1,
+    ) -> dict[str, np.ma.MaskedArray]:
+        return await self._send(_sample_request(image, points, crs, scale, workers))
+
+    async def get_array(
+        self,
+        image: Image,
+        *,
+        tile: Optional[tuple[int, int, int]] = None,
+        tilesize: int = 256,
+        bounds: Optional[BBox] = None,
+        bounds_crs: str = "epsg:4326",
+        crs: Optional[str] = None,
+        width: Optional[int] = None,
+        height: Optional[int] = None,
+        bands: Optional[list[str]] = None,
+        compress: bool = False,
+    ) -> Optional[dict[str, Any]]:
+        return await self._send(
+            _array_request(
+                image,
+                tile=tile,
+                tilesize=tilesize,
+                bounds=bounds,
+                bounds_crs=bounds_crs,
+                crs=crs,
+                width=width,
+                height=height,
+                bands=bands,
+                compress=compress,
+            )
+        )
+
+    async def zonal_statistics(
+        self,
+        image: Image,
+        features: dict[str, Any],
+        *,
+        crs: str = "epsg:4326",
+        scale: Optional[float] = None,
+        workers: int = 1,
+    ) -> AsyncIterator[dict[str, Any]]:
+        request = _zonal_statistics_request(image, features, crs, scale, workers)
+        async with self._client.stream(
+            "POST", f"{self.url}{request.path}", **request.options
+        ) as r:
+            if r.is_error:
+                await r.aread()
+                _raise_for_error(r)
+            async for line in r.aiter_lines():
+                if line:
+                    yield json.loads(line)
+
+    async def export(
+        self,
+        image: Image,
+        *,
+        scale: float,
+        in_crs: str,
+        crs: str,
+        bounds: Optional[BBox] = None,
+        path: str,
+        precision: Optional[str] = None,
+        workers: int = 1,
+        executor: str = "thread",
+        block: bool = True,
+    ) -> dict:
+        return await self._send(
+            _export_request(
+                image,
+                scale=scale,
+                in_crs=in_crs,
+                crs=crs,
+                bounds=bounds,
+                path=path,
+                precision=precision,
+                workers=workers,
+                executor=executor,
+                block=block,
+            )
+        )
+
+    async def seed(
+        self,
+        map_id: str,
+        *,
+        min_zoom: int,
+        max_zoom: int,
+        bounds: Optional[BBox] = None,
+        workers: int = 4,
+        block: bool = True,
+        poll_interval: float = 1.0,
+        progress: Optional[Callable[[int, int], None]] = None,
+    ) -> dict:
+        job = await self._send(
+            _seed_request(map_id, min_zoom, max_zoom, bounds, workers)
+        )
+        if not block:
+            return job
+        return await self.wait_job(
+            job["id"], poll_interval=poll_interval, progress=progress
+        )
+
+    async def get_job(self, id: str) -> dict:
+        return await self._send(_Request("get", f"/jobs/{id}", _detail))
+
+    async def cancel_job(self, id: str) -> dict:
+        return await self._send(_Request("delete", f"/jobs/{id}", _detail))
+
+    async def wait_job(
+        self,
+        id: str,
+        *,
+        poll_interval: float = 1.0,
+        progress: Optional[Callable[[int, int], None]] = None,
+    ) -> dict:
+        while True:
+            job = await self.get_job(id)
+            if _job_finished(job, progress):
+                return job
+            await asyncio.sleep(poll_interval)
+
+
+class _Request(NamedTuple):
+    # A request shared by the sync and async clients: the name of the httpx
+    # client method to send it with, its path, how to decode the response,
+    # and keyword arguments of the httpx method (e.g. json, timeout)
+    method: str
+    path: str
+    decode: Callable[[httpx.Response], Any]
+    options: dict[str, Any] = {}
+
+
+def _map_request(image: Image, vis_params: Optional[VisualizationParams]) -> _Request:
+    vis_dict = vis_params and vis_params.dict()
+    data = {"image_graph": image.graph, "vis_params": vis_dict}
+    return _Request("post", "/map", _detail, {"json": data})
+
+
+def _preview_request(
+    image: Image, vis_params: Optional[VisualizationParams], max_size: int
+) -> _Request:
+    data = {
+        "image": image.graph,
+        "vis_params": (vis_params or VisualizationParams()).dict(),
+        "max_size": max_size,
+    }
+    return _Request("post", "/preview", _content, {"json": data})
+
+
+def _info_request(image: Image) -> _Request:
+    return _Request("post", "/info", _detail, {"json": image.graph})
+
+
+def _info_batch_request(graphs: list[Any]) -> _Request:
+    return _Request("post", "/info/batch", _detail, {"json": graphs})
+
+
+def _info_item(item: dict[str, Any]) -> dict[str, Any]:
+    # Items of a batch have the status and detail of their own /info request
+    if item["status"] != 200:
+        raise RuntimeError(item["detail"])
+    return item["detail"]
+
+
+def _statistics_request(
+    image: Image,
+    scale: Optional[float],
+    max_size: int,
+    bins: int,
+    percentiles: list[int],
+    workers: int,
+) -> _Request:
+    data = {
+        "image": image.graph,
+        "scale": scale,
+        "max_size": max_size,
+        "bins": bins,
+        "percentiles": percentiles,
+        "workers": workers,
+    }
+    return _Request("post", "/statistics", _detail, {"json": data})
+
+
+def _sample_request(
+    image: Image,
+    points: Union[npt.ArrayLike, dict[str, Any]],
+    crs: str,
+    scale: Optional[float],
+    workers: int,
+) -> _Request:
+    data = {
+        "image": image.graph,
+        "coordinates": _point_coordinates(points),
+        "crs": crs,
+        "scale": scale,
+        "workers": workers,
+    }
+    return _Request(
+        "post", "/sample", lambda r: _masked_bands(_detail(r)), {"json": data}
+    )
+
+
+def _array_request(image: Image, **params: Any) -> _Request:
+    data = {"image": image.graph, **params}
+    return _Request("post", "/array", _decode_array, {"json": data})
+
+
+def _zonal_statistics_request(
+    image: Image,
+    features: dict[str, Any],
+    crs: str,
+    scale: Optional[float],
+    workers: int,
+) -> _Request:
+    # Results are streamed, so they are decoded line by line by the clients
+    data = {
+        "image": image.graph,
+        "features": features,
+        "crs": crs,
+        "scale": scale,
+        "workers": workers,
+    }
+    return _Request(
+        "post", "/zonal-statistics", _raise_for_error, {"json": data, "timeout": None}
+    )
+
+
+def _export_request(image: Image, *, block: bool, **params: Any) -> _Request:
+    data = {"image": image.graph, **params}
+    if not block:
+        return _Request("post", "/jobs/export", _detail, {"json": data})
+    return _Request("post", "/export", _json, {"json": data, "timeout": 30 * 60})
+
+
+def _seed_request(
+    map_id: str,
+    min_zoom: int,
+    max_zoom: int,
+    bounds: Optional[BBox],
+    workers: int,
+) -> _Request:
+    data = {
+        "map_id": map_id,
+        "bounds": bounds,
+        "min_zoom": min_zoom,
+        "max_zoom": max_zoom,
+        "workers": workers,
+    }
+    return _Request("post", "/jobs/seed", _detail, {"json": data})
+
+
+def _job_finished(
+    job: dict[str, Any], progress: Optional[Callable[[int, int], None]]
+) -> bool:
+    if progress and job["total"] is not None:
+        progress(job["done"], job["total"])
+    if job["status"] in ("failed", "cancelled"):
+        raise RuntimeError(job["error"] or f"Job {job['id']} was {job['status']}")
+    return job["status"] == "done"
+
+
+class _InfoCache:
+    # Thread-safe LRU cache of image info by graph key
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._lock = threading.Lock()
+        self._infos: OrderedDict[str, dict[str, Any]] = OrderedDict()
+
+    def get(self, key: str) -> Optional[dict[str, Any]]:
+        with self._lock:
+            info = self._infos.get(key)
+            if info is not None:
+                self._infos.move_to_end(key)
+            return info
+
+    def set(self, key: str, info: dict[str, Any]) -> None:
+        with self._lock:
+            self._infos[key] = info
+            self._infos.move_to_end(key)
+            while len(self._infos) > self.maxsize:
+                self._infos.popitem(last=False)
+
+
+def graph_key(graph: Any) -> str:
+    """Hash of an image graph, identical for equal graphs."""
+    body = json.dumps(graph, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha1(body.encode()).hexdigest()
+
+
+_default_client: Optional[APIClient] = None
+_default_client_lock = threading.Lock()
+
+
+def default_client() -> APIClient:
+    """Get the client shared by `Image` methods, creating it on first use."""
+    global _default_client
+    with _default_client_lock:
+        if _default_client is None:
+            _default_client = APIClient()
+        return _default_client
+
+
+def _point_coordinates(points: Union[npt.ArrayLike, dict[str, Any]]) -> list:
+    if isinstance(points, dict):
+        if points["type"] == "FeatureCollection":
+            return [
+                c for f in points["features"] for c in _point_coordinates(f["geometry"])
+            ]
+        if points["type"] == "Feature":
+            return _point_coordinates(points["geometry"])
+        if points["type"] == "Point":
+            return [points["coordinates"][:2]]
+        if points["type"] == "MultiPoint":
+            return [c[:2] for c in points["coordinates"]]
+        raise ValueError(f"Unsupported GeoJSON type: {points['type']}")
+    return np.asarray(points, dtype=float).reshape(-1, 2).tolist()
+
+
+def _raise_for_error(r: httpx.Response) -> None:
+    if r.is_error:
+        raise RuntimeError(r.json()["detail"])
+
+
+def _detail(r: httpx.Response) -> Any:
+    _raise_for_error(r)
+    return r.json()["detail"]
+
+
+def _json(r: httpx.Response) -> Any:
+    _raise_for_error(r)
+    return r.json()
+
+
+def _content(r: httpx.Response) -> bytes:
+    _raise_for_error(r)
+    return r.content
+
+
+def _decode_array(r: httpx.Response) -> Optional[dict[str, Any]]:
+    if r.status_code == 204:
+        return None
+    _raise_for_error(r)
+    dtype = np.dtype(r.headers["x-array-dtype"])
+    shape = tuple(int(n) for n in r.headers["x-array-shape"].split(","))
+    content = r.content
+    data = np.frombuffer(content, dtype=dtype, count=int(np.prod(shape)))
+    mask = np.frombuffer(content, dtype=np.uint8, offset=data.nbytes)
+    return {
+        "data": data.reshape(shape),
+        "mask": mask.reshape(shape[1:]),
+        "band_names": json.loads(r.headers["x-array-band-names"]),
+        "bounds": tuple(json.loads(r.headers["x-array-bounds"])),
+        "crs": r.headers["x-array-crs"],
+    }
+
+
+def _masked_bands(values: dict[str, list]) -> dict[str, np.ma.MaskedArray]:
+    # Values are null for points outside of the image or masked
+    return {
+        name: np.ma.array(
+            [0 if v is None else v for v in band_values],
+            mask=[v is None for v in band_values],
+        )
+        for name, band_values in values.items()
+    }
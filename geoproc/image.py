@@ -52,6 +52,8 @@ class BaseImage(metaclass=ABCMeta):
         scale: float = 1000,
         in_crs: str = "epsg:4326",
         crs: str = "epsg:4326",
+        precision: Optional[str] = None,
+        workers: int = 1,
     ):
         ...
 
@@ -59,6 +61,10 @@ class BaseImage(metaclass=ABCMeta):
     def select(self, band_names_or_idx: list[Union[str, int]]) -> BaseImage:
         ...
 
+    @abstractmethod
+    def astype(self, dtype: str) -> BaseImage:
+        ...
+
     @abstractmethod
     def __abs__(self) -> BaseImage:
         ...
@@ -153,12 +159,44 @@ class Image(BaseImage):
     def select(self, band_names_or_idx: list[Union[str, int]]) -> Image:
         return Image({"name": "select", "args": [self._graph, band_names_or_idx]})
 
+    def astype(self, dtype: str) -> Image:
+        return Image({"name": "astype", "args": [self._graph, dtype]})
+
     def get_map(self, vis_params: dict[str, Any] = {}) -> dict:
-        from .client import APIClient
+        from .client import default_client
 
-        client = APIClient()
+        client = default_client()
         return client.get_map(self, vis_params=VisualizationParams(**vis_params))
 
+    def preview(self, vis_params: dict[str, Any] = {}, max_size: int = 1024) -> bytes:
+        from .client import default_client
+
+        client = default_client()
+        return client.get_preview(
+            self, VisualizationParams(**vis_params), max_size=max_size
+        )
+
+    def statistics(
+        self,
+        *,
+        scale: Optional[float] = None,
+        max_size: int = 1024,
+        bins: int = 10,
+        percentiles: list[int] = [2, 98],
+        workers: int = 1,
+    ) -> dict[str, dict[str, Any]]:
+        from .client import default_client
+
+        client = default_client()
+        return client.get_statistics(
+            self,
+            scale=scale,
+            max_size=max_size,
+            bins=bins,
+            percentiles=percentiles,
+            workers=workers,
+        )
+
     def export(
         self,
         path: str,
@@ -167,10 +205,14 @@ class Image(BaseImage):
         scale: float = 1000,
         in_crs: str = "epsg:4326",
         crs: str = "epsg:4326",
+        precision: Optional[str] = None,
+        workers: int = 1,
+        executor: str = "thread",
+        block: bool = True,
     ):
-        from .client import APIClient
+        from .client import default_client
 
-        client = APIClient()
+        client = default_client()
         return client.export(
             self,
             path=path,
@@ -178,6 +220,10 @@ class Image(BaseImage):
             scale=scale,
             in_crs=in_crs,
             crs=crs,
+            precision=precision,
+            workers=workers,
+            executor=executor,
+            block=block,
         )
 
     def __abs__(self) -> Image:
@@ -239,11 +285,27 @@ class Image(BaseImage):
     def _constant(value: Union[int, float]) -> CallGraph:
         return {"name": "constant", "args": [value]}
 
+    @staticmethod
+    def fetch_info(images: list[Image]) -> None:
+        """Fetch the info of many images in a single request, instead of one
+        request per image when their properties are first read."""
+        from .client import default_client
+
+        client = default_client()
+        for image, info in zip(images, client.get_infos(images)):
+            image._info = info
+
     @property
     def info(self) -> dict[str, Any]:
+        """Info of the image, fetched from the server on first use.
+
+        Each image sends its own request, unless its info was memoized by the
+        client. To get the info of many images in a single request, call
+        `Image.fetch_info` first.
+        """
         if not self._info:
-            from .client import APIClient
+            from .client import default_client
 
-            client = APIClient()
+            client = default_client()
             self._info = client.get_info(self)
         return self._info
@@ -1,70 +1,155 @@
-import functools
+import asyncio
+import hashlib
 import json
-import uuid
-from typing import Any, Optional
+import math
+import zlib
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    Future,
+    ThreadPoolExecutor,
+    as_completed,
+    wait,
+)
+from copy import copy
+from typing import Any, Callable, Iterable, Iterator, Optional, Tuple
 
+import numpy as np
+import numpy.typing as npt
 import redis
+import redis.asyncio
 from fastapi import FastAPI, HTTPException, Request, Response
 from fastapi.encoders import jsonable_encoder
 from fastapi.exceptions import RequestValidationError
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse
+from morecantile.commons import Tile
+from morecantile.models import LL_EPSILON
 from rasterio.crs import CRS
+from rasterio.warp import transform_bounds
+from redis.exceptions import RedisError
+from rio_tiler.constants import WEB_MERCATOR_TMS, WGS84_CRS
 from rio_tiler.errors import TileOutsideBounds
-from rio_tiler.profiles import img_profiles
+from rio_tiler.models import ImageData
+from rio_tiler.types import BBox
+from starlette.concurrency import run_in_threadpool
 from starlette.exceptions import HTTPException as StarletteHTTPException
 
 from geoproc.models import VisualizationParams
+from geoproc.server.cache import TieredCache
+from geoproc.server.executor import BoundedExecutor, Overloaded
 from geoproc.server.image import Image, ImageReader
 from geoproc.server.image import eval_image as _eval_image
-from geoproc.server.models import ExportRequest
-from geoproc.types import Number, SingleOrRGBList
+from geoproc.server.image import eval_images as _eval_images
+from geoproc.server.image import raster_info_cache, source_signatures
+from geoproc.server.jobs import job_manager
+from geoproc.server.models import (
+    ArrayRequest,
+    ExportRequest,
+    MapDefinition,
+    PreviewRequest,
+    SampleRequest,
+    SeedRequest,
+    StatisticsRequest,
+    ZonalStatisticsRequest,
+)
+from geoproc.server.pool import dataset_pool
+from geoproc.server.settings import settings
+from geoproc.server.tiles import (
+    InvalidVisParams,
+    eval_image,
+    render_metatile,
+    render_preview,
+    render_tile,
+)
+from geoproc.types import Number
 
 cache_redis = redis.Redis(host="localhost", port=6379, db=0)
+async_redis = redis.asyncio.Redis(host="localhost", port=6379, db=0)
+raster_info_cache.redis = cache_redis
+
+# Map definitions never change once created, so each worker keeps the ones
+# it has seen, parsed, and only reads Redis on a miss.
+map_cache: TieredCache[MapDefinition] = TieredCache(
+    "map_defs",
+    maxsize=settings.map_cache_size,
+    dumps=lambda map_def: map_def.json().encode(),
+    loads=MapDefinition.parse_raw,
+    async_redis=async_redis,
+)
 
+# Encoded tiles, keyed by map id and tile. Empty bytes stand for tiles that
+# have no content.
+tile_cache: TieredCache[bytes] = TieredCache(
+    "tiles",
+    maxsize=settings.tile_cache_size,
+    maxbytes=settings.tile_cache_max_bytes,
+    dumps=bytes,
+    loads=bytes,
+    ttl=settings.tile_cache_ttl,
+    redis=cache_redis,
+    async_redis=async_redis,
+)
 
-app = FastAPI()
+statistics_cache: TieredCache[dict[str, Any]] = TieredCache(
+    "statistics",
+    maxsize=settings.statistics_cache_size,
+    dumps=lambda stats: json.dumps(stats).encode(),
+    loads=json.loads,
+    ttl=settings.statistics_cache_ttl,
+    async_redis=async_redis,
+)
 
-TILE_HEADERS = {"Cache-Control": "max-age=31536000, immutable"}
+# Tiles are rendered in a dedicated executor, so that a busy map page does
+# not take over the threadpool that serves every other sync endpoint.
+tile_executor = BoundedExecutor(
+    settings.tile_workers,
+    settings.tile_queue_size,
+    executor=settings.tile_executor,
+)
 
 
-def set_map(uuid: str, image_dict: dict[str, Any]) -> None:
-    body = json.dumps(image_dict)
-    cache_redis.set(f"maps:{uuid}", body)
+app = FastAPI()
 
 
-def set_vis_params(uuid: str, vis_params: VisualizationParams) -> None:
-    body = json.dumps(vis_params.dict())
-    cache_redis.set(f"vis_params:{uuid}", body)
+@app.on_event("shutdown")
+def shutdown_tile_executor():
+    tile_executor.shutdown()
 
 
-def get_map(uuid: str) -> Optional[str]:
-    body = cache_redis.get(f"maps:{uuid}")
-    if not body:
-        return
-    return body.decode()
+TILE_HEADERS = {"Cache-Control": "max-age=31536000, immutable"}
 
 
-def get_vis_params(uuid: str) -> Optional[VisualizationParams]:
-    body = cache_redis.get(f"vis_params:{uuid}")
-    if not body:
-        return
-    body_dict = json.loads(body)
-    return VisualizationParams(**body_dict)
+async def set_map(id: str, map_def: MapDefinition) -> None:
+    # Write to Redis directly (instead of through the cache), so that failing
+    # to store a map is not silently ignored
+    await async_redis.set(f"{map_cache.prefix}:{id}", map_def.json())
+    map_cache.local.set(id, map_def)
 
 
-def expand_scale_range(
-    min_max: tuple[SingleOrRGBList, SingleOrRGBList], count: int
-) -> list[tuple[Number, Number]]:
-    min_v, max_v = min_max
-    min_v = [min_v] * count if not isinstance(min_v, tuple) else min_v
-    max_v = [max_v] * count if not isinstance(max_v, tuple) else max_v
-    return list(zip(min_v, max_v))[:count]
+async def get_map(id: str) -> Optional[MapDefinition]:
+    map_def = await map_cache.aget(id)
+    if map_def is None:
+        map_def = await get_legacy_map(id)
+    return map_def
 
 
-@functools.lru_cache(maxsize=64, typed=False)
-def eval_image(image_json: str) -> Image:
-    image_dict = json.loads(image_json)
-    return _eval_image(image_dict)
+async def get_legacy_map(id: str) -> Optional[MapDefinition]:
+    # Maps created by earlier versions stored the image graph and the
+    # visualization parameters under separate keys
+    if map_cache.async_redis is None:
+        return None
+    try:
+        image_json, vis_params = await map_cache.async_redis.mget(
+            f"maps:{id}", f"vis_params:{id}"
+        )
+    except RedisError:
+        return None
+    if not image_json:
+        return None
+    map_def = MapDefinition(image_json=image_json.decode())
+    if vis_params:
+        map_def.vis_params = VisualizationParams.parse_raw(vis_params)
+    map_cache.local.set(id, map_def)
+    return map_def
 
 
 @app.exception_handler(StarletteHTTPException)
@@ -72,6 +157,7 @@ async def http_exception_handler(request, exc):
     return JSONResponse(
         jsonable_encoder({"code": 400, "detail": str(exc.detail)}),
         status_code=exc.status_code,
+        headers=getattr(exc, "headers", None),
     )
 
 
@@ -101,25 +187,295 @@ async def map(
     vis_params: VisualizationParams,
     request: Request,
 ):
-    new_uuid = str(uuid.uuid4())
-    set_map(new_uuid, image_graph)
-    set_vis_params(new_uuid, vis_params)
+    # Map ids are derived from their contents, so that the same map created
+    # by different users gets the same id, and shares cached tiles
+    image_json = json.dumps(image_graph, sort_keys=True, separators=(",", ":"))
+    map_def = MapDefinition(image_json=image_json, vis_params=vis_params)
+    id = await run_in_threadpool(map_id, map_def)
+    # Always store the map, as it may be cached locally but missing (e.g.
+    # evicted) from Redis, where other workers look it up
+    await set_map(id, map_def)
 
     return {
         "detail": {
-            "id": new_uuid,
-            "tiles_url": f"{request.base_url}tiles/{new_uuid}/{{z}}/{{x}}/{{y}}.png",
+            "id": id,
+            "tiles_url": f"{request.base_url}tiles/{id}/{{z}}/{{x}}/{{y}}.png",
         }
     }
 
 
+def map_id(map_def: MapDefinition) -> str:
+    # Signatures of the source files are part of the id, so that rewriting a
+    # file gives a new map instead of serving stale cached tiles
+    body = map_def.json(sort_keys=True, separators=(",", ":"))
+    signatures = source_signatures(json.loads(map_def.image_json))
+    digest = hashlib.sha1(body.encode())
+    digest.update(json.dumps(signatures, separators=(",", ":")).encode())
+    return digest.hexdigest()
+
+
 @app.post("/info")
 async def info(image_json: dict, request: Request):
-    image = _eval_image(image_json)
+    # Evaluating the graph reads the raster info of its sources (from files
+    # or Redis), so it runs in a worker thread
+    image = await run_in_threadpool(_eval_image, image_json)
+    return {"detail": _image_info(image)}
+
+
+@app.post("/info/batch")
+async def batch_info(image_jsons: list[dict]):
+    # Each item has the status and detail that /info would have returned for
+    # its graph, so that one invalid graph does not fail the whole batch
+    images = await run_in_threadpool(
+        _eval_images, image_jsons, workers=settings.info_workers
+    )
+    return {
+        "detail": [
+            {"status": 400, "detail": str(image)}
+            if isinstance(image, Exception)
+            else {"status": 200, "detail": _image_info(image)}
+            for image in images
+        ]
+    }
+
+
+def _image_info(image: Image) -> dict[str, Any]:
     info = image.info.copy()
     info["crs"] = str(info["crs"])
     info["dtype"] = str(info["dtype"])
-    return {"detail": info}
+    return info
+
+
+@app.post(
+    "/preview",
+    responses={200: {"content": {"image/png": {}}, "description": "Return an image."}},
+)
+async def preview(req: PreviewRequest):
+    image_json = json.dumps(req.image, sort_keys=True, separators=(",", ":"))
+    try:
+        content = await tile_executor.run(
+            render_preview, image_json, req.vis_params, req.max_size
+        )
+    except Overloaded:
+        raise HTTPException(
+            status_code=503,
+            detail="Too many tiles being rendered, try again later",
+            headers={"Retry-After": "1"},
+        )
+    except (RuntimeError, InvalidVisParams) as err:
+        raise HTTPException(status_code=400, detail=str(err))
+    return Response(content, media_type="image/png")
+
+
+@app.post("/statistics")
+async def statistics(req: StatisticsRequest):
+    # Statistics only depend on the graph, its source files and parameters,
+    # so they are cached by a hash of all of them
+    body = json.dumps(req.dict(exclude={"workers"}), sort_keys=True)
+    signatures = await run_in_threadpool(source_signatures, req.image)
+    digest = hashlib.sha1(body.encode())
+    digest.update(json.dumps(signatures, separators=(",", ":")).encode())
+    key = digest.hexdigest()
+    stats = await statistics_cache.aget(key)
+    if stats is None:
+        try:
+            stats = await run_in_threadpool(_statistics, req)
+        except RuntimeError as err:
+            raise HTTPException(status_code=400, detail=str(err))
+        await statistics_cache.aset(key, stats)
+    return {"detail": stats}
+
+
+def _statistics(req: StatisticsRequest) -> dict[str, Any]:
+    image = _eval_image(req.image)
+    with ImageReader(image) as src:
+        stats = src.statistics(
+            scale=req.scale,
+            max_size=req.max_size,
+            bins=req.bins,
+            percentiles=req.percentiles,
+            workers=req.workers,
+        )
+    # Bands without valid pixels have NaN statistics, which are not valid JSON
+    return {
+        name: {
+            k: None if isinstance(v, float) and math.isnan(v) else v
+            for k, v in band_stats.dict().items()
+        }
+        for name, band_stats in stats.items()
+    }
+
+
+@app.post("/sample")
+async def sample(req: SampleRequest):
+    try:
+        values = await run_in_threadpool(_sample, req)
+    except RuntimeError as err:
+        raise HTTPException(status_code=400, detail=str(err))
+    return {"detail": values}
+
+
+def _sample(req: SampleRequest) -> dict[str, list[Optional[Number]]]:
+    image = _eval_image(req.image)
+    coords = np.array(req.coordinates, dtype=np.float64).reshape(-1, 2)
+    with ImageReader(image) as src:
+        values = src.sample(
+            coords[:, 0],
+            coords[:, 1],
+            coord_crs=CRS.from_string(req.crs),
+            scale=req.scale,
+            workers=req.workers,
+        )
+    # Values by band, with null for points outside the image or masked
+    mask = np.ma.getmaskarray(values)
+    return {
+        name: [
+            None if masked else value
+            for value, masked in zip(band_values.tolist(), band_mask.tolist())
+        ]
+        for name, band_values, band_mask in zip(image.band_names, values.data, mask)
+    }
+
+
+@app.post("/zonal-statistics")
+async def zonal_statistics(req: ZonalStatisticsRequest):
+    # Validate the request before starting the response, so that errors are
+    # still reported with a proper status code
+    try:
+        results = await run_in_threadpool(_zonal_statistics, req)
+    except RuntimeError as err:
+        raise HTTPException(status_code=400, detail=str(err))
+    return StreamingResponse(results, media_type="application/x-ndjson")
+
+
+def _zonal_statistics(req: ZonalStatisticsRequest) -> Iterator[str]:
+    image = _eval_image(req.image)
+    results = ImageReader(image).zonal_statistics(
+        req.features,
+        CRS.from_string(req.crs),
+        scale=req.scale,
+        workers=req.workers,
+    )
+    features = req.features["features"]
+    # One JSON object per line, written as soon as the statistics of a
+    # feature are done
+    return (
+        json.dumps({"index": i, "id": features[i].get("id"), "stats": stats}) + "\n"
+        for i, stats in results
+    )
+
+
+@app.post(
+    "/array",
+    responses={
+        200: {
+            "content": {"application/octet-stream": {}},
+            "description": "Return the raw values and mask of an image.",
+        }
+    },
+)
+async def array(req: ArrayRequest):
+    """Evaluate an image over a tile or bounds, and return its raw values.
+
+    The body is the data array (bands, height, width) in C order, followed
+    by the mask (height, width) as uint8. Its dtype, shape, band names,
+    bounds and CRS are sent in X-Array-* headers. With `compress`, the body
+    is gzip-compressed, as Content-Encoding.
+    """
+    try:
+        # Encoding runs in the worker thread too, so that copying and
+        # compressing large arrays does not block the event loop
+        encoded = await run_in_threadpool(_array, req)
+    except RuntimeError as err:
+        raise HTTPException(status_code=400, detail=str(err))
+    if encoded is None:
+        return Response(status_code=204)
+
+    content, headers = encoded
+    return Response(content, media_type="application/octet-stream", headers=headers)
+
+
+def _array(req: ArrayRequest) -> Optional[Tuple[bytes, dict[str, str]]]:
+    image = _eval_image(req.image)
+
+    indexes = None
+    if req.bands:
+        band_names = [b.lower() for b in image.band_names]
+        invalid_names = [b for b in req.bands if b.lower() not in band_names]
+        if invalid_names:
+            raise RuntimeError(f"Invalid band names: {invalid_names}")
+        indexes = [band_names.index(b.lower()) for b in req.bands]
+
+    with ImageReader(image) as src:
+        img = _read_array(src, req, indexes)
+    if img is None:
+        return None
+
+    # Sources name bands by their index in the file, use the image band names
+    # instead
+    names = image.band_names
+    img.band_names = [names[i] for i in indexes] if indexes else list(names)
+    return _encode_array(img, compress=req.compress)
+
+
+def _encode_array(img: ImageData, *, compress: bool) -> Tuple[bytes, dict[str, str]]:
+    data = np.ascontiguousarray(img.data)
+    mask = np.ascontiguousarray(img.mask, dtype=np.uint8)
+    content = b"".join([memoryview(data), memoryview(mask)])
+    headers = {
+        "X-Array-Dtype": data.dtype.str,
+        "X-Array-Shape": ",".join(str(n) for n in data.shape),
+        "X-Array-Band-Names": json.dumps(img.band_names),
+        "X-Array-Bounds": json.dumps(list(img.bounds)),
+        "X-Array-Crs": img.crs.to_string(),
+    }
+    if compress:
+        # Fast compression level, as the payload is compressed per request
+        compressor = zlib.compressobj(1, wbits=16 + zlib.MAX_WBITS)
+        content = compressor.compress(content) + compressor.flush()
+        headers["Content-Encoding"] = "gzip"
+    return content, headers
+
+
+def _read_array(
+    src: ImageReader, req: ArrayRequest, indexes: Optional[list[int]]
+) -> Optional[ImageData]:
+    count = len(indexes) if indexes else src.count
+    if req.tile:
+        z, x, y = req.tile
+        _check_array_size(req.tilesize, req.tilesize, count, src.dtype)
+        try:
+            return copy(src.tile(x, y, z, tilesize=req.tilesize, indexes=indexes))
+        except TileOutsideBounds:
+            return None
+
+    if not req.bounds or not req.width or not req.height:
+        raise RuntimeError(
+            "Either a tile, or bounds with width and height are required"
+        )
+    _check_array_size(req.width, req.height, count, src.dtype)
+    return copy(
+        src.part(
+            req.bounds,
+            height=req.height,
+            width=req.width,
+            dst_crs=CRS.from_string(req.crs) if req.crs else src.crs,
+            bounds_crs=CRS.from_string(req.bounds_crs),
+            indexes=indexes,
+        )
+    )
+
+
+def _check_array_size(
+    width: int, height: int, count: int, dtype: npt.DTypeLike
+) -> None:
+    # Bands of the data, plus a byte per pixel of the mask
+    size = width * height * (count * np.dtype(dtype).itemsize + 1)
+    if size > settings.array_max_bytes:
+        raise RuntimeError(
+            f"Array size is too large ({size} bytes), at most "
+            f"{settings.array_max_bytes} bytes can be read at once"
+        )
 
 
 @app.get(
@@ -132,71 +488,279 @@ async def info(image_json: dict, request: Request):
     },
     description="Read COG and return a tile",
 )
-def tile(id: str, z: int, x: int, y: int):
+async def tile(id: str, z: int, x: int, y: int, request: Request):
     """Handle tile requests."""
-    image_json = get_map(id)
-    if image_json is None:
-        raise HTTPException(status_code=404, detail=f"Map id {id} not found")
+    # Tiles of a map never change, so the ETag only depends on the map id and
+    # tile, and a revalidation can be answered without reading anything.
+    key = f"{id}/{z}/{x}/{y}"
+    etag = f'"{hashlib.sha1(key.encode()).hexdigest()}"'
+    headers = {**TILE_HEADERS, "ETag": etag}
+    if_none_match = request.headers.get("if-none-match")
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+    # A wildcard only matches an existing representation, so the map has to
+    # be resolved first
+    if etag_matches(if_none_match, "*") and await get_map(id) is not None:
+        return Response(status_code=304, headers=headers)
+
+    content = await tile_cache.aget(key)
+    if content is None:
+        map_def = await get_map(id)
+        if map_def is None:
+            raise HTTPException(status_code=404, detail=f"Map id {id} not found")
+
+        try:
+            if settings.tile_metatile_size > 1:
+                content = await render_metatile_cached(id, map_def, z, x, y)
+            else:
+                content = await tile_executor.run(
+                    render_tile, map_def.image_json, map_def.vis_params, z, x, y
+                )
+                await tile_cache.aset(key, content)
+        except Overloaded:
+            raise HTTPException(
+                status_code=503,
+                detail="Too many tiles being rendered, try again later",
+                headers={"Retry-After": "1"},
+            )
+        except InvalidVisParams as err:
+            raise HTTPException(status_code=400, detail=str(err))
+
+    # Empty content means there is no tile to render (e.g. out of bounds)
+    if not content:
+        return Response(status_code=204, headers=headers)
+    return Response(content, media_type="image/png", headers=headers)
+
+
+# Metatiles being rendered, so that concurrent requests for tiles of the same
+# metatile wait for a single render
+_metatile_tasks: dict[str, asyncio.Task] = {}
+
+
+async def render_metatile_cached(
+    id: str, map_def: MapDefinition, z: int, x: int, y: int
+) -> bytes:
+    """Render the metatile containing a tile, and cache all of its tiles."""
+    size = settings.tile_metatile_size
+    metatile_key = f"{id}/{z}/{x // size}/{y // size}"
+
+    async def _render() -> dict[tuple[int, int], bytes]:
+        tiles = await tile_executor.run(
+            render_metatile, map_def.image_json, map_def.vis_params, z, x, y, size
+        )
+        for (tile_x, tile_y), content in tiles.items():
+            await tile_cache.aset(f"{id}/{z}/{tile_x}/{tile_y}", content)
+        return tiles
 
-    vis_params = get_vis_params(id) or VisualizationParams()
+    task = _metatile_tasks.get(metatile_key)
+    if task is None:
+        task = asyncio.ensure_future(_render())
+        _metatile_tasks[metatile_key] = task
+        task.add_done_callback(lambda _: _metatile_tasks.pop(metatile_key, None))
 
-    image = eval_image(image_json)
+    # Shield the shared render, so that a client disconnecting does not
+    # cancel it for every other request waiting on it
+    tiles = await asyncio.shield(task)
+    return tiles[x, y]
 
-    # Workaround: Do not render tiles of a lower zoom level than the minimum
-    # zoom level of Image, to avoid performance issue with WarpedVRT.
-    # See issue https://github.com/cogeotiff/rio-tiler/issues/348
-    if image.min_zoom and z < image.min_zoom:
-        return Response(status_code=204, headers=TILE_HEADERS)
 
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+    return etag in tags
+
+
+@app.post("/export")
+async def export(req: ExportRequest):
     try:
-        with ImageReader(image) as src:
-            img = src.tile(x, y, z)
+        # Run in a worker thread, so that exporting does not block the event
+        # loop (and every other request) until it finishes
+        path = await run_in_threadpool(_export, req)
+    except RuntimeError as err:
+        raise HTTPException(status_code=400, detail=str(err))
 
-            # Select bands
-            if vis_params.bands:
-                indexes = [img.band_names.index(b) for b in vis_params.bands]
-                img.data = img.data[indexes]
-            else:
-                indexes = list(range(len(img.band_names)))
+    return {"result": "ok", "path": path}
+
+
+@app.post("/jobs/export")
+async def submit_export(req: ExportRequest):
+    job = job_manager.submit("export", lambda job: _export(req, progress=job.progress))
+    return {"detail": job.info()}
 
-            # Rescale using min and max
-            if vis_params.min is not None and vis_params.max is not None:
-                in_range = expand_scale_range(
-                    (vis_params.min, vis_params.max), len(indexes)
-                )
-                out_range = expand_scale_range((0, 255), len(indexes))
-                img.rescale(in_range=in_range, out_range=out_range)
 
-            if vis_params.opacity < 1.0:
-                img.mask *= round((1 - vis_params.opacity) * 255)
+@app.post("/jobs/seed")
+async def submit_seed(req: SeedRequest):
+    map_def = await get_map(req.map_id)
+    if map_def is None:
+        raise HTTPException(status_code=404, detail=f"Map id {req.map_id} not found")
+    try:
+        # Reject invalid or too large requests before submitting a job
+        image = await run_in_threadpool(eval_image, map_def.image_json)
+        await run_in_threadpool(_seed_bounds, req, image)
+    except RuntimeError as err:
+        raise HTTPException(status_code=400, detail=str(err))
+    job = job_manager.submit(
+        "seed", lambda job: _seed(req, map_def, progress=job.progress)
+    )
+    return {"detail": job.info()}
 
-    except TileOutsideBounds:
-        return Response(status_code=204, headers=TILE_HEADERS)
 
-    profile = img_profiles.get("png") or {}
-    content = img.render(img_format="PNG", **profile)
-    return Response(content, media_type="image/png", headers=TILE_HEADERS)
+@app.get("/jobs/{id}")
+async def get_job(id: str):
+    job = job_manager.get(id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job id {id} not found")
+    return {"detail": job.info()}
 
 
-@app.post("/export")
-async def export(req: ExportRequest):
+@app.delete("/jobs/{id}")
+async def cancel_job(id: str):
+    job = job_manager.get(id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job id {id} not found")
+    job.cancel()
+    return {"detail": job.info()}
+
+
+def _export(
+    req: ExportRequest, progress: Optional[Callable[[int, int], None]] = None
+) -> str:
     image = _eval_image(req.image)
 
     in_crs = req.in_crs and CRS.from_string(req.in_crs)
     crs = CRS.from_string(req.crs)
 
+    return image.export(
+        path=req.path,
+        bounds=req.bounds,
+        scale=req.scale,
+        in_crs=in_crs,
+        crs=crs,
+        precision=req.precision,
+        workers=req.workers,
+        executor=req.executor,
+        progress=progress,
+    )
+
+
+def _seed(
+    req: SeedRequest,
+    map_def: MapDefinition,
+    progress: Optional[Callable[[int, int], None]] = None,
+) -> dict[str, int]:
+    """Render all tiles of a map within bounds and zoom range into the cache."""
+    image = eval_image(map_def.image_json)
+    bounds, total = _seed_bounds(req, image)
+    tiles: Iterator[Tile] = WEB_MERCATOR_TMS.tiles(
+        *bounds, zooms=range(req.min_zoom, req.max_zoom + 1)
+    )
+
+    done = existing = rendered = 0
+    if progress:
+        progress(done, total)
+
+    def report(count: int = 1) -> None:
+        nonlocal done
+        done += count
+        if progress:
+            progress(done, total)
+
+    # Tiles are listed lazily, and only a few of them are rendered at once, so
+    # that seeding large areas does not hold every tile in memory
+    pool = ThreadPoolExecutor(req.workers)
+    in_flight: dict[Future[bytes], str] = {}
+
+    def collect(futures: Iterable[Future[bytes]]) -> None:
+        nonlocal rendered
+        for future in futures:
+            tile_cache.set(in_flight.pop(future), future.result())
+            rendered += 1
+            report()
+
     try:
-        image.export(
-            path=req.path, bounds=req.bounds, scale=req.scale, in_crs=in_crs, crs=crs
-        )
-    except RuntimeError as err:
-        return Response({"detail": str(err)}, status_code=400)
+        with ImageReader(image) as src:
+            for t in tiles:
+                if image.bounds and not src.tile_exists(t.x, t.y, t.z):
+                    report()
+                    continue
+                existing += 1
+                key = f"{req.map_id}/{t.z}/{t.x}/{t.y}"
+                if tile_cache.get(key) is not None:
+                    report()
+                    continue
+                if len(in_flight) >= 2 * req.workers:
+                    finished, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                    collect(finished)
+                future = pool.submit(
+                    render_tile, map_def.image_json, map_def.vis_params, t.z, t.x, t.y
+                )
+                in_flight[future] = key
+        collect(as_completed(list(in_flight)))
+    finally:
+        pool.shutdown(wait=True, cancel_futures=True)
+
+    return {"tiles": existing, "rendered": rendered}
 
-    return {"result": "ok"}
+
+def _seed_bounds(req: SeedRequest, image: Image) -> Tuple[BBox, int]:
+    """Return the bounds to seed and the number of tiles within them.
+
+    Raises RuntimeError if the request is invalid or covers too many tiles.
+    """
+    if req.min_zoom > req.max_zoom:
+        raise RuntimeError("min_zoom must not be greater than max_zoom")
+
+    bounds = req.bounds
+    if not bounds and image.bounds:
+        bounds = transform_bounds(image.crs, WGS84_CRS, *image.bounds)
+    if not bounds:
+        raise RuntimeError("Image is boundless, you must specify bounds when seeding")
+
+    total = _count_tiles(bounds, range(req.min_zoom, req.max_zoom + 1))
+    if total > settings.seed_max_tiles:
+        raise RuntimeError(
+            f"Too many tiles to seed ({total}), "
+            f"at most {settings.seed_max_tiles} are allowed"
+        )
+    return bounds, total
+
+
+def _count_tiles(bounds: BBox, zooms: range) -> int:
+    # Same tile ranges as TileMatrixSet.tiles, without listing the tiles
+    tms_bbox = WEB_MERCATOR_TMS.bbox
+    west, south, east, north = bounds
+    if west > east:
+        bboxes = [
+            (tms_bbox.left, south, east, north),
+            (west, south, tms_bbox.right, north),
+        ]
+    else:
+        bboxes = [(west, south, east, north)]
+
+    total = 0
+    for w, s, e, n in bboxes:
+        w, s = max(tms_bbox.left, w), max(tms_bbox.bottom, s)
+        e, n = min(tms_bbox.right, e), min(tms_bbox.top, n)
+        for z in zooms:
+            nw_tile = WEB_MERCATOR_TMS.tile(w + LL_EPSILON, n - LL_EPSILON, z)
+            se_tile = WEB_MERCATOR_TMS.tile(e - LL_EPSILON, s + LL_EPSILON, z)
+            total += (abs(se_tile.x - nw_tile.x) + 1) * (abs(se_tile.y - nw_tile.y) + 1)
+    return total
 
 
 @app.get("/cache-info")
 async def cache_info():
     return {
         "image_eval": eval_image.cache_info()._asdict(),
+        "dataset_pool": dataset_pool.info(),
+        "raster_info": raster_info_cache.info(),
+        "maps": map_cache.info(),
+        "statistics": statistics_cache.info(),
+        "tiles": tile_cache.info(),
     }
+
+
+@app.get("/metrics")
+async def metrics():
+    return {"tile_executor": tile_executor.info()}
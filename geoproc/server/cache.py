@@ -0,0 +1,163 @@
+from __future__ import annotations
+
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Generic, Hashable, Optional, TypeVar
+
+from redis import Redis, RedisError
+from redis.asyncio import Redis as AsyncRedis
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class LRUCache(Generic[T]):
+    """Thread-safe in-process LRU cache bounded by number of entries.
+
+    If `maxbytes` is set, the cache is also bounded by the total size of its
+    values, as measured by `sizeof`.
+    """
+
+    def __init__(
+        self,
+        maxsize: int,
+        *,
+        maxbytes: Optional[int] = None,
+        sizeof: Callable[[T], int] = len,
+    ):
+        self.maxsize = maxsize
+        self.maxbytes = maxbytes
+        self.sizeof = sizeof
+        self._lock = threading.Lock()
+        self._data: OrderedDict[Hashable, T] = OrderedDict()
+        self._currbytes = 0
+        self._hits = 0
+        self._misses = 0
+
+    def get(self, key: Hashable) -> Optional[T]:
+        with self._lock:
+            try:
+                value = self._data[key]
+            except KeyError:
+                self._misses += 1
+                return None
+            self._data.move_to_end(key)
+            self._hits += 1
+            return value
+
+    def set(self, key: Hashable, value: T) -> None:
+        with self._lock:
+            if self.maxbytes is not None:
+                if key in self._data:
+                    self._currbytes -= self.sizeof(self._data[key])
+                self._currbytes += self.sizeof(value)
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize or (
+                self.maxbytes is not None and self._currbytes > self.maxbytes
+            ):
+                _, evicted = self._data.popitem(last=False)
+                if self.maxbytes is not None:
+                    self._currbytes -= self.sizeof(evicted)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self._currbytes = 0
+
+    def info(self) -> dict[str, Any]:
+        with self._lock:
+            return {
+                "hits": self._hits,
+                "misses": self._misses,
+                "maxsize": self.maxsize,
+                "currsize": len(self._data),
+                "maxbytes": self.maxbytes,
+                "currbytes": self._currbytes if self.maxbytes is not None else None,
+            }
+
+
+class TieredCache(Generic[T]):
+    """In-process LRU cache in front of an optional, shared Redis store.
+
+    Redis is only used when `redis` is set. Connection errors are treated as
+    cache misses, so the cache keeps working (in-process only) when Redis is
+    unavailable. `aget` and `aset` do the same from async code, through the
+    `async_redis` client.
+    """
+
+    def __init__(
+        self,
+        prefix: str,
+        *,
+        maxsize: int,
+        dumps: Callable[[T], bytes],
+        loads: Callable[[bytes], T],
+        ttl: Optional[int] = None,
+        redis: Optional[Redis] = None,
+        maxbytes: Optional[int] = None,
+        sizeof: Callable[[T], int] = len,
+        async_redis: Optional[AsyncRedis] = None,
+    ):
+        self.prefix = prefix
+        self.dumps = dumps
+        self.loads = loads
+        self.ttl = ttl
+        self.redis = redis
+        self.async_redis = async_redis
+        self.local: LRUCache[T] = LRUCache(maxsize, maxbytes=maxbytes, sizeof=sizeof)
+
+    def get(self, key: str) -> Optional[T]:
+        value = self.local.get(key)
+        if value is not None or self.redis is None:
+            return value
+        try:
+            body = self.redis.get(f"{self.prefix}:{key}")
+        except RedisError as err:
+            logger.warning("Failed to read %s:%s from Redis: %s", self.prefix, key, err)
+            return None
+        if body is None:
+            return None
+        value = self.loads(body)
+        self.local.set(key, value)
+        return value
+
+    def set(self, key: str, value: T) -> None:
+        self.local.set(key, value)
+        if self.redis is None:
+            return
+        try:
+            self.redis.set(f"{self.prefix}:{key}", self.dumps(value), ex=self.ttl)
+        except RedisError as err:
+            logger.warning("Failed to write %s:%s to Redis: %s", self.prefix, key, err)
+
+    async def aget(self, key: str) -> Optional[T]:
+        value = self.local.get(key)
+        if value is not None or self.async_redis is None:
+            return value
+        try:
+            body = await self.async_redis.get(f"{self.prefix}:{key}")
+        except RedisError as err:
+            logger.warning("Failed to read %s:%s from Redis: %s", self.prefix, key, err)
+            return None
+        if body is None:
+            return None
+        value = self.loads(body)
+        self.local.set(key, value)
+        return value
+
+    async def aset(self, key: str, value: T) -> None:
+        self.local.set(key, value)
+        if self.async_redis is None:
+            return
+        try:
+            await self.async_redis.set(
+                f"{self.prefix}:{key}", self.dumps(value), ex=self.ttl
+            )
+        except RedisError as err:
+            logger.warning("Failed to write %s:%s to Redis: %s", self.prefix, key, err)
+
+    def info(self) -> dict[str, Any]:
+        return self.local.info()
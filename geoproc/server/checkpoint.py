@@ -0,0 +1,60 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import os
+from typing import Any
+
+logger = logging.getLogger(__name__)
+
+
+class ExportCheckpoint:
+    """Sidecar file recording which parts of an export were already written.
+
+    The checkpoint is stored next to the output as "<path>.checkpoint", along
+    with a key identifying the export (image graph, signatures of its source
+    files and output profile), so that an export is only resumed when
+    re-submitted with the same graph, bounds, scale and CRS, and unchanged
+    sources.
+    """
+
+    def __init__(self, path: str, key: str):
+        self.path = f"{path}.checkpoint"
+        self.key = key
+
+    def load(self) -> set[int]:
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return set()
+        except (OSError, ValueError) as err:
+            logger.warning("Failed to read checkpoint %s: %s", self.path, err)
+            return set()
+        if data.get("key") != self.key:
+            return set()
+        return set(data.get("done", []))
+
+    def save(self, done: set[int]) -> None:
+        # Write to a temporary file first, so that a crash while saving does
+        # not leave a truncated checkpoint behind
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"key": self.key, "done": sorted(done)}, f)
+        os.replace(tmp_path, self.path)
+
+    def remove(self) -> None:
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+
+def export_key(graph: Any, profile: dict[str, Any], signatures: dict[str, str]) -> str:
+    data = json.dumps(
+        {"graph": graph, "profile": profile, "signatures": signatures},
+        sort_keys=True,
+        default=str,
+    )
+    return hashlib.sha1(data.encode()).hexdigest()
@@ -0,0 +1,97 @@
+from __future__ import annotations
+
+import asyncio
+import multiprocessing
+import threading
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Optional, Tuple, TypeVar
+
+T = TypeVar("T")
+
+
+class Overloaded(Exception):
+    pass
+
+
+class BoundedExecutor:
+    """Thread or process pool for CPU-bound work awaited by async handlers.
+
+    At most `workers` tasks run at once, and up to `queue_size` more wait for
+    a worker. Further tasks are rejected with `Overloaded` right away, instead
+    of piling up behind a saturated pool. The pool is created on first use.
+    """
+
+    def __init__(self, workers: int, queue_size: int, executor: str = "thread"):
+        if executor not in ("thread", "process"):
+            raise RuntimeError(f"Invalid executor: {executor}")
+        self.workers = workers
+        self.queue_size = queue_size
+        self.executor = executor
+        self._lock = threading.Lock()
+        self._pool: Optional[Executor] = None
+        self._pending = 0
+        self._completed = 0
+        self._rejected = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+
+    async def run(self, fn: Callable[..., T], *args: Any) -> T:
+        with self._lock:
+            if self._pending >= self.workers + self.queue_size:
+                self._rejected += 1
+                raise Overloaded(f"{self._pending} tasks pending")
+            self._pending += 1
+        try:
+            submitted_at = time.time()
+            future = self._get_pool().submit(_timed, fn, *args)
+            started_at, result = await asyncio.wrap_future(future)
+        finally:
+            with self._lock:
+                self._pending -= 1
+
+        wait = max(started_at - submitted_at, 0.0)
+        with self._lock:
+            self._completed += 1
+            self._wait_total += wait
+            self._wait_max = max(self._wait_max, wait)
+        return result
+
+    def shutdown(self) -> None:
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=True, cancel_futures=True)
+
+    def info(self) -> dict[str, Any]:
+        with self._lock:
+            return {
+                "executor": self.executor,
+                "workers": self.workers,
+                "queue_size": self.queue_size,
+                "pending": self._pending,
+                "completed": self._completed,
+                "rejected": self._rejected,
+                "queue_wait_avg": self._wait_total / self._completed
+                if self._completed
+                else None,
+                "queue_wait_max": self._wait_max,
+            }
+
+    def _get_pool(self) -> Executor:
+        with self._lock:
+            if self._pool is None:
+                if self.executor == "process":
+                    self._pool = ProcessPoolExecutor(
+                        self.workers, mp_context=multiprocessing.get_context("spawn")
+                    )
+                else:
+                    self._pool = ThreadPoolExecutor(self.workers)
+            return self._pool
+
+
+def _timed(fn: Callable[..., T], *args: Any) -> Tuple[float, T]:
+    # Wall-clock time, as it is compared against the submit time of another
+    # process when running in a process pool
+    started_at = time.time()
+    return started_at, fn(*args)
@@ -1,21 +1,56 @@
 from __future__ import annotations
 
+import json
+import math
+import multiprocessing
 import os
 import warnings
+from collections import deque
+from concurrent.futures import (
+    Executor,
+    Future,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+    as_completed,
+    wait,
+)
+from contextvars import ContextVar
 from copy import copy
-from typing import Any, Callable, Iterable, Optional, Tuple, Union
+from itertools import islice
+from typing import (
+    Any,
+    Callable,
+    Hashable,
+    Iterable,
+    Iterator,
+    Optional,
+    Sequence,
+    Tuple,
+    Union,
+)
+from xml.etree import ElementTree
 
 import attr
+import numexpr
 import numpy as np
 import numpy.typing as npt
 import rasterio
+import rasterio.features
 import rasterio.transform
 import rasterio.windows
 from morecantile.commons import Tile
 from morecantile.models import TileMatrixSet
 from rasterio.coords import BoundingBox
+from rasterio.dtypes import dtype_rev, typename_fwd
+from rasterio.features import geometry_mask
+from rasterio.io import DatasetReader
 from rasterio.rio.overview import get_maximum_overview_level
-from rasterio.warp import calculate_default_transform, transform_bounds
+from rasterio.warp import (
+    calculate_default_transform,
+    transform,
+    transform_bounds,
+    transform_geom,
+)
 from rasterio.windows import Window
 from rio_cogeo.profiles import cog_profiles
 from rio_tiler import reader
@@ -27,9 +62,35 @@ from rio_tiler.types import BBox
 from tqdm import tqdm
 
 from geoproc.image import BaseImage
+from geoproc.server.cache import TieredCache
+from geoproc.server.checkpoint import ExportCheckpoint, export_key
+from geoproc.server.pool import dataset_pool, file_signature
+from geoproc.server.settings import settings
+from geoproc.server.stats import BandAccumulator
 from geoproc.server.types import PartCallable
 
 WINDOW_SIZE = 2**12
+RASTER_INFO_VERSION = 2
+
+# Binary operators that are fused into a single numexpr expression
+EXPRESSION_OPERATORS = {
+    "__add__": "+",
+    "__sub__": "-",
+    "__mul__": "*",
+    "__truediv__": "/",
+    "__lt__": "<",
+    "__le__": "<=",
+    "__eq__": "==",
+    "__ne__": "!=",
+    "__gt__": ">",
+    "__ge__": ">=",
+}
+
+COMPARISON_OPERATORS = {"__lt__", "__le__", "__eq__", "__ne__", "__gt__", "__ge__"}
+
+_part_memo: ContextVar[Optional[dict[Hashable, ImageData]]] = ContextVar(
+    "_part_memo", default=None
+)
 
 
 class Image(BaseImage):
@@ -41,17 +102,69 @@ class Image(BaseImage):
         bounds: Optional[BBox] = None,
         crs: CRS = WGS84_CRS,
         band_names: list[str],
+        band_descriptions: Optional[list[Optional[str]]] = None,
         min_zoom: Optional[int] = None,
         max_zoom: Optional[int] = None,
+        op: Optional[Tuple[str, Tuple[Image, ...]]] = None,
+        value: Optional[Union[float, int]] = None,
+        transform: Optional[rasterio.Affine] = None,
     ):
-        self.part = part
+        self._part = part
+        self.op = op
+        self.value = value
+        # Call graph this image was evaluated from, if any (see `eval_image`)
+        self.graph: Optional[dict[str, Any]] = None
         self.dtype = dtype
         self._band_names = band_names
+        self._band_descriptions = band_descriptions
         self._bounds = bounds
         self._map_bounds = bounds and transform_bounds(crs, WGS84_CRS, *bounds)
         self._crs = crs
         self._min_zoom = min_zoom
         self._max_zoom = max_zoom
+        # Pixel grid of the sources in `crs`, if they all share the same one
+        self.transform = transform
+
+    def part(
+        self,
+        bounds: BBox,
+        dst_crs: CRS,
+        height: int,
+        width: int,
+        indexes: Optional[Sequence[int]] = None,
+    ) -> ImageData:
+        # `indexes` are 0-based positions in `band_names`. When given, only
+        # those bands are read and evaluated, and returned in that order.
+        if indexes is not None:
+            indexes = tuple(indexes)
+            if indexes == tuple(range(self.count)):
+                indexes = None
+
+        # Results are memoized for the duration of the outermost part() call,
+        # so nodes shared by several branches of the graph are only read and
+        # evaluated once. Node functions must not mutate the ImageData they
+        # get from their inputs.
+        memo = _part_memo.get()
+        if memo is None:
+            token = _part_memo.set({})
+            try:
+                return self.part(bounds, dst_crs, height, width, indexes)
+            finally:
+                _part_memo.reset(token)
+
+        key = (id(self), tuple(bounds), dst_crs, height, width)
+        img_data = memo.get((*key, indexes))
+        if img_data is None and indexes is not None:
+            # Slice from all bands if they were already evaluated
+            full_img_data = memo.get((*key, None))
+            if full_img_data is not None:
+                img_data = copy(full_img_data)
+                img_data.data = full_img_data.data[list(indexes)]
+                img_data.band_names = [full_img_data.band_names[i] for i in indexes]
+        if img_data is None:
+            img_data = self._part(bounds, dst_crs, height, width, indexes)
+        memo[(*key, indexes)] = img_data
+        return img_data
 
     @property
     def crs(self) -> CRS:
@@ -69,6 +182,10 @@ class Image(BaseImage):
     def band_names(self) -> list[str]:
         return self._band_names
 
+    @property
+    def band_descriptions(self) -> Optional[list[Optional[str]]]:
+        return self._band_descriptions
+
     @property
     def min_zoom(self) -> Optional[int]:
         return self._min_zoom
@@ -84,6 +201,7 @@ class Image(BaseImage):
             "bounds": self._bounds,
             "map_bounds": self._map_bounds,
             "band_names": self._band_names,
+            "band_descriptions": self._band_descriptions,
             "dtype": self.dtype,
             "min_zoom": self._min_zoom,
             "max_zoom": self._max_zoom,
@@ -91,63 +209,92 @@ class Image(BaseImage):
 
     @classmethod
     def load(cls, path: str) -> Image:
-        bounds, crs, dtype, count = _read_raster_info(path)
-        band_names = [f"B{idx}" for idx in range(1, count + 1)]
-        min_zoom, max_zoom = _get_min_max_zoom(path)
+        raster_info = get_raster_info(path)
+        band_names = [f"B{idx}" for idx in range(1, raster_info.count + 1)]
 
         def _load_part(
-            bounds: BBox, dst_crs: CRS, height: int, width: int
+            bounds: BBox,
+            dst_crs: CRS,
+            height: int,
+            width: int,
+            indexes: Optional[Sequence[int]],
         ) -> ImageData:
-            with rasterio.open(path) as src:
+            # Read from the coarsest overview that is still at least as fine
+            # as the requested resolution, if the raster has overviews
+            options: dict[str, Any] = {}
+            level = _overview_level(raster_info, bounds, dst_crs, height, width)
+            if level is not None:
+                options["overview_level"] = level
+            with dataset_pool.open(path, **options) as src:
                 return reader.part(
                     src,
                     bounds=bounds,
                     height=height,
                     width=width,
                     dst_crs=dst_crs,
+                    indexes=indexes and [idx + 1 for idx in indexes],
                 )
 
         return cls(
             _load_part,
-            dtype=dtype,
-            bounds=bounds,
-            crs=crs,
+            dtype=raster_info.dtype,
+            bounds=raster_info.bounds,
+            crs=raster_info.crs,
             band_names=band_names,
-            min_zoom=min_zoom,
-            max_zoom=max_zoom,
+            band_descriptions=raster_info.band_descriptions,
+            min_zoom=raster_info.min_zoom,
+            max_zoom=raster_info.max_zoom,
+            transform=rasterio.transform.from_origin(
+                raster_info.bounds[0], raster_info.bounds[3], *raster_info.res
+            ),
         )
 
     @classmethod
     def constant(cls, value: Union[float, int]) -> Image:
-        dtype = np.min_scalar_type(value)
+        return cls._scalar(value, _scalar_dtype(value))
+
+    @classmethod
+    def _scalar(cls, value: Union[float, int], dtype: npt.DTypeLike) -> Image:
         band_names = ["CONSTANT"]
 
+        # Constants are never materialized: their data and (all valid) mask
+        # are single pixels, that broadcast against any other image.
         def _constant_part(
-            bounds: BBox, dst_crs: CRS, height: int, width: int
+            bounds: BBox,
+            dst_crs: CRS,
+            height: int,
+            width: int,
+            indexes: Optional[Sequence[int]],
         ) -> ImageData:
-            ones = np.ones((1, height, width), dtype=dtype)
-            data = ones * value
-            mask = ones * 255
             return ImageData(
-                data=data,
-                mask=mask,
+                data=np.full((1, 1, 1), value, dtype=dtype),
+                mask=np.full((1, 1), 255, dtype=np.uint8),
                 bounds=BoundingBox(*bounds),
                 crs=dst_crs,
                 band_names=band_names,
             )
 
-        return cls(_constant_part, dtype=dtype, band_names=band_names)
+        return cls(_constant_part, dtype=dtype, band_names=band_names, value=value)
 
     def select(self, band_names: list[str]) -> Image:
         invalid_names = [b for b in band_names if b not in self.band_names]
         if invalid_names:
             raise RuntimeError(f"Invalid band names: {invalid_names}")
-        indexes = [int(b[1:]) - 1 for b in band_names]
-
-        def _part(*args):
-            img = self.part(*args)
-            img.data = img.data[indexes]
-            return img
+        band_indexes = [self.band_names.index(b) for b in band_names]
+
+        def _part(
+            bounds: BBox,
+            dst_crs: CRS,
+            height: int,
+            width: int,
+            indexes: Optional[Sequence[int]],
+        ) -> ImageData:
+            # Push the selection down, so that only selected bands are read
+            if indexes is not None:
+                return self.part(
+                    bounds, dst_crs, height, width, [band_indexes[i] for i in indexes]
+                )
+            return self.part(bounds, dst_crs, height, width, band_indexes)
 
         return Image(
             _part,
@@ -155,8 +302,26 @@ class Image(BaseImage):
             crs=self.crs,
             dtype=self.dtype,
             band_names=band_names,
+            band_descriptions=self.band_descriptions
+            and [self.band_descriptions[i] for i in band_indexes],
+            min_zoom=self.min_zoom,
+            max_zoom=self.max_zoom,
+            transform=self.transform,
+        )
+
+    def astype(self, dtype: str) -> Image:
+        if self.value is not None:
+            return Image._scalar(np.asarray(self.value).astype(dtype).item(), dtype)
+        return Image(
+            _expression_part("astype", (self,), np.dtype(dtype)),
+            bounds=self.bounds,
+            crs=self.crs,
+            dtype=np.dtype(dtype),
+            band_names=self.band_names,
             min_zoom=self.min_zoom,
             max_zoom=self.max_zoom,
+            op=("astype", (self,)),
+            transform=self.transform,
         )
 
     def export(
@@ -167,7 +332,32 @@ class Image(BaseImage):
         scale: float = 1000,
         in_crs: CRS = WGS84_CRS,
         crs: CRS = WGS84_CRS,
-    ):
+        precision: Optional[str] = None,
+        workers: int = 1,
+        executor: str = "thread",
+        progress: Optional[Callable[[int, int], None]] = None,
+        retile: bool = True,
+    ) -> str:
+        # Override the precision of floating point images, e.g. to export
+        # float32 images even if some inputs require float64.
+        if precision and np.issubdtype(self.dtype, np.floating):
+            image = self.astype(precision)
+            image.graph = self.graph and {
+                "name": "astype",
+                "args": [self.graph, precision],
+            }
+            return image.export(
+                path,
+                bounds=bounds,
+                scale=scale,
+                in_crs=in_crs,
+                crs=crs,
+                workers=workers,
+                executor=executor,
+                progress=progress,
+                retile=retile,
+            )
+
         if not bounds:
             in_crs = self.crs
             bounds = self.bounds
@@ -206,7 +396,6 @@ class Image(BaseImage):
             *out_bounds, width=width, height=height
         )
 
-        # TODO: If it's too large, retile into multiple COG files
         with ImageReader(self) as src:
             profile = cog_profiles["deflate"].copy()
             profile.update(
@@ -218,42 +407,110 @@ class Image(BaseImage):
                 transform=out_transform,
             )
 
-            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
-            with rasterio.open(path, "w", **profile) as dst:
-                window_bounds = list(
-                    src.window_and_bounds(
-                        bounds=bounds,
-                        bounds_crs=in_crs,
-                        crs=crs,
-                        scale=scale,
-                    )
+            # Exports of images built by `eval_image` keep a checkpoint of the
+            # windows (or tiles) already written, so that re-submitting a
+            # failed export continues where it stopped (unless a source file
+            # was rewritten in between).
+            checkpoint = self.graph and ExportCheckpoint(
+                path,
+                export_key(self.graph, profile, source_signatures(self.graph)),
+            )
+
+            # If it's too large, retile into multiple COG files (unless a
+            # single file is required)
+            tile_size = settings.export_tile_size
+            if retile and (width > tile_size or height > tile_size):
+                return export_tiles(
+                    self,
+                    path,
+                    profile,
+                    tile_size=tile_size,
+                    workers=workers,
+                    executor=executor,
+                    progress=progress,
+                    checkpoint=checkpoint,
                 )
 
-                for win, win_bounds in tqdm(window_bounds, ascii=True, desc=path):
-                    image_data = src.part(
-                        win_bounds,
-                        win.height,
-                        win.width,
-                        bounds_crs=crs,
-                        dst_crs=crs,
-                    )
+            window_bounds = list(
+                src.window_and_bounds(
+                    bounds=bounds,
+                    bounds_crs=in_crs,
+                    crs=crs,
+                    scale=scale,
+                    window_size=WINDOW_SIZE,
+                )
+            )
+
+            done = checkpoint.load() if checkpoint and os.path.exists(path) else set()
+            if not done:
+                os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+                with rasterio.open(path, "w", **profile):
+                    pass
+            pending = [
+                (i, win_bounds)
+                for i, win_bounds in enumerate(window_bounds)
+                if i not in done
+            ]
+
+            total = len(window_bounds)
+            if progress:
+                progress(len(done), total)
+
+            dst = rasterio.open(path, "r+")
+            try:
+                windows_data = read_windows(
+                    self,
+                    [win_bounds for _, win_bounds in pending],
+                    crs,
+                    workers=workers,
+                    executor=executor,
+                )
+                for (i, _), (win, image_data) in zip(
+                    pending,
+                    tqdm(
+                        windows_data,
+                        total=len(pending),
+                        initial=len(done),
+                        ascii=True,
+                        desc=path,
+                    ),
+                ):
                     dst.write(image_data.data, window=win)
                     dst.write_mask(image_data.mask, window=win)
+                    done.add(i)
+                    if (
+                        checkpoint
+                        and len(done) % settings.export_checkpoint_interval == 0
+                    ):
+                        # Windows are only on disk once the dataset is closed
+                        dst.close()
+                        checkpoint.save(done)
+                        dst = rasterio.open(path, "r+")
+                    if progress:
+                        progress(len(done), total)
+            finally:
+                dst.close()
+                if checkpoint:
+                    checkpoint.save(done)
+
+            if checkpoint:
+                checkpoint.remove()
+
+        return path
 
     def __abs__(self) -> Image:
-        def _part(*args):
-            img = self.part(*args)
-            img.data = np.abs(img.data)
-            return img
-
+        if self.value is not None:
+            return Image.constant(abs(self.value))
         return Image(
-            lambda *args: _part(*args),
+            _expression_part("__abs__", (self,), self.dtype),
             bounds=self.bounds,
             crs=self.crs,
             dtype=self.dtype,
             band_names=self.band_names,
             min_zoom=self.min_zoom,
             max_zoom=self.max_zoom,
+            op=("__abs__", (self,)),
+            transform=self.transform,
         )
 
     def __add__(self, other: Union[Image, int, float]) -> Image:
@@ -291,27 +548,45 @@ class Image(BaseImage):
 
     def _operator(self, method_name, other: Union[Image, int, float]) -> Image:
         other_img = other if isinstance(other, Image) else Image.constant(other)
-
-        def _part(other: Image, *args) -> ImageData:
-            img_data = self.part(*args)
-            other_img_data = other.part(*args)
-            new_img_data = copy(img_data)
-            new_img_data.data = getattr(img_data.data, method_name)(other_img_data.data)
-            new_img_data.mask = np.maximum(img_data.mask, other_img_data.mask)
-            return new_img_data
+        operands = (self, other_img)
+        dtype = _result_dtype(method_name, self.dtype, other_img.dtype)
+
+        # Fold operations between constants. Like Python scalars, they are
+        # computed in full precision and the result type is inferred again.
+        if self.value is not None and other_img.value is not None:
+            value = getattr(np.asarray(self.value), method_name)(
+                np.asarray(other_img.value)
+            ).item()
+            if method_name in COMPARISON_OPERATORS:
+                return Image._scalar(int(value), dtype)
+            return Image.constant(value)
+
+        # Single-band operands are broadcast over the other operand's bands
+        band_names = self.band_names
+        if self.count == 1 and other_img.count > 1:
+            band_names = other_img.band_names
 
         new_bounds, new_crs = bounds_union(
             self.bounds, other_img.bounds, self.crs, other_img.crs
         )
 
+        if method_name in EXPRESSION_OPERATORS:
+            part = _expression_part(method_name, operands, dtype)
+            op: Optional[Tuple[str, Tuple[Image, ...]]] = (method_name, operands)
+        else:
+            part = _operator_part(method_name, operands, dtype)
+            op = None
+
         return Image(
-            lambda *args: _part(other_img, *args),
+            part,
             bounds=new_bounds,
             crs=new_crs,
-            dtype=np.float64,
-            band_names=self.band_names,
+            dtype=dtype,
+            band_names=band_names,
             min_zoom=self.min_zoom,
             max_zoom=self.max_zoom,
+            op=op,
+            transform=_common_transform(self, other_img, new_bounds),
         )
 
 
@@ -333,15 +608,14 @@ class ImageReader(BaseReader):
         self.dtype = self.input.dtype
         self.count = self.input.count
 
-    def window_and_bounds(
-        self,
-        *,
-        bounds: BBox,
-        bounds_crs: CRS,
-        crs: CRS,
-        scale: float,
-        window_size: int = WINDOW_SIZE,
-    ) -> Iterable[Tuple[Window, BBox]]:
+    def grid(
+        self, *, bounds: BBox, bounds_crs: CRS, crs: CRS, scale: float
+    ) -> Tuple[int, int, rasterio.Affine]:
+        """Get the size and transform of the pixel grid over bounds, in `crs`.
+
+        `scale` is the pixel size in meters. If `crs` is not projected, the
+        size of the grid is computed in Web Mercator (epsg:3857).
+        """
         proj_crs = crs if crs.is_projected else CRS.from_epsg(3857)
         proj_bounds = transform_bounds(bounds_crs, proj_crs, *bounds, densify_pts=21)
         proj_transform = rasterio.transform.from_origin(
@@ -360,6 +634,20 @@ class ImageReader(BaseReader):
         out_transform = rasterio.transform.from_bounds(
             *out_bounds, width=width, height=height
         )
+        return width, height, out_transform
+
+    def window_and_bounds(
+        self,
+        *,
+        bounds: BBox,
+        bounds_crs: CRS,
+        crs: CRS,
+        scale: float,
+        window_size: int = WINDOW_SIZE,
+    ) -> Iterable[Tuple[Window, BBox]]:
+        width, height, out_transform = self.grid(
+            bounds=bounds, bounds_crs=bounds_crs, crs=crs, scale=scale
+        )
 
         h = w = window_size
         for i in range(0, height, h):
@@ -375,11 +663,58 @@ class ImageReader(BaseReader):
     def info(self) -> Info:
         ...
 
-    def statistics(self) -> dict[str, BandStatistics]:
-        ...
+    def statistics(
+        self,
+        *,
+        scale: Optional[float] = None,
+        max_size: int = 1024,
+        bins: int = 10,
+        percentiles: Sequence[int] = (2, 98),
+        workers: int = 1,
+    ) -> dict[str, BandStatistics]:
+        """Compute per-band statistics of the image.
+
+        The image is evaluated at `scale` (in meters) window by window, and
+        the statistics of each window are merged. Without `scale`, statistics
+        are approximated by evaluating the image at a coarse scale, so that
+        its largest side has `max_size` pixels (which reads from overviews
+        when sources have them).
+        """
+        if not self.bounds:
+            raise RuntimeError("Image is boundless, cannot compute statistics")
+
+        if scale is None:
+            scale = self._max_size_scale(max_size)
+
+        windows = list(
+            self.window_and_bounds(
+                bounds=self.bounds,
+                bounds_crs=self.crs,
+                crs=self.crs,
+                scale=scale,
+                window_size=WINDOW_SIZE,
+            )
+        )
+        accs = [BandAccumulator() for _ in range(self.count)]
+        for _, img in read_windows(self.input, windows, self.crs, workers=workers):
+            valid = img.mask > 0
+            for band, acc in zip(img.data, accs):
+                band_valid = valid & np.isfinite(band)
+                values = band[band_valid]
+                acc.merge(BandAccumulator.from_values(values, band.size - values.size))
+
+        return {
+            name: acc.result(bins=bins, percentiles=percentiles)
+            for name, acc in zip(self.input.band_names, accs)
+        }
 
     def tile(
-        self, tile_x: int, tile_y: int, tile_z: int, tilesize: int = 256
+        self,
+        tile_x: int,
+        tile_y: int,
+        tile_z: int,
+        tilesize: int = 256,
+        indexes: Optional[Sequence[int]] = None,
     ) -> ImageData:
         if not self.tile_exists(tile_x, tile_y, tile_z):
             raise TileOutsideBounds(
@@ -394,8 +729,60 @@ class ImageReader(BaseReader):
             width=tilesize,
             dst_crs=self.tms.rasterio_crs,
             bounds_crs=None,
+            indexes=indexes,
         )
 
+    def metatile(
+        self,
+        tile_x: int,
+        tile_y: int,
+        tile_z: int,
+        size: int,
+        tilesize: int = 256,
+        indexes: Optional[Sequence[int]] = None,
+    ) -> dict[Tile, ImageData]:
+        """Read the block of `size` x `size` tiles that contains a tile.
+
+        The whole block is read with a single `part` call and sliced into
+        tiles. Only tiles that intersect the image are returned.
+        """
+        if not self.tile_exists(tile_x, tile_y, tile_z):
+            raise TileOutsideBounds(
+                f"Tile {tile_z}/{tile_x}/{tile_y} is outside {self.input} bounds"
+            )
+
+        matrix = self.tms.matrix(tile_z)
+        min_x, min_y = tile_x // size * size, tile_y // size * size
+        max_x = min(min_x + size, matrix.matrixWidth) - 1
+        max_y = min(min_y + size, matrix.matrixHeight) - 1
+
+        left, _, _, top = self.tms.xy_bounds(Tile(x=min_x, y=min_y, z=tile_z))
+        _, bottom, right, _ = self.tms.xy_bounds(Tile(x=max_x, y=max_y, z=tile_z))
+        img = self.part(
+            (left, bottom, right, top),
+            height=(max_y - min_y + 1) * tilesize,
+            width=(max_x - min_x + 1) * tilesize,
+            dst_crs=self.tms.rasterio_crs,
+            bounds_crs=None,
+            indexes=indexes,
+        )
+
+        tiles = {}
+        for y in range(min_y, max_y + 1):
+            for x in range(min_x, max_x + 1):
+                if not self.tile_exists(x, y, tile_z):
+                    continue
+                tile = Tile(x=x, y=y, z=tile_z)
+                row, col = (y - min_y) * tilesize, (x - min_x) * tilesize
+                tiles[tile] = ImageData(
+                    img.data[:, row : row + tilesize, col : col + tilesize].copy(),
+                    img.mask[row : row + tilesize, col : col + tilesize].copy(),
+                    bounds=self.tms.xy_bounds(tile),
+                    crs=img.crs,
+                    band_names=img.band_names,
+                )
+        return tiles
+
     def part(
         self,
         bounds: BBox,
@@ -403,26 +790,598 @@ class ImageReader(BaseReader):
         width: int,
         dst_crs: Optional[CRS] = None,
         bounds_crs: Optional[CRS] = WGS84_CRS,
+        indexes: Optional[Sequence[int]] = None,
     ) -> ImageData:
         if not dst_crs:
             dst_crs = bounds_crs
         if bounds_crs and bounds_crs != dst_crs:
             bounds = transform_bounds(bounds_crs, dst_crs, *bounds, densify_pts=21)
-        return self.input.part(bounds, dst_crs, height, width)
+        img = self.input.part(bounds, dst_crs, height, width, indexes)
+
+        # Constants are evaluated as single pixels, expand them to the
+        # requested size
+        if img.data.shape[1:] != (height, width):
+            img = copy(img)
+            img.data = np.broadcast_to(img.data, (img.count, height, width)).copy()
+        if img.mask.shape != (height, width):
+            img = copy(img)
+            img.mask = np.broadcast_to(img.mask, (height, width)).copy()
+        return img
+
+    def point(
+        self, lon: float, lat: float, coord_crs: CRS = WGS84_CRS, **kwargs: Any
+    ) -> PointData:
+        values = self.sample([lon], [lat], coord_crs=coord_crs, **kwargs)
+        return PointData(
+            values[:, 0],
+            band_names=self.input.band_names,
+            coordinates=(lon, lat),
+            crs=coord_crs,
+        )
 
-    def point(self, lon: float, lat: float) -> PointData:
-        ...
+    def sample(
+        self,
+        xs: npt.ArrayLike,
+        ys: npt.ArrayLike,
+        *,
+        coord_crs: CRS = WGS84_CRS,
+        scale: Optional[float] = None,
+        block_size: Optional[int] = None,
+        workers: int = 1,
+    ) -> np.ma.MaskedArray:
+        """Sample the image at many points.
+
+        Points are grouped by the block of `block_size` pixels they fall in,
+        and the image is only evaluated over blocks that contain points, each
+        block once. Each point gets the value of the pixel it falls in, on a
+        grid of `scale` meters. `scale` defaults to the pixel grid of the
+        image sources, so values are the source pixels. If sources do not
+        share a grid, it defaults to the resolution of three zoom levels
+        above the maximum zoom of the image instead.
+
+        Returns a masked array of shape (bands, points), with points outside
+        the image (or on masked pixels) masked.
+        """
+        if not self.bounds:
+            raise RuntimeError("Image is boundless, cannot sample points")
+
+        block_size = block_size or settings.sample_block_size
+        grid_transform = self.input.transform
+        if scale is not None or grid_transform is None:
+            if scale is None:
+                # The max zoom is already around the resolution of the sources
+                scale = self._zoom_scale((self.input.max_zoom or self.tms.maxzoom) + 3)
+            width, height, grid_transform = self.grid(
+                bounds=self.bounds, bounds_crs=self.crs, crs=self.crs, scale=scale
+            )
+        else:
+            left, bottom, right, top = self.bounds
+            width = round((right - left) / grid_transform.a)
+            height = round((bottom - top) / grid_transform.e)
+
+        xs, ys = np.asarray(xs, dtype=np.float64), np.asarray(ys, dtype=np.float64)
+        if coord_crs != self.crs:
+            xs, ys = (np.asarray(v) for v in transform(coord_crs, self.crs, xs, ys))
+        cols, rows = ~grid_transform * (xs, ys)
+        cols, rows = np.floor(cols).astype(np.int64), np.floor(rows).astype(np.int64)
+        inside = (cols >= 0) & (cols < width) & (rows >= 0) & (rows < height)
+
+        values = np.ma.masked_all((self.count, xs.size), dtype=self.dtype)
+        if not inside.any():
+            return values
+
+        # Group points by block, so that each block is evaluated once
+        points = np.flatnonzero(inside)
+        block_ids = (rows[points] // block_size) * width + cols[points] // block_size
+        order = np.argsort(block_ids, kind="stable")
+        points, block_ids = points[order], block_ids[order]
+        starts = np.flatnonzero(np.r_[True, block_ids[1:] != block_ids[:-1]])
+        groups = np.split(points, starts[1:])
+
+        windows = []
+        for group in groups:
+            row_off = rows[group[0]] // block_size * block_size
+            col_off = cols[group[0]] // block_size * block_size
+            win = Window(
+                col_off,
+                row_off,
+                min(block_size, width - col_off),
+                min(block_size, height - row_off),
+            )
+            windows.append((win, rasterio.windows.bounds(win, grid_transform)))
 
-    def preview(self) -> ImageData:
-        ...
+        blocks = read_windows(self.input, windows, self.crs, workers=workers)
+        for group, (win, img) in zip(groups, blocks):
+            block_rows = rows[group] - win.row_off
+            block_cols = cols[group] - win.col_off
+            values[:, group] = img.data[:, block_rows, block_cols]
+            values[:, group[img.mask[block_rows, block_cols] == 0]] = np.ma.masked
 
-    def feature(self, shape: dict) -> ImageData:
-        ...
+        return values
+
+    def preview(
+        self,
+        indexes: Optional[Sequence[int]] = None,
+        max_size: int = 1024,
+    ) -> ImageData:
+        """Read the whole image at a coarse scale, so that its largest side
+        has `max_size` pixels.
+
+        Sources are read from their coarsest overview that is fine enough for
+        that scale, so previews of large rasters with overviews only read a
+        few blocks.
+        """
+        if not self.bounds:
+            raise RuntimeError("Image is boundless, cannot compute a preview")
+
+        width, height, _ = self.grid(
+            bounds=self.bounds,
+            bounds_crs=self.crs,
+            crs=self.crs,
+            scale=self._max_size_scale(max_size),
+        )
+        return self.part(
+            self.bounds,
+            height=max(height, 1),
+            width=max(width, 1),
+            dst_crs=self.crs,
+            bounds_crs=self.crs,
+            indexes=indexes,
+        )
+
+    def feature(
+        self,
+        shape: dict,
+        shape_crs: CRS = WGS84_CRS,
+        *,
+        scale: Optional[float] = None,
+        indexes: Optional[Sequence[int]] = None,
+    ) -> ImageData:
+        """Read the image over a GeoJSON geometry (or feature), masking pixels
+        outside of it. `scale` defaults to the resolution of the image max zoom.
+        """
+        geom = transform_geom(shape_crs, self.crs, shape.get("geometry", shape))
+        bounds = rasterio.features.bounds(geom)
+        width, height, shape_transform = self.grid(
+            bounds=bounds,
+            bounds_crs=self.crs,
+            crs=self.crs,
+            scale=scale or self._zoom_scale(self.input.max_zoom or self.tms.maxzoom),
+        )
+        img = copy(
+            self.part(
+                bounds,
+                height=height,
+                width=width,
+                dst_crs=self.crs,
+                bounds_crs=self.crs,
+                indexes=indexes,
+            )
+        )
+        outside = geometry_mask(
+            [geom], out_shape=(height, width), transform=shape_transform
+        )
+        img.mask = np.where(outside, 0, img.mask).astype(np.uint8)
+        return img
+
+    def zonal_statistics(
+        self,
+        features: dict,
+        features_crs: CRS = WGS84_CRS,
+        *,
+        scale: Optional[float] = None,
+        workers: int = 1,
+    ) -> Iterator[Tuple[int, dict[str, dict[str, Optional[float]]]]]:
+        """Compute per-band count, sum, mean, min and max over each feature of
+        a GeoJSON FeatureCollection.
+
+        The image is evaluated window by window over its grid (see
+        `window_and_bounds`), reading only windows that intersect features,
+        each once. In each window, only the features whose bounding boxes
+        intersect it are rasterized. Statistics are yielded as (feature index,
+        statistics by band) as soon as all the windows of a feature are done,
+        so not in feature order. `scale` defaults to the resolution of the
+        image max zoom.
+        """
+        if not self.bounds:
+            raise RuntimeError("Image is boundless, cannot compute zonal statistics")
+
+        if features.get("type") != "FeatureCollection":
+            raise RuntimeError("Features must be a GeoJSON FeatureCollection")
+        try:
+            geoms = [
+                transform_geom(features_crs, self.crs, f["geometry"])
+                for f in features["features"]
+            ]
+        except (KeyError, TypeError, ValueError) as err:
+            raise RuntimeError(f"Invalid feature geometry: {err}")
+        return self._zonal_statistics(geoms, scale=scale, workers=workers)
+
+    def _zonal_statistics(
+        self, geoms: list[dict], *, scale: Optional[float], workers: int
+    ) -> Iterator[Tuple[int, dict[str, dict[str, Optional[float]]]]]:
+        scale = scale or self._zoom_scale(self.input.max_zoom or self.tms.maxzoom)
+        _, _, grid_transform = self.grid(
+            bounds=self.bounds, bounds_crs=self.crs, crs=self.crs, scale=scale
+        )
+        windows = self.window_and_bounds(
+            bounds=self.bounds,
+            bounds_crs=self.crs,
+            crs=self.crs,
+            scale=scale,
+            window_size=WINDOW_SIZE,
+        )
+
+        # Bounding boxes of features, used as a spatial index to find the
+        # features that intersect each window
+        boxes = np.array([rasterio.features.bounds(g) for g in geoms]).reshape(-1, 4)
+
+        # Features are rasterized in pixel coordinates of the grid, so that
+        # pixels whose centers lie on a feature boundary are assigned the same
+        # way regardless of the window size
+        pixel_geoms = [_to_pixels(g, grid_transform) for g in geoms]
+
+        windows_features = []
+        for win, (left, bottom, right, top) in windows:
+            intersecting = np.flatnonzero(
+                (boxes[:, 0] < right)
+                & (boxes[:, 2] > left)
+                & (boxes[:, 1] < top)
+                & (boxes[:, 3] > bottom)
+            )
+            if intersecting.size:
+                windows_features.append(
+                    ((win, (left, bottom, right, top)), intersecting)
+                )
+
+        remaining = np.zeros(len(geoms), dtype=np.int64)
+        for _, intersecting in windows_features:
+            remaining[intersecting] += 1
+
+        shape = (len(geoms), self.count)
+        count = np.zeros(len(geoms), dtype=np.int64)
+        total = np.zeros(shape)
+        min_v = np.full(shape, np.inf)
+        max_v = np.full(shape, -np.inf)
+
+        def _result(i: int) -> dict[str, dict[str, Optional[float]]]:
+            n = int(count[i])
+            return {
+                name: {
+                    "count": n,
+                    "sum": float(total[i, b]),
+                    "mean": float(total[i, b] / n) if n else None,
+                    "min": float(min_v[i, b]) if n else None,
+                    "max": float(max_v[i, b]) if n else None,
+                }
+                for b, name in enumerate(self.input.band_names)
+            }
+
+        # Features outside of the image are done right away
+        for i in np.flatnonzero(remaining == 0):
+            yield int(i), _result(i)
+
+        blocks = read_windows(
+            self.input, [w for w, _ in windows_features], self.crs, workers=workers
+        )
+        for (_, intersecting), (win, img) in zip(windows_features, blocks):
+            win_transform = rasterio.windows.transform(win, grid_transform)
+            for i in intersecting:
+                # Pixels of the window within the feature bounding box
+                box = rasterio.windows.from_bounds(*boxes[i], transform=win_transform)
+                col_off = max(math.floor(box.col_off), 0)
+                row_off = max(math.floor(box.row_off), 0)
+                col_end = min(math.ceil(box.col_off + box.width), win.width)
+                row_end = min(math.ceil(box.row_off + box.height), win.height)
+                if col_end > col_off and row_end > row_off:
+                    sub = Window(col_off, row_off, col_end - col_off, row_end - row_off)
+                    rows, cols = sub.toslices()
+                    inside = geometry_mask(
+                        [pixel_geoms[i]],
+                        out_shape=(sub.height, sub.width),
+                        transform=rasterio.Affine.translation(
+                            win.col_off + col_off, win.row_off + row_off
+                        ),
+                        invert=True,
+                    )
+                    inside &= img.mask[rows, cols] > 0
+                    values = img.data[:, rows, cols][:, inside].astype(np.float64)
+                    if values.shape[1]:
+                        count[i] += values.shape[1]
+                        total[i] += values.sum(axis=1)
+                        min_v[i] = np.minimum(min_v[i], values.min(axis=1))
+                        max_v[i] = np.maximum(max_v[i], values.max(axis=1))
+
+                remaining[i] -= 1
+                if not remaining[i]:
+                    yield int(i), _result(i)
+
+    def _max_size_scale(self, max_size: int) -> float:
+        # Pixel size in meters for the largest side of the image to have
+        # `max_size` pixels
+        proj_crs = self.crs if self.crs.is_projected else CRS.from_epsg(3857)
+        left, bottom, right, top = transform_bounds(
+            self.crs, proj_crs, *self.bounds, densify_pts=21
+        )
+        return max(right - left, top - bottom) / max_size
+
+    def _zoom_scale(self, zoom: int) -> float:
+        # Pixel size in meters of a TMS zoom level
+        left, _, right, _ = self.tms.xy_bounds(Tile(x=0, y=0, z=zoom))
+        return (right - left) / self.tms.tileMatrix[0].tileWidth
 
     def read(self, window: Window) -> npt.NDArray:
         ...
 
 
+def _to_pixels(geom: dict, transform: rasterio.Affine) -> dict:
+    # Map the coordinates of a GeoJSON geometry to (col, row) pixel coordinates
+    inverse = ~transform
+
+    def _map(coords):
+        if coords and isinstance(coords[0], (int, float)):
+            return inverse * tuple(coords[:2])
+        return [_map(c) for c in coords]
+
+    if geom["type"] == "GeometryCollection":
+        return dict(
+            geom, geometries=[_to_pixels(g, transform) for g in geom["geometries"]]
+        )
+    return dict(geom, coordinates=_map(geom["coordinates"]))
+
+
+def read_windows(
+    image: Image,
+    windows: list[Tuple[Window, BBox]],
+    crs: CRS,
+    *,
+    workers: int = 1,
+    executor: str = "thread",
+) -> Iterator[Tuple[Window, ImageData]]:
+    """Evaluate an image over windows, yielding results in window order.
+
+    With more than one worker, windows are evaluated in a thread or process
+    pool. Process pools evaluate the image graph once per worker, so the
+    image must have been built by `eval_image`.
+    """
+    if workers <= 1:
+        for win, win_bounds in windows:
+            yield win, _read_window(image, win, win_bounds, crs)
+        return
+
+    pool, worker_image = _create_pool(image, workers, executor)
+
+    # Bound the number of windows in flight, so that results waiting to be
+    # written in order do not pile up in memory
+    pending: deque[Tuple[Window, Future[ImageData]]] = deque()
+    windows_iter = iter(windows)
+    try:
+        for win, win_bounds in islice(windows_iter, 2 * workers):
+            future = pool.submit(_read_window, worker_image, win, win_bounds, crs)
+            pending.append((win, future))
+        while pending:
+            win, future = pending.popleft()
+            for next_win, next_bounds in islice(windows_iter, 1):
+                next_future = pool.submit(
+                    _read_window, worker_image, next_win, next_bounds, crs
+                )
+                pending.append((next_win, next_future))
+            yield win, future.result()
+    finally:
+        pool.shutdown(wait=True, cancel_futures=True)
+
+
+def export_tiles(
+    image: Image,
+    path: str,
+    profile: dict[str, Any],
+    *,
+    tile_size: int,
+    workers: int = 1,
+    executor: str = "thread",
+    progress: Optional[Callable[[int, int], None]] = None,
+    checkpoint: Optional[ExportCheckpoint] = None,
+) -> str:
+    """Export an image as a grid of GeoTIFF tiles, stitched by a VRT.
+
+    For `path` "out.tif", tiles are written to "out/out_{row}_{col}.tif" and
+    the VRT to "out.vrt", whose path is returned. Tiles are written
+    independently (in parallel with more than one worker), and a tile that
+    fails is retried on its own. Tiles recorded in `checkpoint` are skipped.
+    """
+    root, _ = os.path.splitext(path)
+    name = os.path.basename(root)
+    os.makedirs(root, exist_ok=True)
+
+    width, height, transform = profile["width"], profile["height"], profile["transform"]
+    tiles = []
+    for row_off in range(0, height, tile_size):
+        for col_off in range(0, width, tile_size):
+            tile_window = Window(
+                col_off,
+                row_off,
+                min(tile_size, width - col_off),
+                min(tile_size, height - row_off),
+            )
+            row, col = row_off // tile_size, col_off // tile_size
+            tile_path = os.path.join(root, f"{name}_{row}_{col}.tif")
+            tiles.append((tile_path, tile_window))
+
+    def _tile_task(tile_path: str, tile_window: Window) -> Tuple[Any, ...]:
+        tile_transform = rasterio.windows.transform(tile_window, transform)
+        tile_profile = dict(
+            profile,
+            width=tile_window.width,
+            height=tile_window.height,
+            transform=tile_transform,
+        )
+        windows = []
+        for row_off in range(0, tile_window.height, WINDOW_SIZE):
+            for col_off in range(0, tile_window.width, WINDOW_SIZE):
+                win = Window(
+                    col_off,
+                    row_off,
+                    min(WINDOW_SIZE, tile_window.width - col_off),
+                    min(WINDOW_SIZE, tile_window.height - row_off),
+                )
+                windows.append((win, rasterio.windows.bounds(win, tile_transform)))
+        return (tile_path, tile_profile, windows, profile["crs"])
+
+    tasks = [_tile_task(tile_path, tile_window) for tile_path, tile_window in tiles]
+    total = sum(len(task[2]) for task in tasks)
+
+    done_tiles = checkpoint.load() if checkpoint else set()
+    done_tiles = {i for i in done_tiles if os.path.exists(tasks[i][0])}
+    pending = [i for i in range(len(tasks)) if i not in done_tiles]
+
+    done = sum(len(tasks[i][2]) for i in done_tiles)
+    if progress:
+        progress(done, total)
+
+    def _tile_done(i: int) -> None:
+        nonlocal done
+        done_tiles.add(i)
+        if checkpoint:
+            checkpoint.save(done_tiles)
+        done += len(tasks[i][2])
+        if progress:
+            progress(done, total)
+
+    if workers <= 1:
+        for i in tqdm(pending, ascii=True, desc=path):
+            _write_tile(image, *tasks[i])
+            _tile_done(i)
+    else:
+        pool, worker_image = _create_pool(image, workers, executor)
+        try:
+            futures = {
+                pool.submit(_write_tile, worker_image, *tasks[i]): i for i in pending
+            }
+            for future in tqdm(
+                as_completed(futures), total=len(futures), ascii=True, desc=path
+            ):
+                future.result()
+                _tile_done(futures[future])
+        finally:
+            pool.shutdown(wait=True, cancel_futures=True)
+
+    vrt_path = f"{root}.vrt"
+    _write_vrt(vrt_path, profile, tiles)
+    if checkpoint:
+        checkpoint.remove()
+    return vrt_path
+
+
+def _write_tile(
+    image: Optional[Image],
+    path: str,
+    profile: dict[str, Any],
+    windows: list[Tuple[Window, BBox]],
+    crs: CRS,
+) -> None:
+    # Write to a temporary file first, so that a tile file only exists once
+    # it has been completely written
+    tmp_path = f"{path}.tmp"
+    for attempt in range(settings.export_tile_retries + 1):
+        try:
+            with rasterio.open(tmp_path, "w", **profile) as dst:
+                for win, win_bounds in windows:
+                    image_data = _read_window(image, win, win_bounds, crs)
+                    dst.write(image_data.data, window=win)
+                    dst.write_mask(image_data.mask, window=win)
+        except Exception:
+            if attempt == settings.export_tile_retries:
+                raise
+            warnings.warn(f"Failed to write tile {path}, retrying", UserWarning)
+        else:
+            break
+    os.replace(tmp_path, path)
+
+
+def _write_vrt(
+    path: str, profile: dict[str, Any], tiles: list[Tuple[str, Window]]
+) -> None:
+    vrt = ElementTree.Element(
+        "VRTDataset",
+        rasterXSize=str(profile["width"]),
+        rasterYSize=str(profile["height"]),
+    )
+    ElementTree.SubElement(vrt, "SRS").text = profile["crs"].to_wkt()
+    ElementTree.SubElement(vrt, "GeoTransform").text = ", ".join(
+        str(v) for v in profile["transform"].to_gdal()
+    )
+
+    def _add_sources(band: ElementTree.Element, source_band: str) -> None:
+        for tile_path, tile_window in tiles:
+            source = ElementTree.SubElement(band, "SimpleSource")
+            filename = ElementTree.SubElement(
+                source, "SourceFilename", relativeToVRT="1"
+            )
+            filename.text = os.path.relpath(tile_path, os.path.dirname(path))
+            ElementTree.SubElement(source, "SourceBand").text = source_band
+            size = dict(xSize=str(tile_window.width), ySize=str(tile_window.height))
+            ElementTree.SubElement(source, "SrcRect", xOff="0", yOff="0", **size)
+            ElementTree.SubElement(
+                source,
+                "DstRect",
+                xOff=str(tile_window.col_off),
+                yOff=str(tile_window.row_off),
+                **size,
+            )
+
+    data_type = typename_fwd[dtype_rev[np.dtype(profile["dtype"]).name]]
+    for band_idx in range(1, profile["count"] + 1):
+        band = ElementTree.SubElement(
+            vrt, "VRTRasterBand", dataType=data_type, band=str(band_idx)
+        )
+        _add_sources(band, str(band_idx))
+
+    mask_band = ElementTree.SubElement(
+        ElementTree.SubElement(vrt, "MaskBand"), "VRTRasterBand", dataType="Byte"
+    )
+    _add_sources(mask_band, "mask,1")
+
+    ElementTree.ElementTree(vrt).write(path)
+
+
+def _create_pool(
+    image: Image, workers: int, executor: str
+) -> Tuple[Executor, Optional[Image]]:
+    # Process pools receive the image graph once per worker, so functions
+    # submitted to them get None as image and use the worker's instead.
+    if executor == "process":
+        if image.graph is None:
+            raise RuntimeError("Image has no call graph to send to worker processes")
+        pool = ProcessPoolExecutor(
+            workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(image.graph,),
+        )
+        return pool, None
+    elif executor == "thread":
+        return ThreadPoolExecutor(workers), image
+    else:
+        raise RuntimeError(f"Invalid executor: {executor}")
+
+
+_worker_image: Optional[Image] = None
+
+
+def _init_worker(graph: dict[str, Any]) -> None:
+    global _worker_image
+    _worker_image = eval_image(graph)
+
+
+def _read_window(
+    image: Optional[Image], win: Window, win_bounds: BBox, crs: CRS
+) -> ImageData:
+    image = image or _worker_image
+    assert image is not None
+    with ImageReader(image) as src:
+        return src.part(win_bounds, win.height, win.width, bounds_crs=crs, dst_crs=crs)
+
+
 class ImageWriter:
     def __init__(self, image: Image, path: str):
         self.path = path
@@ -438,39 +1397,109 @@ class ImageWriter:
         pass
 
 
-def _read_raster_info(path: str) -> Tuple[BBox, CRS, npt.DTypeLike, int]:
-    with rasterio.open(path) as src:
-        return (src.bounds, src.crs, src.profile["dtype"], src.count)
+@attr.s(frozen=True)
+class RasterInfo:
+    bounds: BBox = attr.ib()
+    crs: CRS = attr.ib()
+    dtype: str = attr.ib()
+    count: int = attr.ib()
+    band_descriptions: list[Optional[str]] = attr.ib()
+    min_zoom: int = attr.ib()
+    max_zoom: int = attr.ib()
+    res: Tuple[float, float] = attr.ib()
+    # Decimation factors of the overviews of the first band
+    overviews: list[int] = attr.ib()
+
+    def dumps(self) -> bytes:
+        info = attr.asdict(self)
+        info["crs"] = self.crs.to_wkt()
+        return json.dumps(info).encode()
+
+    @classmethod
+    def loads(cls, body: bytes) -> RasterInfo:
+        info = json.loads(body)
+        info["bounds"] = tuple(info["bounds"])
+        info["res"] = tuple(info["res"])
+        info["crs"] = CRS.from_wkt(info["crs"])
+        return cls(**info)
+
+
+raster_info_cache: TieredCache[RasterInfo] = TieredCache(
+    f"raster_info:v{RASTER_INFO_VERSION}",
+    maxsize=settings.raster_info_cache_size,
+    ttl=settings.raster_info_cache_ttl,
+    dumps=RasterInfo.dumps,
+    loads=RasterInfo.loads,
+)
+
+
+def get_raster_info(path: str) -> RasterInfo:
+    key = f"{path}:{file_signature(path)}"
+    info = raster_info_cache.get(key)
+    if info is None:
+        info = _read_raster_info(path)
+        raster_info_cache.set(key, info)
+    return info
+
+
+def _read_raster_info(path: str) -> RasterInfo:
+    with dataset_pool.open(path) as src:
+        min_zoom, max_zoom = _get_min_max_zoom(src)
+        return RasterInfo(
+            bounds=tuple(src.bounds),
+            crs=src.crs,
+            dtype=src.profile["dtype"],
+            count=src.count,
+            band_descriptions=list(src.descriptions),
+            min_zoom=min_zoom,
+            max_zoom=max_zoom,
+            res=src.res,
+            overviews=src.overviews(1),
+        )
 
 
-def _dst_geom_in_tms_crs(path: str):
+def _overview_level(
+    raster_info: RasterInfo, bounds: BBox, dst_crs: CRS, height: int, width: int
+) -> Optional[int]:
+    if not raster_info.overviews:
+        return None
+    if dst_crs != raster_info.crs:
+        bounds = transform_bounds(dst_crs, raster_info.crs, *bounds, densify_pts=21)
+    left, bottom, right, top = bounds
+    res_x, res_y = (right - left) / width, (top - bottom) / height
+    level = None
+    for i, factor in enumerate(raster_info.overviews):
+        if raster_info.res[0] * factor > res_x or raster_info.res[1] * factor > res_y:
+            break
+        level = i
+    return level
+
+
+def _dst_geom_in_tms_crs(src: DatasetReader, tms: TileMatrixSet = WEB_MERCATOR_TMS):
     """Return dataset info in TMS projection."""
-    tms = WEB_MERCATOR_TMS
-
-    with rasterio.open(path) as src:
-        if src.crs != tms.rasterio_crs:
-            dst_affine, w, h = calculate_default_transform(
-                src.crs,
-                tms.rasterio_crs,
-                src.width,
-                src.height,
-                *src.bounds,
-            )
-        else:
-            dst_affine = list(src.transform)
-            w = src.width
-            h = src.height
+    if src.crs != tms.rasterio_crs:
+        dst_affine, w, h = calculate_default_transform(
+            src.crs,
+            tms.rasterio_crs,
+            src.width,
+            src.height,
+            *src.bounds,
+        )
+    else:
+        dst_affine = list(src.transform)
+        w = src.width
+        h = src.height
 
-        return dst_affine, w, h
+    return dst_affine, w, h
 
 
-def _get_minzoom(path: str, *, tms: TileMatrixSet = WEB_MERCATOR_TMS) -> int:
+def _get_minzoom(src: DatasetReader, *, tms: TileMatrixSet = WEB_MERCATOR_TMS) -> int:
     # We assume the TMS tilesize to be constant over all matrices
     # ref: https://github.com/OSGeo/gdal/blob/dc38aa64d779ecc45e3cd15b1817b83216cf96b8/gdal/frmts/gtiff/cogdriver.cpp#L274
     tilesize = tms.tileMatrix[0].tileWidth
 
     try:
-        dst_affine, w, h = _dst_geom_in_tms_crs(path)
+        dst_affine, w, h = _dst_geom_in_tms_crs(src, tms)
 
         # The minzoom is defined by the resolution of the maximum theoretical overview level
         # We assume `tilesize`` is the smallest overview size
@@ -494,10 +1523,10 @@ def _get_minzoom(path: str, *, tms: TileMatrixSet = WEB_MERCATOR_TMS) -> int:
     return _minzoom
 
 
-def _get_maxzoom(path: str, *, tms: TileMatrixSet = WEB_MERCATOR_TMS) -> int:
+def _get_maxzoom(src: DatasetReader, *, tms: TileMatrixSet = WEB_MERCATOR_TMS) -> int:
     """Define dataset maximum zoom level."""
     try:
-        dst_affine, _, _ = _dst_geom_in_tms_crs(path)
+        dst_affine, _, _ = _dst_geom_in_tms_crs(src, tms)
 
         # The maxzoom is defined by finding the minimum difference between
         # the raster resolution and the zoom level resolution
@@ -516,13 +1545,239 @@ def _get_maxzoom(path: str, *, tms: TileMatrixSet = WEB_MERCATOR_TMS) -> int:
 
 
 def _get_min_max_zoom(
-    path: str, tms: TileMatrixSet = WEB_MERCATOR_TMS
+    src: DatasetReader, tms: TileMatrixSet = WEB_MERCATOR_TMS
 ) -> Tuple[int, int]:
-    _minzoom = _get_minzoom(path, tms=tms)
-    _maxzoom = _get_maxzoom(path, tms=tms)
+    _minzoom = _get_minzoom(src, tms=tms)
+    _maxzoom = _get_maxzoom(src, tms=tms)
     return (_minzoom, _maxzoom)
 
 
+def _operator_part(
+    method_name: str, operands: Tuple[Image, Image], dtype: npt.DTypeLike
+) -> PartCallable:
+    a, b = operands
+
+    def _part(
+        bounds: BBox,
+        dst_crs: CRS,
+        height: int,
+        width: int,
+        indexes: Optional[Sequence[int]],
+    ) -> ImageData:
+        a_data = a.part(bounds, dst_crs, height, width, _operand_indexes(a, indexes))
+        b_data = b.part(bounds, dst_crs, height, width, _operand_indexes(b, indexes))
+        new_img_data = copy(a_data if a.count >= b.count else b_data)
+        new_img_data.data = getattr(a_data.data, method_name)(b_data.data).astype(
+            dtype, copy=False
+        )
+        # Constants are always valid, so they do not take part in the mask
+        if a.value is not None:
+            new_img_data.mask = b_data.mask
+        elif b.value is not None:
+            new_img_data.mask = a_data.mask
+        else:
+            new_img_data.mask = np.maximum(a_data.mask, b_data.mask)
+        return new_img_data
+
+    return _part
+
+
+def _expression_part(
+    method_name: str, operands: Tuple[Image, ...], dtype: npt.DTypeLike
+) -> PartCallable:
+    # The expression is compiled on first use, so that intermediate nodes
+    # which are only used as part of a larger expression are never compiled.
+    expression: Optional[Tuple[str, list[Image], list[Image]]] = None
+    compute_dtype: Optional[np.dtype] = None
+
+    def _part(
+        bounds: BBox,
+        dst_crs: CRS,
+        height: int,
+        width: int,
+        indexes: Optional[Sequence[int]],
+    ) -> ImageData:
+        nonlocal expression, compute_dtype
+        if expression is None:
+            expression = _compile_expression(method_name, operands)
+            compute_dtype = _compute_dtype(method_name, operands, dtype)
+        source, leaves, constants = expression
+
+        leaves_data = [
+            leaf.part(bounds, dst_crs, height, width, _operand_indexes(leaf, indexes))
+            for leaf in leaves
+        ]
+        # Evaluate the whole expression in a type that holds the result of
+        # every fused node, so that it gives the same values as evaluating
+        # each node on its own
+        local_dict = {
+            f"v{i}": d.data.astype(compute_dtype, copy=False)
+            for i, d in enumerate(leaves_data)
+        }
+        for i, constant in enumerate(constants):
+            local_dict[f"c{i}"] = np.asarray(constant.value, dtype=compute_dtype)
+        data = numexpr.evaluate(source, local_dict=local_dict, global_dict={})
+
+        # Combine masks once for the whole expression. Constants are always
+        # valid, so they do not take part in it.
+        mask = leaves_data[0].mask
+        if len(leaves_data) > 1:
+            mask = mask.copy()
+            for leaf_data in leaves_data[1:]:
+                np.maximum(mask, leaf_data.mask, out=mask)
+
+        widest = max(leaves_data, key=lambda d: d.count)
+        new_img_data = copy(widest)
+        new_img_data.data = data.astype(dtype, copy=False)
+        new_img_data.mask = mask
+        return new_img_data
+
+    return _part
+
+
+def _compile_expression(
+    method_name: str, operands: Tuple[Image, ...]
+) -> Tuple[str, list[Image], list[Image]]:
+    """Compile a tree of expression nodes into a single numexpr expression.
+
+    Returns the expression source, its leaves, i.e. the non-expression
+    images it reads from, bound to variables `v0`, `v1`, etc., and its
+    constants, bound as scalars to `c0`, `c1`, etc. Leaves shared by several
+    branches are bound to a single variable.
+    """
+    leaves: dict[int, Tuple[str, Image]] = {}
+    constants: dict[int, Tuple[str, Image]] = {}
+
+    def _compile(method_name: str, operands: Tuple[Image, ...]) -> str:
+        args = [_compile_operand(operand) for operand in operands]
+        if method_name == "astype":
+            return args[0]
+        if method_name == "__abs__":
+            return f"abs({args[0]})"
+        return f"({args[0]} {EXPRESSION_OPERATORS[method_name]} {args[1]})"
+
+    def _compile_operand(image: Image) -> str:
+        if image.value is not None:
+            if id(image) not in constants:
+                constants[id(image)] = (f"c{len(constants)}", image)
+            return constants[id(image)][0]
+        # Casts can only be fused at the root of the expression
+        if image.op is not None and image.op[0] != "astype":
+            return _compile(*image.op)
+        if id(image) not in leaves:
+            leaves[id(image)] = (f"v{len(leaves)}", image)
+        return leaves[id(image)][0]
+
+    source = _compile(method_name, operands)
+    return (
+        source,
+        [image for _, image in leaves.values()],
+        [image for _, image in constants.values()],
+    )
+
+
+def _compute_dtype(
+    method_name: str, operands: Tuple[Image, ...], dtype: npt.DTypeLike
+) -> np.dtype:
+    # Widest type among the leaves and the results of the fused nodes of an
+    # expression (see `_compile_expression`), mapped to a type supported by
+    # numexpr. Comparisons are left out, as their result is boolean, but the
+    # constants they compare against are not, so that e.g. `img < 0.5` is
+    # not computed in integers.
+    dtypes = []
+    if method_name not in COMPARISON_OPERATORS and method_name != "astype":
+        dtypes.append(np.dtype(dtype))
+
+    def _collect(image: Image) -> None:
+        if image.op is not None and image.op[0] != "astype":
+            if image.op[0] not in COMPARISON_OPERATORS:
+                dtypes.append(np.dtype(image.dtype))
+            for operand in image.op[1]:
+                _collect(operand)
+        else:
+            dtypes.append(np.dtype(image.dtype))
+
+    for operand in operands:
+        _collect(operand)
+
+    compute_dtype = np.result_type(*dtypes) if dtypes else np.dtype(np.float64)
+    if np.issubdtype(compute_dtype, np.floating):
+        return compute_dtype
+    if np.can_cast(compute_dtype, np.int32):
+        return np.dtype(np.int32)
+    if np.can_cast(compute_dtype, np.int64):
+        return np.dtype(np.int64)
+    return np.dtype(np.float64)
+
+
+def _scalar_dtype(value: Union[float, int]) -> np.dtype:
+    # Like NumPy, use the smallest type that can hold integer scalars, but do
+    # not go below single precision for floats.
+    dtype = np.min_scalar_type(value)
+    if np.issubdtype(dtype, np.floating):
+        dtype = np.result_type(dtype, np.float32)
+    return dtype
+
+
+def _result_dtype(method_name: str, a: npt.DTypeLike, b: npt.DTypeLike) -> np.dtype:
+    if method_name in COMPARISON_OPERATORS:
+        return np.dtype(np.uint8)
+    if method_name == "__truediv__":
+        dtype = np.result_type(a, b, np.float16)
+    else:
+        dtype = np.result_type(a, b)
+    # Half precision is not supported by numexpr nor GeoTIFF
+    if dtype == np.float16:
+        dtype = np.dtype(np.float32)
+    if dtype.kind in "biu" and method_name in ("__add__", "__sub__", "__mul__"):
+        dtype = _widen_int(dtype, signed=method_name == "__sub__")
+    return dtype
+
+
+def _widen_int(dtype: np.dtype, *, signed: bool) -> np.dtype:
+    # Integer type twice as wide, so that sums, differences and products of
+    # two values never wrap around. Differences are always signed. There is
+    # no integer type wider than 64 bits, nor one that numexpr can multiply
+    # beyond int64, so these fall back to float64.
+    itemsize = max(dtype.itemsize, 1) * 2
+    kind = "i" if signed or dtype.kind == "i" else "u"
+    if itemsize > 8 or (itemsize == 8 and kind == "u"):
+        return np.dtype(np.float64)
+    return np.dtype(f"{kind}{itemsize}")
+
+
+def _operand_indexes(
+    operand: Image, indexes: Optional[Sequence[int]]
+) -> Optional[Sequence[int]]:
+    # Single-band operands are broadcast, so they are always read whole
+    return None if operand.count == 1 else indexes
+
+
+def _common_transform(
+    a: Image, b: Image, bounds: Optional[BBox]
+) -> Optional[rasterio.Affine]:
+    # Constants have no pixel grid, so they take the grid of the other operand
+    if b.value is not None:
+        return a.transform
+    if a.value is not None:
+        return b.transform
+    # Images whose sources are on mixed grids have no grid to share
+    if a.transform is None or b.transform is None:
+        return None
+    if not bounds or a.crs != b.crs:
+        return None
+    res = (a.transform.a, a.transform.e)
+    if (b.transform.a, b.transform.e) != res:
+        return None
+    # Grids are shared if their origins are a whole number of pixels apart
+    col_off, row_off = ~a.transform * (b.transform.c, b.transform.f)
+    if not (
+        math.isclose(col_off, round(col_off)) and math.isclose(row_off, round(row_off))
+    ):
+        return None
+    return rasterio.transform.from_origin(bounds[0], bounds[3], res[0], -res[1])
+
+
 def bounds_union(
     a: Optional[BBox], b: Optional[BBox], a_crs: CRS, b_crs: CRS
 ) -> Tuple[Optional[BBox], CRS]:
@@ -542,8 +1797,63 @@ def bounds_union(
 def eval_image(
     image_attr: dict[str, Any],
 ) -> Image:
-    method: Callable[..., Image] = getattr(Image, image_attr["name"])
-    args = [
-        eval_image(arg) if isinstance(arg, dict) else arg for arg in image_attr["args"]
-    ]
-    return method(*args)
+    return _eval_node(image_attr, {})
+
+
+def eval_images(
+    image_attrs: list[dict[str, Any]], *, workers: int = 1
+) -> list[Union[Image, Exception]]:
+    """Evaluate many image graphs, sharing identical subgraphs between them.
+
+    The raster info of all distinct sources is read first (in parallel with
+    more than one worker), so each file is opened at most once. The error
+    raised by a graph is returned in place of its image.
+    """
+    paths: set[str] = set()
+    for image_attr in image_attrs:
+        _load_paths(image_attr, paths)
+    if workers > 1 and len(paths) > 1:
+        with ThreadPoolExecutor(min(workers, len(paths))) as pool:
+            # Errors are raised again when evaluating the graphs that load
+            # these paths
+            wait([pool.submit(get_raster_info, path) for path in paths])
+
+    nodes: dict[str, Image] = {}
+    images: list[Union[Image, Exception]] = []
+    for image_attr in image_attrs:
+        try:
+            images.append(_eval_node(image_attr, nodes))
+        except Exception as err:
+            images.append(err)
+    return images
+
+
+def source_signatures(image_attr: dict[str, Any]) -> dict[str, str]:
+    """Return the file signature of each path loaded by an image graph."""
+    paths: set[str] = set()
+    _load_paths(image_attr, paths)
+    return {path: file_signature(path) for path in sorted(paths)}
+
+
+def _load_paths(image_attr: dict[str, Any], paths: set[str]) -> None:
+    if image_attr.get("name") == "load":
+        paths.update(arg for arg in image_attr.get("args", []) if isinstance(arg, str))
+    for arg in image_attr.get("args", []):
+        if isinstance(arg, dict):
+            _load_paths(arg, paths)
+
+
+def _eval_node(image_attr: dict[str, Any], nodes: dict[str, Image]) -> Image:
+    # Identical subgraphs evaluate to the same Image instance, turning the
+    # call tree into a DAG whose shared nodes are memoized by Image.part
+    key = json.dumps(image_attr, sort_keys=True)
+    image = nodes.get(key)
+    if image is None:
+        method: Callable[..., Image] = getattr(Image, image_attr["name"])
+        args = [
+            _eval_node(arg, nodes) if isinstance(arg, dict) else arg
+            for arg in image_attr["args"]
+        ]
+        image = nodes[key] = method(*args)
+        image.graph = image_attr
+    return image
@@ -0,0 +1,134 @@
+from __future__ import annotations
+
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Optional
+
+import attr
+
+from geoproc.server.settings import settings
+
+PENDING = "pending"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+FINISHED = (DONE, FAILED, CANCELLED)
+
+
+class JobCancelled(Exception):
+    pass
+
+
+@attr.s
+class Job:
+    kind: str = attr.ib()
+    id: str = attr.ib(factory=lambda: str(uuid.uuid4()))
+    status: str = attr.ib(default=PENDING)
+    done: int = attr.ib(default=0)
+    total: Optional[int] = attr.ib(default=None)
+    result: Any = attr.ib(default=None)
+    error: Optional[str] = attr.ib(default=None)
+    created_at: float = attr.ib(factory=time.time)
+    started_at: Optional[float] = attr.ib(default=None)
+    finished_at: Optional[float] = attr.ib(default=None)
+    _cancel_event: threading.Event = attr.ib(factory=threading.Event, repr=False)
+
+    def progress(self, done: int, total: int) -> None:
+        """Report progress. Raises JobCancelled if the job was cancelled."""
+        self.done = done
+        self.total = total
+        if self._cancel_event.is_set():
+            raise JobCancelled(f"Job {self.id} was cancelled")
+
+    def cancel(self) -> None:
+        self._cancel_event.set()
+        if self.status == PENDING:
+            self.status = CANCELLED
+            self.finished_at = time.time()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancel_event.is_set()
+
+    def info(self) -> dict[str, Any]:
+        end = self.finished_at or time.time()
+        elapsed = self.started_at and end - self.started_at
+        throughput = elapsed and self.done / elapsed
+        eta = None
+        if self.status == RUNNING and throughput and self.total is not None:
+            eta = (self.total - self.done) / throughput
+        return {
+            "id": self.id,
+            "kind": self.kind,
+            "status": self.status,
+            "done": self.done,
+            "total": self.total,
+            "elapsed": elapsed,
+            "throughput": throughput,
+            "eta": eta,
+            "result": self.result,
+            "error": self.error,
+        }
+
+
+class JobManager:
+    """Runs long running jobs (e.g. exports) in a background thread pool.
+
+    Jobs are tracked in-process, so they can only be queried from the same
+    server process that runs them. Finished jobs are forgotten after
+    `ttl` seconds.
+    """
+
+    def __init__(self, max_workers: int, ttl: float):
+        self.ttl = ttl
+        self._executor = ThreadPoolExecutor(max_workers, thread_name_prefix="job")
+        self._lock = threading.Lock()
+        self._jobs: dict[str, Job] = {}
+
+    def submit(self, kind: str, fn: Callable[[Job], Any]) -> Job:
+        job = Job(kind)
+        with self._lock:
+            self._prune()
+            self._jobs[job.id] = job
+        self._executor.submit(self._run, job, fn)
+        return job
+
+    def get(self, id: str) -> Optional[Job]:
+        with self._lock:
+            return self._jobs.get(id)
+
+    def _run(self, job: Job, fn: Callable[[Job], Any]) -> None:
+        if job.cancelled:
+            job.status = CANCELLED
+            job.finished_at = time.time()
+            return
+        job.status = RUNNING
+        job.started_at = time.time()
+        try:
+            job.result = fn(job)
+        except JobCancelled:
+            job.status = CANCELLED
+        except Exception as err:
+            job.status = FAILED
+            job.error = str(err)
+        else:
+            job.status = DONE
+        finally:
+            job.finished_at = time.time()
+
+    def _prune(self) -> None:
+        now = time.time()
+        expired = [
+            id
+            for id, job in self._jobs.items()
+            if job.finished_at and now - job.finished_at > self.ttl
+        ]
+        for id in expired:
+            del self._jobs[id]
+
+
+job_manager = JobManager(max_workers=settings.job_workers, ttl=settings.job_ttl)
@@ -1,8 +1,10 @@
-from typing import Optional
+from typing import Literal, Optional
 
-from pydantic import BaseModel
+from pydantic import BaseModel, Field, conint
 from rio_tiler.constants import WGS84_CRS
 
+from geoproc.models import VisualizationParams
+from geoproc.server.settings import settings
 from geoproc.server.types import BBox
 
 
@@ -13,3 +15,66 @@ class ExportRequest(BaseModel):
     scale: int = 1000
     bounds: Optional[BBox]
     path: str
+    precision: Optional[Literal["float32", "float64"]] = None
+    workers: int = Field(1, ge=1, le=settings.max_workers)
+    executor: Literal["thread", "process"] = "thread"
+
+
+class MapDefinition(BaseModel):
+    # Image graph, kept JSON-encoded as it is used as the key of evaluated
+    # images and sent as is to tile render workers
+    image_json: str
+    vis_params: VisualizationParams = VisualizationParams()
+
+
+class PreviewRequest(BaseModel):
+    image: dict
+    vis_params: VisualizationParams = VisualizationParams()
+    max_size: int = Field(1024, ge=1, le=settings.max_image_size)
+
+
+class SeedRequest(BaseModel):
+    map_id: str
+    bounds: Optional[BBox] = None
+    min_zoom: int
+    max_zoom: int
+    workers: int = Field(4, ge=1, le=settings.max_workers)
+
+
+class StatisticsRequest(BaseModel):
+    image: dict
+    scale: Optional[float] = None
+    max_size: int = Field(1024, ge=1, le=settings.max_image_size)
+    bins: int = Field(10, ge=1, le=settings.statistics_max_bins)
+    percentiles: list[conint(ge=0, le=100)] = [2, 98]  # type: ignore
+    workers: int = Field(1, ge=1, le=settings.max_workers)
+
+
+class SampleRequest(BaseModel):
+    image: dict
+    coordinates: list[tuple[float, float]]
+    crs: str = str(WGS84_CRS)
+    scale: Optional[float] = None
+    workers: int = Field(1, ge=1, le=settings.max_workers)
+
+
+class ZonalStatisticsRequest(BaseModel):
+    image: dict
+    features: dict
+    crs: str = str(WGS84_CRS)
+    scale: Optional[float] = None
+    workers: int = Field(1, ge=1, le=settings.max_workers)
+
+
+class ArrayRequest(BaseModel):
+    image: dict
+    # Either a tile (z, x, y), or bounds with a size
+    tile: Optional[tuple[int, int, int]] = None
+    tilesize: int = Field(256, gt=0)
+    bounds: Optional[BBox] = None
+    bounds_crs: str = str(WGS84_CRS)
+    crs: Optional[str] = None
+    width: Optional[int] = Field(None, gt=0)
+    height: Optional[int] = Field(None, gt=0)
+    bands: Optional[list[str]] = None
+    compress: bool = False
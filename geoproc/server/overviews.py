@@ -0,0 +1,101 @@
+from __future__ import annotations
+
+import fcntl
+import hashlib
+import json
+import os
+import tempfile
+from typing import Optional, Sequence
+
+import rasterio
+from morecantile.commons import Tile
+from rasterio.enums import Resampling
+from rasterio.rio.overview import get_maximum_overview_level
+from rio_tiler.constants import WEB_MERCATOR_TMS
+from rio_tiler.io import Reader
+from rio_tiler.models import ImageData
+
+from geoproc.server.image import Image, source_signatures
+from geoproc.server.settings import settings
+
+
+def overview_path(image_json: str) -> str:
+    # Signatures of the source files are part of the key, so that rewriting a
+    # source builds a new overview instead of reading a stale one
+    signatures = source_signatures(json.loads(image_json))
+    digest = hashlib.sha1(image_json.encode())
+    digest.update(json.dumps(signatures, separators=(",", ":")).encode())
+    return os.path.join(settings.overview_dir, f"{digest.hexdigest()}.tif")
+
+
+def get_overview(image_json: str, image: Image) -> str:
+    """Get the path of the overview of an image, building it on first use.
+
+    The overview is a GeoTIFF of the image at the resolution of the zoom level
+    right below its minimum zoom, with internal overviews down to a single
+    tile, so that low zoom tiles can be read from it instead of warping the
+    image sources. It is shared by all workers through `overview_dir`.
+    """
+    path = overview_path(image_json)
+    if os.path.exists(path):
+        return path
+
+    # Lock across processes (and threads, as each one opens the lock file), so
+    # that each overview is built once
+    os.makedirs(settings.overview_dir, exist_ok=True)
+    with open(f"{os.path.splitext(path)[0]}.lock", "w") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            if not os.path.exists(path):
+                _build_overview(image, path)
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+    return path
+
+
+def _build_overview(image: Image, path: str) -> None:
+    if image.min_zoom is None or not image.bounds:
+        raise RuntimeError("Image has no bounds or minimum zoom to build an overview")
+
+    tms = WEB_MERCATOR_TMS
+    left, _, right, _ = tms.xy_bounds(Tile(x=0, y=0, z=image.min_zoom - 1))
+    resolution = (right - left) / tms.tileMatrix[0].tileWidth
+
+    # Export to a temporary file first, so that other workers never read a
+    # partially written overview
+    fd, tmp_path = tempfile.mkstemp(suffix=".tif", dir=os.path.dirname(path))
+    os.close(fd)
+    try:
+        # Overviews are read as a single GeoTIFF, so they are never retiled
+        image.export(
+            tmp_path,
+            bounds=image.bounds,
+            in_crs=image.crs,
+            crs=tms.rasterio_crs,
+            scale=resolution,
+            retile=False,
+        )
+        with rasterio.open(tmp_path, "r+") as dst:
+            level = get_maximum_overview_level(
+                dst.width, dst.height, minsize=tms.tileMatrix[0].tileWidth
+            )
+            if level:
+                factors = [2**i for i in range(1, level + 1)]
+                dst.build_overviews(factors, Resampling.nearest)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+
+def overview_tile(
+    path: str,
+    tile_x: int,
+    tile_y: int,
+    tile_z: int,
+    indexes: Optional[Sequence[int]] = None,
+) -> ImageData:
+    # Overview bands are 1-based, as any other raster file
+    band_indexes = indexes and [i + 1 for i in indexes]
+    with Reader(path) as src:
+        return src.tile(tile_x, tile_y, tile_z, indexes=band_indexes)
@@ -0,0 +1,151 @@
+from __future__ import annotations
+
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from itertools import count
+from typing import Any, Iterator, Tuple
+
+import rasterio
+from rasterio.io import DatasetReader
+
+from geoproc.server.settings import settings
+
+PoolKey = Tuple[str, str, Tuple[Tuple[str, Any], ...]]
+
+
+class DatasetPool:
+    """Thread-safe pool of open rasterio datasets, keyed by path, file
+    signature and open options.
+
+    Handles are checked out exclusively, so a dataset is never shared between
+    two threads at the same time. Idle handles are kept in LRU order, bounded
+    by `max_size`, and closed after `idle_timeout` seconds without use.
+    """
+
+    def __init__(self, max_size: int, idle_timeout: float):
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self._lock = threading.Lock()
+        self._serial = count()
+        self._idle: OrderedDict[
+            int, Tuple[PoolKey, DatasetReader, float]
+        ] = OrderedDict()
+        self._idle_by_key: dict[PoolKey, list[int]] = {}
+        self._in_use = 0
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._expirations = 0
+
+    @contextmanager
+    def open(self, path: str, **options: Any) -> Iterator[DatasetReader]:
+        # Files rewritten in place get a new signature, so that handles of
+        # the old file are never reused
+        key: PoolKey = (path, file_signature(path), tuple(sorted(options.items())))
+        src = self._checkout(key)
+        if src is None:
+            src = rasterio.open(path, **options)
+        with self._lock:
+            self._in_use += 1
+        try:
+            yield src
+        except BaseException:
+            # The handle might be left in an inconsistent state, do not reuse it
+            src.close()
+            raise
+        else:
+            self._checkin(key, src)
+        finally:
+            with self._lock:
+                self._in_use -= 1
+
+    def clear(self) -> None:
+        with self._lock:
+            idle = [src for _, src, _ in self._idle.values()]
+            self._idle.clear()
+            self._idle_by_key.clear()
+        for src in idle:
+            src.close()
+
+    def info(self) -> dict[str, Any]:
+        with self._lock:
+            return {
+                "hits": self._hits,
+                "misses": self._misses,
+                "evictions": self._evictions,
+                "expirations": self._expirations,
+                "idle": len(self._idle),
+                "in_use": self._in_use,
+                "max_size": self.max_size,
+            }
+
+    def _checkout(self, key: PoolKey) -> DatasetReader | None:
+        with self._lock:
+            stale = self._pop_expired(time.monotonic())
+            serials = self._idle_by_key.get(key)
+            src = None
+            if serials:
+                # Prefer the most recently used handle, its blocks are more
+                # likely to still be in GDAL's cache.
+                serial = serials.pop()
+                if not serials:
+                    del self._idle_by_key[key]
+                _, src, _ = self._idle.pop(serial)
+                self._hits += 1
+            else:
+                self._misses += 1
+        for old_src in stale:
+            old_src.close()
+        return src
+
+    def _checkin(self, key: PoolKey, src: DatasetReader) -> None:
+        if src.closed:
+            return
+        with self._lock:
+            now = time.monotonic()
+            stale = self._pop_expired(now)
+            serial = next(self._serial)
+            self._idle[serial] = (key, src, now)
+            self._idle_by_key.setdefault(key, []).append(serial)
+            while len(self._idle) > self.max_size:
+                stale.append(self._pop_oldest())
+                self._evictions += 1
+        for old_src in stale:
+            old_src.close()
+
+    def _pop_expired(self, now: float) -> list[DatasetReader]:
+        expired = []
+        while self._idle:
+            _, (_, _, last_used) = next(iter(self._idle.items()))
+            if now - last_used < self.idle_timeout:
+                break
+            expired.append(self._pop_oldest())
+            self._expirations += 1
+        return expired
+
+    def _pop_oldest(self) -> DatasetReader:
+        serial, (key, src, _) = self._idle.popitem(last=False)
+        serials = self._idle_by_key[key]
+        serials.remove(serial)
+        if not serials:
+            del self._idle_by_key[key]
+        return src
+
+
+def file_signature(path: str) -> str:
+    # Remote files (URLs, /vsi* paths) can't be stat'ed cheaply, so they are
+    # assumed to be immutable.
+    try:
+        st = os.stat(path)
+    except OSError:
+        return ""
+    return f"{st.st_mtime_ns}-{st.st_size}"
+
+
+dataset_pool = DatasetPool(
+    max_size=settings.dataset_pool_max_size,
+    idle_timeout=settings.dataset_pool_idle_timeout,
+)
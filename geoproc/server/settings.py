@@ -0,0 +1,44 @@
+import os
+import tempfile
+from typing import Literal, Optional
+
+from pydantic import BaseSettings
+
+
+class Settings(BaseSettings):
+    dataset_pool_max_size: int = 64
+    dataset_pool_idle_timeout: float = 300.0
+    raster_info_cache_size: int = 1024
+    raster_info_cache_ttl: Optional[int] = 7 * 24 * 60 * 60
+    info_workers: int = 8
+    map_cache_size: int = 1024
+    tile_cache_size: int = 4096
+    tile_cache_max_bytes: int = 256 * 2**20
+    tile_cache_ttl: Optional[int] = 7 * 24 * 60 * 60
+    tile_workers: int = 4
+    tile_queue_size: int = 64
+    tile_executor: Literal["thread", "process"] = "thread"
+    tile_metatile_size: int = 1
+    overview_dir: str = os.path.join(tempfile.gettempdir(), "geoproc", "overviews")
+    statistics_cache_size: int = 256
+    statistics_cache_ttl: Optional[int] = 7 * 24 * 60 * 60
+    statistics_max_bins: int = 1024
+    sample_block_size: int = 256
+    # Maximum size of the body of an /array response (data and mask)
+    array_max_bytes: int = 256 * 2**20
+    # Maximum size of the largest side of previews and statistics grids
+    max_image_size: int = 4096
+    export_tile_size: int = 2**15
+    export_tile_retries: int = 2
+    export_checkpoint_interval: int = 16
+    job_workers: int = 2
+    # Maximum number of workers a single request can ask for
+    max_workers: int = 8
+    job_ttl: float = 24 * 60 * 60
+    seed_max_tiles: int = 2**20
+
+    class Config:
+        env_prefix = "geoproc_"
+
+
+settings = Settings()
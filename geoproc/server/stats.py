@@ -0,0 +1,188 @@
+from __future__ import annotations
+
+import math
+from typing import Optional, Sequence
+
+import numpy as np
+import numpy.typing as npt
+from rio_tiler.models import BandStatistics
+
+# Number of bins of the histogram used to estimate percentiles
+HISTOGRAM_BINS = 1024
+
+# Distinct values of a band counted exactly, before falling back to the
+# histogram
+MAX_UNIQUE_VALUES = 4096
+
+
+class BandAccumulator:
+    """Mergeable accumulator of the statistics of a band.
+
+    Accumulators are built from the valid values of a window and merged
+    together, so statistics can be computed window by window (and windows
+    read in parallel). Count, sum, mean, standard deviation, min and max are
+    exact. Median, percentiles, majority, minority and unique values are
+    exact while the band has at most MAX_UNIQUE_VALUES distinct values, and
+    estimated from a histogram of HISTOGRAM_BINS bins otherwise.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.masked = 0
+        self.sum = 0.0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+        self.values: Optional[dict[float, int]] = {}
+        self.hist_counts: Optional[npt.NDArray] = None
+        self.hist_edges: Optional[npt.NDArray] = None
+
+    @classmethod
+    def from_values(cls, values: npt.NDArray, masked: int = 0) -> BandAccumulator:
+        acc = cls()
+        acc.masked = masked
+        if not values.size:
+            return acc
+
+        values = values.astype(np.float64)
+        acc.count = values.size
+        acc.sum = float(values.sum())
+        acc.mean = float(values.mean())
+        acc.m2 = float(((values - acc.mean) ** 2).sum())
+        acc.min = float(values.min())
+        acc.max = float(values.max())
+
+        keys, counts = np.unique(values, return_counts=True)
+        if keys.size <= MAX_UNIQUE_VALUES:
+            acc.values = dict(zip(keys.tolist(), counts.tolist()))
+        else:
+            acc.values = None
+        acc.hist_counts, acc.hist_edges = np.histogram(values, bins=HISTOGRAM_BINS)
+        return acc
+
+    def merge(self, other: BandAccumulator) -> None:
+        self.masked += other.masked
+        if not other.count:
+            return
+
+        # Parallel variance algorithm, from Chan et al.
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        self.mean += delta * other.count / count
+        self.m2 += other.m2 + delta**2 * self.count * other.count / count
+        self.count = count
+        self.sum += other.sum
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+        if self.values is None or other.values is None:
+            self.values = None
+        else:
+            for value, n in other.values.items():
+                self.values[value] = self.values.get(value, 0) + n
+            if len(self.values) > MAX_UNIQUE_VALUES:
+                self.values = None
+
+        if self.hist_counts is None:
+            self.hist_counts, self.hist_edges = other.hist_counts, other.hist_edges
+        else:
+            assert self.hist_edges is not None and other.hist_edges is not None
+            edges = np.linspace(
+                min(self.hist_edges[0], other.hist_edges[0]),
+                max(self.hist_edges[-1], other.hist_edges[-1]),
+                HISTOGRAM_BINS + 1,
+            )
+            self.hist_counts = _rebin(
+                self.hist_counts, self.hist_edges, edges
+            ) + _rebin(other.hist_counts, other.hist_edges, edges)
+            self.hist_edges = edges
+
+    def result(
+        self, bins: int = 10, percentiles: Sequence[int] = (2, 98)
+    ) -> BandStatistics:
+        total = self.count + self.masked
+        stats = {
+            "count": float(self.count),
+            "valid_pixels": float(self.count),
+            "masked_pixels": float(self.masked),
+            "valid_percent": round(self.count / total * 100, 2) if total else 0.0,
+        }
+        if not self.count:
+            nan = float("nan")
+            stats.update(
+                {k: nan for k in ("min", "max", "mean", "sum", "std", "median")},
+                majority=nan,
+                minority=nan,
+                unique=0.0,
+                histogram=[[], []],
+                **{f"percentile_{int(p)}": nan for p in percentiles},
+            )
+            return BandStatistics(**stats)
+
+        if self.values is not None:
+            keys = np.array(sorted(self.values))
+            counts = np.array([self.values[k] for k in keys])
+            quantile = lambda q: _exact_quantile(keys, counts, q)  # noqa: E731
+            majority = keys[counts.argmax()]
+            minority = keys[counts.argmin()]
+            unique = keys.size
+            hist_counts, hist_edges = np.histogram(keys, bins=bins, weights=counts)
+        else:
+            assert self.hist_counts is not None and self.hist_edges is not None
+            centers = (self.hist_edges[:-1] + self.hist_edges[1:]) / 2
+            nonzero = self.hist_counts > 0
+            quantile = lambda q: _histogram_quantile(  # noqa: E731
+                self.hist_counts, self.hist_edges, q
+            )
+            majority = centers[self.hist_counts.argmax()]
+            minority = centers[nonzero][self.hist_counts[nonzero].argmin()]
+            unique = int(nonzero.sum())
+            hist_counts, hist_edges = np.histogram(
+                centers,
+                bins=bins,
+                range=(self.min, self.max),
+                weights=self.hist_counts,
+            )
+
+        stats.update(
+            min=self.min,
+            max=self.max,
+            mean=self.mean,
+            sum=self.sum,
+            std=math.sqrt(self.m2 / self.count),
+            median=quantile(0.5),
+            majority=float(majority),
+            minority=float(minority),
+            unique=float(unique),
+            histogram=[hist_counts.astype(int).tolist(), hist_edges.tolist()],
+            **{f"percentile_{int(p)}": quantile(p / 100) for p in percentiles},
+        )
+        return BandStatistics(**stats)
+
+
+def _rebin(counts: npt.NDArray, edges: npt.NDArray, new_edges: npt.NDArray):
+    if np.array_equal(edges, new_edges):
+        return counts
+    centers = (edges[:-1] + edges[1:]) / 2
+    return np.histogram(centers, bins=new_edges, weights=counts)[0]
+
+
+def _exact_quantile(keys: npt.NDArray, counts: npt.NDArray, q: float) -> float:
+    # Same as np.quantile (linear interpolation) over the repeated values
+    cumsum = np.cumsum(counts)
+    rank = q * (cumsum[-1] - 1)
+    lower, upper = math.floor(rank), math.ceil(rank)
+    lower_value = keys[np.searchsorted(cumsum, lower, side="right")]
+    upper_value = keys[np.searchsorted(cumsum, upper, side="right")]
+    return float(lower_value + (upper_value - lower_value) * (rank - lower))
+
+
+def _histogram_quantile(counts: npt.NDArray, edges: npt.NDArray, q: float) -> float:
+    # Interpolate linearly within the bin that contains the quantile
+    cumsum = np.cumsum(counts)
+    target = q * cumsum[-1]
+    i = min(int(np.searchsorted(cumsum, target)), counts.size - 1)
+    before = cumsum[i - 1] if i else 0
+    fraction = (target - before) / counts[i] if counts[i] else 0
+    return float(edges[i] + (edges[i + 1] - edges[i]) * fraction)
@@ -0,0 +1,153 @@
+from __future__ import annotations
+
+import functools
+import json
+from typing import Optional, Tuple
+
+from rio_tiler.constants import WEB_MERCATOR_TMS
+from rio_tiler.errors import TileOutsideBounds
+from rio_tiler.models import ImageData
+from rio_tiler.profiles import img_profiles
+
+from geoproc.models import VisualizationParams
+from geoproc.server.image import Image, ImageReader
+from geoproc.server.image import eval_image as _eval_image
+from geoproc.server.overviews import get_overview, overview_tile
+from geoproc.types import Number, SingleOrRGBList
+
+
+class InvalidVisParams(Exception):
+    """Raised when visualization parameters do not apply to an image."""
+
+
+def expand_scale_range(
+    min_max: tuple[SingleOrRGBList, SingleOrRGBList], count: int
+) -> list[tuple[Number, Number]]:
+    min_v, max_v = min_max
+    min_v = [min_v] * count if not isinstance(min_v, tuple) else min_v
+    max_v = [max_v] * count if not isinstance(max_v, tuple) else max_v
+    return list(zip(min_v, max_v))[:count]
+
+
+@functools.lru_cache(maxsize=64, typed=False)
+def eval_image(image_json: str) -> Image:
+    image_dict = json.loads(image_json)
+    return _eval_image(image_dict)
+
+
+def render_tile(
+    image_json: str, vis_params: VisualizationParams, z: int, x: int, y: int
+) -> bytes:
+    """Render a tile of an image as PNG.
+
+    Returns empty bytes if there is no tile to render, and raises
+    InvalidVisParams on invalid visualization parameters.
+    """
+    image = eval_image(image_json)
+    indexes = _band_indexes(image, vis_params)
+
+    try:
+        # Workaround: Read tiles of a lower zoom level than the minimum zoom
+        # level of Image from a (lazily built) overview, to avoid performance
+        # issue with WarpedVRT.
+        # See issue https://github.com/cogeotiff/rio-tiler/issues/348
+        if image.min_zoom and z < image.min_zoom:
+            path = get_overview(image_json, image)
+            img = overview_tile(path, x, y, z, indexes=indexes)
+        else:
+            with ImageReader(image) as src:
+                img = src.tile(x, y, z, indexes=indexes)
+    except TileOutsideBounds:
+        return b""
+
+    return _render(img, vis_params)
+
+
+def render_metatile(
+    image_json: str,
+    vis_params: VisualizationParams,
+    z: int,
+    x: int,
+    y: int,
+    size: int,
+) -> dict[Tuple[int, int], bytes]:
+    """Render all tiles of the metatile of `size` x `size` tiles containing a tile.
+
+    Returns the PNG of each tile by (x, y), with empty bytes for tiles that
+    have nothing to render.
+    """
+    image = eval_image(image_json)
+
+    matrix = WEB_MERCATOR_TMS.matrix(z)
+    min_x, min_y = x // size * size, y // size * size
+    empty = {
+        (tx, ty): b""
+        for tx in range(min_x, min(min_x + size, matrix.matrixWidth))
+        for ty in range(min_y, min(min_y + size, matrix.matrixHeight))
+    }
+
+    # Tiles of low zoom levels are read from an overview, see `render_tile`
+    if image.min_zoom and z < image.min_zoom:
+        return {
+            (tile_x, tile_y): render_tile(image_json, vis_params, z, tile_x, tile_y)
+            for tile_x, tile_y in empty
+        }
+
+    indexes = _band_indexes(image, vis_params)
+    try:
+        with ImageReader(image) as src:
+            tiles = src.metatile(x, y, z, size, indexes=indexes)
+    except TileOutsideBounds:
+        return empty
+
+    return {
+        **empty,
+        **{(t.x, t.y): _render(img, vis_params) for t, img in tiles.items()},
+    }
+
+
+def render_preview(
+    image_json: str, vis_params: VisualizationParams, max_size: int
+) -> bytes:
+    """Render the whole image as PNG, with at most `max_size` pixels on its
+    largest side.
+
+    Raises InvalidVisParams on invalid visualization parameters, and RuntimeError
+    if the image is boundless.
+    """
+    image = eval_image(image_json)
+    indexes = _band_indexes(image, vis_params)
+    with ImageReader(image) as src:
+        img = src.preview(indexes=indexes, max_size=max_size)
+    return _render(img, vis_params)
+
+
+def _band_indexes(image: Image, vis_params: VisualizationParams) -> Optional[list[int]]:
+    # Select bands. Selection is pushed down to the readers, so that only
+    # the bands that are going to be rendered are read.
+    if not vis_params.bands:
+        return None
+    band_names = [b.lower() for b in image.band_names]
+    invalid_names = [b for b in vis_params.bands if b not in band_names]
+    if invalid_names:
+        raise InvalidVisParams(f"Invalid band names: {invalid_names}")
+    return [band_names.index(b) for b in vis_params.bands]
+
+
+def _render(img: ImageData, vis_params: VisualizationParams) -> bytes:
+    # Rescale using min and max
+    if vis_params.min is not None and vis_params.max is not None:
+        for value in (vis_params.min, vis_params.max):
+            if isinstance(value, tuple) and len(value) < img.count:
+                raise InvalidVisParams(
+                    f"min and max must have a value for each of the {img.count} bands"
+                )
+        in_range = expand_scale_range((vis_params.min, vis_params.max), img.count)
+        out_range = expand_scale_range((0, 255), img.count)
+        img.rescale(in_range=in_range, out_range=out_range)
+
+    if vis_params.opacity < 1.0:
+        img.mask *= round((1 - vis_params.opacity) * 255)
+
+    profile = img_profiles.get("png") or {}
+    return img.render(img_format="PNG", **profile)
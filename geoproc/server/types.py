@@ -1,7 +1,7 @@
-from typing import Callable
+from typing import Callable, Optional, Sequence
 
 from rio_tiler.constants import CRS
 from rio_tiler.models import ImageData
 from rio_tiler.types import BBox
 
-PartCallable = Callable[[BBox, CRS, int, int], ImageData]
+PartCallable = Callable[[BBox, CRS, int, int, Optional[Sequence[int]]], ImageData]
@@ -0,0 +1,22 @@
+import numpy as np
+import pytest
+import rasterio
+from rasterio.transform import from_bounds
+
+
+@pytest.fixture
+def raster_path(tmp_path):
+    path = str(tmp_path / "raster.tif")
+    data = np.arange(3 * 64 * 64, dtype=np.uint16).reshape(3, 64, 64) % 1000
+    profile = dict(
+        driver="GTiff",
+        height=64,
+        width=64,
+        count=3,
+        dtype="uint16",
+        crs="epsg:4326",
+        transform=from_bounds(-60.0, -35.0, -59.0, -34.0, 64, 64),
+    )
+    with rasterio.open(path, "w", **profile) as dst:
+        dst.write(data)
+    return path
@@ -0,0 +1,477 @@
+import asyncio
+import importlib
+import json
+import os
+import time
+
+import numpy as np
+import pytest
+import rasterio
+from fastapi.testclient import TestClient
+from rio_tiler.constants import WEB_MERCATOR_TMS
+
+from geoproc.server.executor import BoundedExecutor, Overloaded
+from geoproc.server.models import MapDefinition
+
+app_module = importlib.import_module("geoproc.server.app")
+
+
+@pytest.fixture
+def client():
+    return TestClient(app_module.app)
+
+
+@pytest.fixture
+def tile_url(raster_path, monkeypatch):
+    image_json = json.dumps({"name": "load", "args": [raster_path]})
+    monkeypatch.setattr(app_module.map_cache, "async_redis", None)
+    monkeypatch.setattr(app_module.tile_cache, "async_redis", None)
+    monkeypatch.setattr(app_module.tile_cache, "redis", None)
+    app_module.tile_cache.local.clear()
+    app_module.map_cache.local.set("map", MapDefinition(image_json=image_json))
+
+    z = app_module.eval_image(image_json).max_zoom
+    tile = WEB_MERCATOR_TMS.tile(-59.5, -34.5, z)
+    return f"/tiles/map/{z}/{tile.x}/{tile.y}.png"
+
+
+def test_create_map(client, monkeypatch, mocker):
+    async_redis = mocker.AsyncMock()
+    monkeypatch.setattr(app_module, "async_redis", async_redis)
+    monkeypatch.setattr(app_module.map_cache, "async_redis", async_redis)
+
+    r = client.post(
+        "/map",
+        json={
+            "image_graph": {"name": "load", "args": ["raster.tif"]},
+            "vis_params": {"bands": ["B1"], "min": 0, "max": 100},
+        },
+    )
+
+    assert r.status_code == 200
+    id = r.json()["detail"]["id"]
+    key, body = async_redis.set.call_args.args
+    assert key == f"map_defs:{id}"
+    assert MapDefinition.parse_raw(body).vis_params.bands == ["b1"]
+    assert asyncio.run(app_module.get_map(id)).vis_params.bands == ["b1"]
+    async_redis.get.assert_not_called()
+
+
+def test_identical_maps_share_id(client, monkeypatch, mocker):
+    async_redis = mocker.AsyncMock()
+    monkeypatch.setattr(app_module, "async_redis", async_redis)
+    monkeypatch.setattr(app_module.map_cache, "async_redis", async_redis)
+    app_module.map_cache.local.clear()
+
+    def create_map(image_graph, vis_params):
+        r = client.post(
+            "/map", json={"image_graph": image_graph, "vis_params": vis_params}
+        )
+        return r.json()["detail"]["id"]
+
+    graph = {"name": "load", "args": ["raster.tif"]}
+    id = create_map(graph, {"bands": ["B1"]})
+
+    assert create_map({"args": ["raster.tif"], "name": "load"}, {"bands": ["b1"]}) == id
+    assert create_map(graph, {"bands": ["B2"]}) != id
+    assert async_redis.set.call_count == 3
+
+
+def test_map_id_changes_when_source_is_rewritten(client, raster_path, mocker):
+    async_redis = mocker.AsyncMock()
+    mocker.patch.object(app_module, "async_redis", async_redis)
+
+    def create_map():
+        r = client.post(
+            "/map",
+            json={
+                "image_graph": {"name": "load", "args": [raster_path]},
+                "vis_params": {},
+            },
+        )
+        return r.json()["detail"]["id"]
+
+    id = create_map()
+    stat = os.stat(raster_path)
+    os.utime(raster_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+
+    assert create_map() != id
+
+
+def test_legacy_maps_are_still_found(monkeypatch, mocker):
+    async_redis = mocker.AsyncMock()
+    async_redis.get.return_value = None
+    async_redis.mget.return_value = [
+        json.dumps({"name": "load", "args": ["raster.tif"]}).encode(),
+        json.dumps({"bands": ["b1"], "min": 0, "max": 100}).encode(),
+    ]
+    monkeypatch.setattr(app_module.map_cache, "async_redis", async_redis)
+    app_module.map_cache.local.clear()
+
+    map_def = asyncio.run(app_module.get_map("legacy-uuid"))
+
+    assert json.loads(map_def.image_json) == {"name": "load", "args": ["raster.tif"]}
+    assert map_def.vis_params.bands == ["b1"]
+    async_redis.mget.assert_called_once_with(
+        "maps:legacy-uuid", "vis_params:legacy-uuid"
+    )
+
+    async_redis.mget.return_value = [None, None]
+    assert asyncio.run(app_module.get_map("missing")) is None
+
+
+def test_tile_is_rendered_once(client, tile_url, mocker):
+    render_tile = mocker.spy(app_module, "render_tile")
+
+    r1 = client.get(tile_url)
+    r2 = client.get(tile_url)
+
+    assert r1.status_code == r2.status_code == 200
+    assert r1.headers["content-type"] == "image/png"
+    assert r1.content == r2.content
+    assert render_tile.call_count == 1
+
+
+def test_tile_siblings_are_rendered_as_metatile(client, tile_url, monkeypatch, mocker):
+    monkeypatch.setattr(app_module.settings, "tile_metatile_size", 2)
+    render_metatile = mocker.spy(app_module, "render_metatile")
+    _, _, _, z, x, y = tile_url.removesuffix(".png").split("/")
+    z, x, y = int(z), int(x), int(y)
+    sibling_url = f"/tiles/map/{z}/{x ^ 1}/{y ^ 1}.png"
+
+    assert client.get(tile_url).status_code == 200
+    assert client.get(sibling_url).status_code in (200, 204)
+    assert render_metatile.call_count == 1
+    assert not app_module._metatile_tasks
+
+
+def test_low_zoom_tiles_are_read_from_overview(
+    client, tile_url, raster_path, tmp_path, monkeypatch
+):
+    monkeypatch.setattr(app_module.settings, "overview_dir", str(tmp_path / "ovr"))
+    image = app_module.eval_image(json.dumps({"name": "load", "args": [raster_path]}))
+    z = image.min_zoom - 2
+    tile = WEB_MERCATOR_TMS.tile(-59.5, -34.5, z)
+    url = f"/tiles/map/{z}/{tile.x}/{tile.y}.png"
+
+    r = client.get(url)
+
+    assert r.status_code == 200
+    assert r.headers["content-type"] == "image/png"
+    overviews = [name for name in os.listdir(tmp_path / "ovr") if name.endswith(".tif")]
+    assert len(overviews) == 1
+
+    # Rewriting a source builds a new overview, as a single file
+    stat = os.stat(raster_path)
+    os.utime(raster_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    monkeypatch.setattr(app_module.settings, "export_tile_size", 16)
+    app_module.tile_cache.local.clear()
+
+    assert client.get(url).status_code == 200
+    overviews = [name for name in os.listdir(tmp_path / "ovr") if name.endswith(".tif")]
+    assert len(overviews) == 2
+    with rasterio.open(tmp_path / "ovr" / overviews[0]) as src:
+        assert max(src.width, src.height) > 16
+
+
+def test_tile_revalidation_with_etag(client, tile_url, mocker):
+    etag = client.get(tile_url).headers["etag"]
+    render_tile = mocker.spy(app_module, "render_tile")
+
+    r = client.get(tile_url, headers={"If-None-Match": etag})
+
+    assert r.status_code == 304
+    assert r.headers["etag"] == etag
+    assert not r.content
+    assert render_tile.call_count == 0
+    assert client.get(tile_url, headers={"If-None-Match": '"other"'}).status_code == 200
+
+
+def test_tile_wildcard_etag_requires_existing_map(client, tile_url):
+    r = client.get(tile_url, headers={"If-None-Match": "*"})
+    assert r.status_code == 304
+
+    r = client.get("/tiles/missing/0/0/0.png", headers={"If-None-Match": "*"})
+    assert r.status_code == 404
+
+
+def test_tile_sheds_load_when_overloaded(client, tile_url, monkeypatch):
+    executor = BoundedExecutor(1, 0)
+
+    async def run(fn, *args):
+        raise Overloaded()
+
+    monkeypatch.setattr(executor, "run", run)
+    monkeypatch.setattr(app_module, "tile_executor", executor)
+
+    r = client.get(tile_url)
+
+    assert r.status_code == 503
+    assert r.headers["retry-after"] == "1"
+
+
+def test_statistics_are_cached(client, raster_path, monkeypatch, mocker):
+    async_redis = mocker.AsyncMock()
+    async_redis.get.return_value = None
+    monkeypatch.setattr(app_module.statistics_cache, "async_redis", async_redis)
+    app_module.statistics_cache.local.clear()
+    compute = mocker.spy(app_module, "_statistics")
+    req = {"image": {"name": "load", "args": [raster_path]}, "max_size": 32}
+
+    r1 = client.post("/statistics", json=req)
+    r2 = client.post("/statistics", json={**req, "workers": 2})
+
+    assert r1.status_code == r2.status_code == 200
+    assert r1.json() == r2.json()
+    assert set(r1.json()["detail"]) == {"B1", "B2", "B3"}
+    assert compute.call_count == 1
+    assert async_redis.get.call_count == async_redis.set.call_count == 1
+
+    # Rewriting the source invalidates cached statistics
+    stat = os.stat(raster_path)
+    os.utime(raster_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    assert client.post("/statistics", json=req).status_code == 200
+    assert compute.call_count == 2
+
+
+def test_batch_info(client, raster_path):
+    image = {"name": "load", "args": [raster_path]}
+    r = client.post(
+        "/info/batch",
+        json=[image, {"name": "__add__", "args": [image, 1]}, {"name": "nope"}],
+    )
+
+    assert r.status_code == 200
+    items = r.json()["detail"]
+    assert [item["status"] for item in items] == [200, 200, 400]
+    assert items[0]["detail"] == client.post("/info", json=image).json()["detail"]
+    assert items[1]["detail"]["band_names"] == ["B1", "B2", "B3"]
+
+
+def test_array_returns_raw_values_and_mask(client, raster_path):
+    image = {"name": "load", "args": [raster_path]}
+    req = {"image": image, "bounds": [-60, -35, -59, -34], "width": 64, "height": 64}
+
+    for compress in (False, True):
+        r = client.post("/array", json={**req, "bands": ["b2"], "compress": compress})
+
+        assert r.status_code == 200
+        assert r.headers["x-array-shape"] == "1,64,64"
+        assert json.loads(r.headers["x-array-band-names"]) == ["B2"]
+        dtype = np.dtype(r.headers["x-array-dtype"])
+        data = np.frombuffer(r.content, dtype=dtype, count=64 * 64)
+        mask = np.frombuffer(r.content, dtype=np.uint8, offset=data.nbytes)
+        with rasterio.open(raster_path) as src:
+            np.testing.assert_array_equal(data.reshape(64, 64), src.read(2))
+        assert (mask == 255).all()
+
+    assert (
+        client.post("/array", json={"image": image, "tile": [10, 0, 0]}).status_code
+        == 204
+    )
+    assert client.post("/array", json={"image": image}).status_code == 400
+
+
+def test_array_size_is_bounded_in_bytes(client, raster_path, monkeypatch):
+    image = {"name": "load", "args": [raster_path]}
+    req = {"image": image, "bounds": [-60, -35, -59, -34], "width": 64, "height": 64}
+    # A uint16 band and the mask
+    monkeypatch.setattr(app_module.settings, "array_max_bytes", 64 * 64 * 3)
+
+    assert client.post("/array", json={**req, "bands": ["b1"]}).status_code == 200
+    r = client.post("/array", json=req)
+    assert r.status_code == 400
+    assert "too large" in r.json()["detail"]
+
+    for params in [{"width": -4}, {"height": 0}, {"tile": [0, 0, 0], "tilesize": -1}]:
+        assert client.post("/array", json={**req, **params}).status_code == 400
+
+
+def test_preview(client, raster_path):
+    image = {"name": "load", "args": [raster_path]}
+
+    r = client.post("/preview", json={"image": image, "max_size": 32})
+
+    assert r.status_code == 200
+    assert r.headers["content-type"] == "image/png"
+    with rasterio.MemoryFile(r.content) as memfile:
+        with memfile.open() as src:
+            assert max(src.width, src.height) == 32
+
+    r = client.post("/preview", json={"image": {"name": "constant", "args": [1]}})
+    assert r.status_code == 400
+
+
+def test_invalid_vis_params_are_bad_requests(client, raster_path, tile_url):
+    image = {"name": "load", "args": [raster_path]}
+    vis_params = {"bands": ["b9"]}
+
+    r = client.post("/preview", json={"image": image, "vis_params": vis_params})
+    assert r.status_code == 400
+    assert "Invalid band names" in r.json()["detail"]
+
+    image_json = json.dumps({"name": "load", "args": [raster_path]})
+    app_module.map_cache.local.set(
+        "map", MapDefinition(image_json=image_json, vis_params=vis_params)
+    )
+    r = client.get(tile_url)
+    assert r.status_code == 400
+    assert "Invalid band names" in r.json()["detail"]
+
+
+def test_tile_does_not_leak_internal_errors(client, tile_url, monkeypatch):
+    def render_tile(*args):
+        raise ValueError("internal")
+
+    monkeypatch.setattr(app_module.settings, "tile_metatile_size", 1)
+    monkeypatch.setattr(app_module, "render_tile", render_tile)
+
+    with pytest.raises(ValueError):
+        client.get(tile_url)
+
+
+def test_requests_reject_too_large_images(client, raster_path):
+    image = {"name": "load", "args": [raster_path]}
+    max_size = app_module.settings.max_image_size + 1
+
+    r = client.post("/preview", json={"image": image, "max_size": max_size})
+    assert r.status_code == 400
+    r = client.post("/statistics", json={"image": image, "max_size": max_size})
+    assert r.status_code == 400
+
+
+def test_statistics_reject_invalid_bins_and_percentiles(client, raster_path):
+    image = {"name": "load", "args": [raster_path]}
+
+    for params in [
+        {"percentiles": [150]},
+        {"percentiles": [-1]},
+        {"bins": 0},
+        {"bins": app_module.settings.statistics_max_bins + 1},
+    ]:
+        r = client.post("/statistics", json={"image": image, **params})
+        assert r.status_code == 400
+
+
+def test_requests_reject_too_many_workers(client, raster_path):
+    image = {"name": "load", "args": [raster_path]}
+
+    for workers in (0, app_module.settings.max_workers + 1):
+        r = client.post("/statistics", json={"image": image, "workers": workers})
+        assert r.status_code == 400
+
+
+def test_sample_points(client, raster_path):
+    r = client.post(
+        "/sample",
+        json={
+            "image": {"name": "load", "args": [raster_path]},
+            "coordinates": [[-59.5, -34.5], [0, 0]],
+        },
+    )
+
+    assert r.status_code == 200
+    values = r.json()["detail"]
+    assert list(values) == ["B1", "B2", "B3"]
+    assert values["B1"][0] is not None
+    assert values["B1"][1] is None
+
+
+def wait_job(client, job_id):
+    for _ in range(100):
+        job = client.get(f"/jobs/{job_id}").json()["detail"]
+        if job["status"] in ("done", "failed", "cancelled"):
+            return job
+        time.sleep(0.05)
+    return job
+
+
+def test_seed_job(client, tile_url, mocker):
+    z = int(tile_url.split("/")[3])
+    seed = {"map_id": "map", "min_zoom": z - 2, "max_zoom": z, "workers": 2}
+    job = wait_job(client, client.post("/jobs/seed", json=seed).json()["detail"]["id"])
+
+    assert job["status"] == "done"
+    assert job["done"] == job["total"] == job["result"]["tiles"]
+    assert job["result"]["rendered"] == job["result"]["tiles"]
+
+    render_tile = mocker.spy(app_module, "render_tile")
+    assert client.get(tile_url).status_code == 200
+    assert render_tile.call_count == 0
+
+    job = wait_job(client, client.post("/jobs/seed", json=seed).json()["detail"]["id"])
+    assert job["result"]["rendered"] == 0
+
+
+def test_seed_rejects_too_many_tiles(client, tile_url, monkeypatch):
+    z = int(tile_url.split("/")[3])
+    seed = {"map_id": "map", "min_zoom": z - 2, "max_zoom": z}
+    # At least one tile per zoom level
+    monkeypatch.setattr(app_module.settings, "seed_max_tiles", 2)
+
+    r = client.post("/jobs/seed", json=seed)
+    assert r.status_code == 400
+    assert "Too many tiles" in r.json()["detail"]
+
+    r = client.post("/jobs/seed", json={**seed, "workers": 0})
+    assert r.status_code == 400
+
+
+def test_count_tiles_matches_listed_tiles():
+    for bounds in [(-60, -35, -59, -34), (170, -10, -170, 10), (-180, -85, 180, 85)]:
+        zooms = range(0, 6)
+        assert app_module._count_tiles(bounds, zooms) == len(
+            list(WEB_MERCATOR_TMS.tiles(*bounds, zooms=zooms))
+        )
+
+
+def test_seed_unknown_map(client):
+    r = client.post("/jobs/seed", json={"map_id": "x", "min_zoom": 0, "max_zoom": 1})
+    assert r.status_code == 404
+
+
+def test_export_job(client, tmp_path, raster_path):
+    path = str(tmp_path / "export.tif")
+    r = client.post(
+        "/jobs/export",
+        json={"image": {"name": "load", "args": [raster_path]}, "path": path},
+    )
+    assert r.status_code == 200
+    job_id = r.json()["detail"]["id"]
+
+    for _ in range(100):
+        job = client.get(f"/jobs/{job_id}").json()["detail"]
+        if job["status"] == "done":
+            break
+        time.sleep(0.05)
+
+    assert job["status"] == "done"
+    assert job["done"] == job["total"] == 1
+    with rasterio.open(path) as src:
+        assert src.count == 3
+
+
+def test_get_unknown_job(client):
+    r = client.get("/jobs/unknown")
+    assert r.status_code == 404
+
+
+def test_zonal_statistics_streams_lines(client, raster_path):
+    ring = [[-59.8, -34.8], [-59.3, -34.8], [-59.3, -34.3], [-59.8, -34.3]]
+    polygon = {"type": "Polygon", "coordinates": [ring + ring[:1]]}
+    features = {
+        "type": "FeatureCollection",
+        "features": [{"type": "Feature", "id": "parcel", "geometry": polygon}],
+    }
+    image = {"name": "load", "args": [raster_path]}
+
+    r = client.post("/zonal-statistics", json={"image": image, "features": features})
+
+    assert r.status_code == 200
+    assert r.headers["content-type"] == "application/x-ndjson"
+    lines = [json.loads(line) for line in r.text.splitlines()]
+    assert [(line["index"], line["id"]) for line in lines] == [(0, "parcel")]
+    assert lines[0]["stats"]["B1"]["count"] > 0
+
+    r = client.post("/zonal-statistics", json={"image": image, "features": polygon})
+    assert r.status_code == 400
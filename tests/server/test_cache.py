@@ -0,0 +1,62 @@
+from redis import ConnectionError
+
+from geoproc.server.cache import LRUCache, TieredCache
+
+
+def test_lru_cache_evicts_least_recently_used():
+    cache = LRUCache(maxsize=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+
+    assert cache.get("a") == 1
+    assert cache.get("b") is None
+    assert cache.get("c") == 3
+    assert cache.info()["currsize"] == 2
+
+
+def test_tiered_cache_reads_through_redis(mocker):
+    redis = mocker.Mock()
+    redis.get.return_value = b"42"
+    cache = TieredCache("test", maxsize=2, dumps=str.encode, loads=bytes.decode)
+    cache.redis = redis
+
+    assert cache.get("key") == "42"
+    assert cache.get("key") == "42"
+    redis.get.assert_called_once_with("test:key")
+
+
+def test_tiered_cache_writes_through_redis(mocker):
+    redis = mocker.Mock()
+    cache = TieredCache(
+        "test", maxsize=2, dumps=str.encode, loads=bytes.decode, ttl=10, redis=redis
+    )
+    cache.set("key", "value")
+
+    redis.set.assert_called_once_with("test:key", b"value", ex=10)
+    assert cache.local.get("key") == "value"
+
+
+def test_tiered_cache_ignores_redis_errors(mocker):
+    redis = mocker.Mock()
+    redis.get.side_effect = ConnectionError
+    redis.set.side_effect = ConnectionError
+    cache = TieredCache(
+        "test", maxsize=2, dumps=str.encode, loads=bytes.decode, redis=redis
+    )
+
+    assert cache.get("key") is None
+    cache.set("key", "value")
+    assert cache.get("key") == "value"
+
+
+def test_lru_cache_evicts_to_fit_maxbytes():
+    cache = LRUCache(maxsize=10, maxbytes=5)
+    cache.set("a", b"123")
+    cache.set("b", b"45")
+    cache.set("c", b"6")
+
+    assert cache.get("a") is None
+    assert cache.get("b") == b"45"
+    assert cache.info()["currbytes"] == 3
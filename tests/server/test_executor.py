@@ -0,0 +1,49 @@
+import asyncio
+import threading
+
+import pytest
+
+from geoproc.server.executor import BoundedExecutor, Overloaded
+
+
+def test_bounded_executor_runs_tasks():
+    executor = BoundedExecutor(2, 0)
+    try:
+        result = asyncio.run(executor.run(sum, [1, 2, 3]))
+    finally:
+        executor.shutdown()
+
+    assert result == 6
+    info = executor.info()
+    assert info["completed"] == 1
+    assert info["pending"] == 0
+    assert info["queue_wait_avg"] >= 0
+
+
+def test_bounded_executor_rejects_tasks_over_queue_size():
+    executor = BoundedExecutor(1, 1)
+    release = threading.Event()
+
+    async def main():
+        tasks = [asyncio.create_task(executor.run(release.wait)) for _ in range(2)]
+        await asyncio.sleep(0)
+        with pytest.raises(Overloaded):
+            await executor.run(release.wait)
+        release.set()
+        await asyncio.gather(*tasks)
+
+    try:
+        asyncio.run(main())
+    finally:
+        executor.shutdown()
+
+    assert executor.info()["rejected"] == 1
+    assert executor.info()["completed"] == 2
+
+
+def test_bounded_executor_in_process_pool():
+    executor = BoundedExecutor(1, 0, executor="process")
+    try:
+        assert asyncio.run(executor.run(max, 1, 3, 2)) == 3
+    finally:
+        executor.shutdown()
@@ -1,4 +1,24 @@
-from geoproc.server.image import eval_image, Image
+import os
+
+import numpy as np
+import pytest
+import rasterio
+from rasterio.coords import BoundingBox
+from rasterio.crs import CRS
+from rio_tiler.models import ImageData
+
+import geoproc.server.image as image_module
+from geoproc.server.image import (
+    Image,
+    ImageReader,
+    RasterInfo,
+    _compile_expression,
+    eval_image,
+    eval_images,
+    get_raster_info,
+    raster_info_cache,
+    read_windows,
+)
 
 
 def test_image_eval(mocker):
@@ -6,3 +26,568 @@ def test_image_eval(mocker):
     image = eval_image({"args": [42], "name": "constant"})
     assert isinstance(image, Image)
     Image.constant.assert_called_once_with(42)
+
+
+def test_image_load_reads_raster_info_once(mocker, raster_path):
+    raster_info_cache.local.clear()
+    read_raster_info = mocker.spy(image_module, "_read_raster_info")
+
+    image = Image.load(raster_path)
+    Image.load(raster_path)
+
+    read_raster_info.assert_called_once_with(raster_path)
+    assert image.band_names == ["B1", "B2", "B3"]
+    assert image.dtype == "uint16"
+    assert image.bounds == (-60.0, -35.0, -59.0, -34.0)
+    assert image.crs == CRS.from_epsg(4326)
+
+
+def test_raster_info_roundtrip(raster_path):
+    info = get_raster_info(raster_path)
+    assert RasterInfo.loads(info.dumps()) == info
+
+
+def test_raster_info_cache_invalidates_on_file_change(mocker, raster_path):
+    raster_info_cache.local.clear()
+    read_raster_info = mocker.spy(image_module, "_read_raster_info")
+
+    get_raster_info(raster_path)
+    os.utime(raster_path, ns=(0, 0))
+    get_raster_info(raster_path)
+
+    assert read_raster_info.call_count == 2
+
+
+def test_image_eval_shares_identical_subgraphs(mocker, raster_path):
+    load = mocker.spy(Image, "load")
+    a = {"name": "load", "args": [raster_path]}
+    eval_image(
+        {
+            "name": "__truediv__",
+            "args": [
+                {
+                    "name": "__sub__",
+                    "args": [a, {"name": "load", "args": [raster_path]}],
+                },
+                {"name": "__add__", "args": [a, a]},
+            ],
+        }
+    )
+    load.assert_called_once_with(raster_path)
+
+
+def test_image_eval_many_shares_sources(mocker, raster_path, tmp_path):
+    other_path = str(tmp_path / "other.tif")
+    with rasterio.open(raster_path) as src:
+        profile, data = src.profile, src.read()
+    with rasterio.open(other_path, "w", **profile) as dst:
+        dst.write(data)
+    load = mocker.spy(Image, "load")
+    a = {"name": "load", "args": [raster_path]}
+    b = {"name": "load", "args": [other_path]}
+
+    images = eval_images(
+        [
+            {"name": "__add__", "args": [a, b]},
+            {"name": "__mul__", "args": [a, 2]},
+            {"name": "load", "args": [str(tmp_path / "missing.tif")]},
+            b,
+        ],
+        workers=2,
+    )
+
+    assert [type(img) for img in images[:2]] == [Image, Image]
+    assert isinstance(images[2], Exception)
+    assert images[3] is images[0].op[1][1]
+    assert sorted(call.args[0] for call in load.call_args_list) == sorted(
+        [raster_path, other_path, str(tmp_path / "missing.tif")]
+    )
+
+
+def test_image_part_reads_shared_nodes_once(mocker, raster_path):
+    a = {"name": "load", "args": [raster_path]}
+    b = {"name": "select", "args": [a, ["B1"]]}
+    image = eval_image(
+        {
+            "name": "__truediv__",
+            "args": [
+                {"name": "__sub__", "args": [a, b]},
+                {"name": "__add__", "args": [a, b]},
+            ],
+        }
+    )
+    reader_part = mocker.spy(image_module.reader, "part")
+
+    with ImageReader(image) as src:
+        img = src.part((-60.0, -35.0, -59.0, -34.0), height=16, width=16)
+        src.part((-60.0, -35.0, -59.0, -34.0), height=16, width=16)
+
+    assert reader_part.call_count == 2
+    assert img.data.shape == (3, 16, 16)
+
+
+def test_image_select_pushes_band_selection_down(mocker, raster_path):
+    image = Image.load(raster_path).select(["B3", "B1"])
+    reader_part = mocker.spy(image_module.reader, "part")
+
+    with ImageReader(image) as src:
+        img = src.part((-60.0, -35.0, -59.0, -34.0), height=16, width=16)
+
+    assert reader_part.call_args.kwargs["indexes"] == [3, 1]
+    assert img.count == 2
+    assert img.band_names == ["b3", "b1"]
+
+
+def test_image_part_pushes_indexes_through_operators(mocker, raster_path):
+    a = Image.load(raster_path)
+    image = (a + 1) * a.select(["B2"])
+    reader_part = mocker.spy(image_module.reader, "part")
+
+    with ImageReader(image) as src:
+        img = src.part((-60.0, -35.0, -59.0, -34.0), height=16, width=16, indexes=[1])
+
+    assert [c.kwargs["indexes"] for c in reader_part.call_args_list] == [[2]]
+    assert img.count == 1
+
+
+def array_image(data):
+    def _part(bounds, dst_crs, height, width, indexes):
+        band_data = data if indexes is None else data[list(indexes)]
+        return ImageData(band_data, bounds=BoundingBox(*bounds), crs=dst_crs)
+
+    band_names = [f"B{i}" for i in range(1, data.shape[0] + 1)]
+    return Image(_part, dtype=data.dtype, band_names=band_names)
+
+
+def test_image_operators_compile_into_a_single_expression():
+    a = array_image(np.ones((1, 4, 4)))
+    b = array_image(np.ones((1, 4, 4)))
+    image = abs((a - b) / (a + b)) > 0.5
+
+    source, leaves, constants = _compile_expression(*image.op)
+
+    assert source == "(abs(((v0 - v1) / (v0 + v1))) > c0)"
+    assert leaves[0] is a and leaves[1] is b
+    assert constants[0].value == 0.5
+
+
+def test_image_expression_matches_numpy():
+    rng = np.random.default_rng(0)
+    a_data = rng.integers(1, 100, (2, 8, 8)).astype(np.uint16)
+    b_data = rng.integers(1, 100, (1, 8, 8)).astype(np.uint16)
+    a, b = array_image(a_data), array_image(b_data)
+
+    with ImageReader((a - b) / (a + b) * 2 >= b // a) as src:
+        img = src.part((-60.0, -35.0, -59.0, -34.0), height=8, width=8)
+
+    a_float, b_float = a_data.astype(np.float64), b_data.astype(np.float64)
+    expected = (a_float - b_float) / (a_float + b_float) * 2 >= b_data // a_data
+    np.testing.assert_array_equal(img.data, expected)
+    assert img.mask.shape == (8, 8)
+
+
+def test_image_operators_infer_result_dtype():
+    a = array_image(np.ones((1, 4, 4), dtype=np.uint16))
+    b = array_image(np.ones((1, 4, 4), dtype=np.int32))
+
+    assert (a + a).dtype == np.uint32
+    assert (a - a).dtype == np.int32
+    assert (a + b).dtype == np.int64
+    assert (a * 0.0001).dtype == np.float32
+    assert (a / a).dtype == np.float32
+    assert (b / a).dtype == np.float64
+    assert (a > b).dtype == np.uint8
+    assert abs(a).dtype == np.uint16
+
+
+def test_image_integer_operators_do_not_wrap():
+    a = array_image(np.full((1, 2, 2), 100, dtype=np.uint16))
+    b = array_image(np.full((1, 2, 2), 300, dtype=np.uint16))
+    bounds = (-60.0, -35.0, -59.0, -34.0)
+
+    def _read(image):
+        with ImageReader(image) as src:
+            return src.part(bounds, height=2, width=2).data
+
+    assert (_read(a - b) == -200).all()
+    assert (_read(a * 1000) == 100000).all()
+    assert (_read((a - b) * 2) == -400).all()
+    assert (_read((a - b) / 2) == -100).all()
+    assert not _read((a - b) > 0).any()
+
+    # Fused expressions give the same dtype and values as evaluating each
+    # node on its own
+    big = array_image(np.full((1, 2, 2), 2**31 - 1, dtype=np.int32))
+    for fused, inner, outer in [
+        ((a - b) * 2, a - b, lambda d: d * 2),
+        ((a - b) > 0, a - b, lambda d: d > 0),
+        ((a * 1000) - b, a * 1000, lambda d: d - b),
+        ((big * big) + 1, big * big, lambda d: d + 1),
+    ]:
+        unfused = outer(array_image(_read(inner)))
+        assert fused.dtype == unfused.dtype
+        np.testing.assert_array_equal(_read(fused), _read(unfused))
+    assert (_read(big * big) == float(2**31 - 1) ** 2).all()
+
+
+def test_image_compares_integers_with_float_and_large_constants():
+    img = array_image(np.array([[[0, 2], [3, 4]]], dtype=np.uint8))
+    bounds = (-60.0, -35.0, -59.0, -34.0)
+
+    def _read(image):
+        with ImageReader(image) as src:
+            return src.part(bounds, height=2, width=2).data.ravel().tolist()
+
+    assert _read(img < 0.5) == [1, 0, 0, 0]
+    assert _read(img == 2.5) == [0, 0, 0, 0]
+    assert _read(img < 3e9) == [1, 1, 1, 1]
+    assert _read(img < 3_000_000_000) == [1, 1, 1, 1]
+    assert _read((img + 1) > 2.5) == [0, 1, 1, 1]
+
+
+def test_image_expression_evaluates_in_result_dtype():
+    a = array_image(np.full((1, 4, 4), 3, dtype=np.uint16))
+
+    with ImageReader((a * 0.5 + 1) / a) as src:
+        img = src.part((-60.0, -35.0, -59.0, -34.0), height=4, width=4)
+    assert img.data.dtype == np.float32
+
+    with ImageReader(a > 2) as src:
+        img = src.part((-60.0, -35.0, -59.0, -34.0), height=4, width=4)
+    assert img.data.dtype == np.uint8
+    assert img.data.all()
+
+
+def test_image_astype_overrides_precision():
+    a = array_image(np.full((1, 4, 4), 3, dtype=np.int32))
+    image = (a / a).astype("float32")
+    assert image.dtype == np.float32
+
+    with ImageReader(image) as src:
+        img = src.part((-60.0, -35.0, -59.0, -34.0), height=4, width=4)
+    assert img.data.dtype == np.float32
+    np.testing.assert_array_equal(img.data, 1)
+
+
+def test_image_export_infers_dtype(tmp_path, raster_path):
+    path = str(tmp_path / "export.tif")
+    image = Image.load(raster_path) > 500
+
+    image.export(path, scale=5000)
+
+    with rasterio.open(path) as src:
+        assert src.dtypes == ("uint8",) * 3
+
+
+def test_image_constants_are_not_materialized(mocker):
+    a_data = np.arange(16, dtype=np.uint16).reshape(1, 4, 4)
+    a = array_image(a_data)
+    full = mocker.spy(np, "full")
+
+    with ImageReader(a * 0.0001 + 0.1) as src:
+        img = src.part((-60.0, -35.0, -59.0, -34.0), height=4, width=4)
+
+    np.testing.assert_allclose(img.data, a_data * 0.0001 + 0.1, rtol=1e-6)
+    assert all(np.prod(c.args[0]) == 1 for c in full.call_args_list)
+
+
+def test_image_operators_with_constants_keep_image_mask():
+    mask = np.zeros((4, 4), dtype=np.uint8)
+    mask[:2] = 255
+
+    def _part(bounds, dst_crs, height, width, indexes):
+        data = np.ones((1, 4, 4), dtype=np.uint8)
+        return ImageData(data, mask, bounds=BoundingBox(*bounds), crs=dst_crs)
+
+    a = Image(_part, dtype=np.uint8, band_names=["B1"])
+
+    for image in (a + 1, a // 2):
+        with ImageReader(image) as src:
+            img = src.part((-60.0, -35.0, -59.0, -34.0), height=4, width=4)
+        np.testing.assert_array_equal(img.mask, mask)
+
+
+def test_image_folds_constants():
+    image = abs(Image.constant(2) - 3) * Image.constant(0.5)
+    assert image.value == 0.5
+    assert image.dtype == np.float32
+
+    with ImageReader(image) as src:
+        img = src.part((-60.0, -35.0, -59.0, -34.0), height=4, width=4)
+    np.testing.assert_array_equal(img.data, np.full((1, 4, 4), 0.5))
+    np.testing.assert_array_equal(img.mask, 255)
+
+
+def export_windows(image):
+    with ImageReader(image) as src:
+        return list(
+            src.window_and_bounds(
+                bounds=image.bounds,
+                bounds_crs=image.crs,
+                crs=image.crs,
+                scale=500,
+                window_size=64,
+            )
+        )
+
+
+def test_read_windows_in_parallel_keeps_order(raster_path):
+    image = eval_image({"name": "load", "args": [raster_path]}) * 2
+    windows = export_windows(image)
+    assert len(windows) > 1
+
+    serial = list(read_windows(image, windows, image.crs))
+    threaded = list(read_windows(image, windows, image.crs, workers=3))
+
+    assert [win for win, _ in threaded] == [win for win, _ in windows]
+    for (_, expected), (_, img) in zip(serial, threaded):
+        np.testing.assert_array_equal(img.data, expected.data)
+
+
+def test_read_windows_in_process_pool(raster_path):
+    image = eval_image(
+        {"name": "__mul__", "args": [{"name": "load", "args": [raster_path]}, 2]}
+    )
+    windows = export_windows(image)[:3]
+
+    serial = list(read_windows(image, windows, image.crs))
+    processes = list(
+        read_windows(image, windows, image.crs, workers=2, executor="process")
+    )
+
+    for (_, expected), (_, img) in zip(serial, processes):
+        np.testing.assert_array_equal(img.data, expected.data)
+
+
+def test_read_windows_in_process_pool_requires_graph(raster_path):
+    image = Image.load(raster_path)
+
+    with pytest.raises(RuntimeError):
+        list(
+            read_windows(
+                image, export_windows(image), image.crs, workers=2, executor="process"
+            )
+        )
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_export_retiles_oversized_images(raster_path, tmp_path, monkeypatch, workers):
+    image = Image.load(raster_path) * 2
+    single_path = image.export(str(tmp_path / "single.tif"), scale=500)
+    with rasterio.open(single_path) as src:
+        expected = src.read()
+        expected_mask = src.dataset_mask()
+        width, height = src.width, src.height
+
+    monkeypatch.setattr(image_module.settings, "export_tile_size", 64)
+    vrt_path = image.export(str(tmp_path / "tiled.tif"), scale=500, workers=workers)
+
+    assert vrt_path == str(tmp_path / "tiled.vrt")
+    tiles = os.listdir(tmp_path / "tiled")
+    assert len(tiles) == -(-width // 64) * -(-height // 64)
+    assert "tiled_0_0.tif" in tiles
+    with rasterio.open(vrt_path) as src:
+        np.testing.assert_array_equal(src.read(), expected)
+        np.testing.assert_array_equal(src.dataset_mask(), expected_mask)
+
+
+def test_export_resumes_from_checkpoint(raster_path, tmp_path, monkeypatch):
+    image = eval_image(
+        {"name": "__mul__", "args": [{"name": "load", "args": [raster_path]}, 2]}
+    )
+    expected_path = image.export(str(tmp_path / "expected.tif"), scale=100)
+    path = str(tmp_path / "out.tif")
+
+    monkeypatch.setattr(image_module, "WINDOW_SIZE", 64)
+    monkeypatch.setattr(image_module.settings, "export_checkpoint_interval", 2)
+
+    def _fail(done, total):
+        if done == 5:
+            raise RuntimeError("Export died")
+
+    with pytest.raises(RuntimeError):
+        image.export(path, scale=100, progress=_fail)
+    assert os.path.exists(f"{path}.checkpoint")
+
+    read_window = image_module._read_window
+    reads = []
+
+    def _read_window(*args):
+        reads.append(args)
+        return read_window(*args)
+
+    monkeypatch.setattr(image_module, "_read_window", _read_window)
+    progress = []
+    image.export(path, scale=100, progress=lambda done, total: progress.append(done))
+
+    assert progress[0] == 5
+    assert len(reads) == progress[-1] - 5
+    assert not os.path.exists(f"{path}.checkpoint")
+    with rasterio.open(path) as src, rasterio.open(expected_path) as expected:
+        np.testing.assert_array_equal(src.read(), expected.read())
+        np.testing.assert_array_equal(src.dataset_mask(), expected.dataset_mask())
+
+
+def test_export_restarts_when_sources_change(raster_path, tmp_path, monkeypatch):
+    image = eval_image(
+        {"name": "__mul__", "args": [{"name": "load", "args": [raster_path]}, 2]}
+    )
+    path = str(tmp_path / "out.tif")
+    monkeypatch.setattr(image_module, "WINDOW_SIZE", 64)
+    monkeypatch.setattr(image_module.settings, "export_checkpoint_interval", 2)
+
+    def _fail(done, total):
+        if done == 5:
+            raise RuntimeError("Export died")
+
+    with pytest.raises(RuntimeError):
+        image.export(path, scale=100, progress=_fail)
+
+    stat = os.stat(raster_path)
+    os.utime(raster_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    progress = []
+    image.export(path, scale=100, progress=lambda done, total: progress.append(done))
+
+    assert progress[0] == 0
+
+
+def test_metatile_slices_into_tiles(raster_path):
+    image = Image.load(raster_path)
+    z = image.max_zoom + 3
+    with ImageReader(image) as src:
+        tile = src.tms.tile(-59.5, -34.5, z)
+        tiles = src.metatile(tile.x, tile.y, z, 4)
+
+        assert tile in tiles
+        assert len(tiles) > 1
+        for t, img in tiles.items():
+            assert t.x // 4 == tile.x // 4 and t.y // 4 == tile.y // 4
+            expected = src.tile(t.x, t.y, t.z)
+            assert img.data.shape == expected.data.shape
+            np.testing.assert_array_equal(img.data, expected.data)
+            np.testing.assert_array_equal(img.mask, expected.mask)
+
+
+def test_reader_statistics(raster_path, monkeypatch):
+    image = Image.load(raster_path)
+    with ImageReader(image) as src:
+        approx = src.statistics(max_size=32)
+        expected = src.statistics(scale=500)
+        monkeypatch.setattr(image_module, "WINDOW_SIZE", 64)
+        windowed = src.statistics(scale=500, workers=2)
+
+    assert list(approx) == ["B1", "B2", "B3"]
+    assert 0 <= approx["B1"].min <= approx["B1"].mean <= approx["B1"].max <= 999
+    assert approx["B1"].count < expected["B1"].count
+    for name, stats in windowed.items():
+        assert stats.dict() == pytest.approx(expected[name].dict())
+
+
+def test_reader_samples_points_by_block(raster_path, mocker):
+    image = Image.load(raster_path) * 2
+    rng = np.random.default_rng(0)
+    xs, ys = rng.uniform(-60.2, -58.8, 100), rng.uniform(-35.2, -33.8, 100)
+    inside = (xs > -60) & (xs < -59) & (ys > -35) & (ys < -34)
+    read_window = mocker.spy(image_module, "_read_window")
+
+    with ImageReader(image) as src:
+        values = src.sample(xs, ys, block_size=32)
+
+    assert values.shape == (3, 100)
+    assert (~values.mask[0] == inside).all()
+    assert read_window.call_count < inside.sum()
+    with rasterio.open(raster_path) as src:
+        expected = np.array([v for v in src.sample(zip(xs, ys))]).T.astype(int) * 2
+    # Points are sampled from the grid of the raster, so values are its pixels
+    assert (values[:, inside] == expected[:, inside]).all()
+
+
+def test_image_keeps_the_pixel_grid_of_its_sources(raster_path, tmp_path):
+    def write(name, transform):
+        path = str(tmp_path / name)
+        with rasterio.open(raster_path) as src:
+            profile, data = src.profile, src.read()
+        with rasterio.open(path, "w", **{**profile, "transform": transform}) as dst:
+            dst.write(data)
+        return Image.load(path)
+
+    image = Image.load(raster_path)
+    res = 1 / 64
+    shifted = write(
+        "shifted.tif", rasterio.Affine.translation(2 * res, 0) * image.transform
+    )
+    misaligned = write(
+        "misaligned.tif", rasterio.Affine.translation(res / 2, 0) * image.transform
+    )
+
+    assert (image * 2).select(["B1"]).transform == image.transform
+    assert (image + shifted).transform == image.transform
+    assert (shifted + image).transform == image.transform
+    assert (image + misaligned).transform is None
+    assert (image + misaligned + shifted).transform is None
+    assert (shifted + (image + misaligned)).transform is None
+    assert (Image.constant(1) + image).transform == image.transform
+    assert ((image + misaligned) * 2).transform is None
+
+
+def test_reader_zonal_statistics(raster_path, monkeypatch, mocker):
+    def box(left, bottom, right, top):
+        ring = [[left, bottom], [right, bottom], [right, top], [left, top]]
+        return {"type": "Polygon", "coordinates": [ring + ring[:1]]}
+
+    triangle = [[-59.9, -34.9], [-59.2, -34.9], [-59.5, -34.2], [-59.9, -34.9]]
+    geoms = [
+        box(-59.8, -34.8, -59.3, -34.3),
+        box(10, 10, 11, 11),
+        {"type": "Polygon", "coordinates": [triangle]},
+    ]
+    features = {
+        "type": "FeatureCollection",
+        "features": [{"type": "Feature", "geometry": g} for g in geoms],
+    }
+    image = Image.load(raster_path)
+    with ImageReader(image) as src:
+        expected = dict(src.zonal_statistics(features))
+        monkeypatch.setattr(image_module, "WINDOW_SIZE", 7)
+        read_window = mocker.spy(image_module, "_read_window")
+        windowed = dict(src.zonal_statistics(features, workers=2))
+        box_img = src.feature(geoms[0])
+
+    assert windowed == expected
+    assert sorted(expected) == [0, 1, 2]
+    assert expected[1]["B1"] == {
+        "count": 0,
+        "sum": 0.0,
+        "mean": None,
+        "min": None,
+        "max": None,
+    }
+    assert expected[0]["B1"]["count"] == int((box_img.mask > 0).sum())
+    # Each window is read once, even if several features intersect it
+    windows = [call.args[1] for call in read_window.call_args_list]
+    assert len(windows) == len({(w.col_off, w.row_off) for w in windows})
+
+
+def test_reader_zonal_statistics_requires_feature_collection(raster_path):
+    with ImageReader(Image.load(raster_path)) as src:
+        with pytest.raises(RuntimeError):
+            src.zonal_statistics({"type": "Polygon", "coordinates": []})
+
+
+def test_reader_preview_reads_from_overviews(raster_path, mocker):
+    with rasterio.open(raster_path, "r+") as dst:
+        dst.build_overviews([2, 4, 8])
+    image = Image.load(raster_path)
+    dataset_open = mocker.spy(image_module.dataset_pool, "open")
+
+    with ImageReader(image) as src:
+        preview = src.preview(max_size=16)
+        full = src.preview(max_size=64)
+
+    assert max(preview.data.shape[1:]) == 16
+    assert preview.count == 3
+    # 64 pixels wide raster, previewed at 16 pixels, is read from the 4x
+    # overview, and at its own resolution from the raster itself
+    options = [call.kwargs for call in dataset_open.call_args_list]
+    assert options == [{"overview_level": 1}, {}]
+    assert max(full.data.shape[1:]) == 64
@@ -0,0 +1,65 @@
+import threading
+
+from geoproc.server.jobs import CANCELLED, DONE, FAILED, JobManager
+
+
+def wait(job):
+    while job.finished_at is None:
+        threading.Event().wait(0.01)
+    return job
+
+
+def test_job_manager_runs_jobs_in_background():
+    manager = JobManager(max_workers=1, ttl=60)
+
+    def fn(job):
+        for i in range(4):
+            job.progress(i + 1, 4)
+        return "ok"
+
+    job = wait(manager.submit("test", fn))
+
+    assert manager.get(job.id) is job
+    info = job.info()
+    assert info["status"] == DONE
+    assert info["result"] == "ok"
+    assert (info["done"], info["total"]) == (4, 4)
+    assert info["throughput"] > 0
+
+
+def test_job_manager_reports_failures():
+    manager = JobManager(max_workers=1, ttl=60)
+
+    def fn(job):
+        raise RuntimeError("boom")
+
+    job = wait(manager.submit("test", fn))
+
+    assert job.status == FAILED
+    assert job.error == "boom"
+
+
+def test_job_manager_cancels_running_jobs():
+    manager = JobManager(max_workers=1, ttl=60)
+    started = threading.Event()
+
+    def fn(job):
+        started.set()
+        while True:
+            job.progress(0, 1)
+
+    job = manager.submit("test", fn)
+    started.wait()
+    job.cancel()
+    wait(job)
+
+    assert job.status == CANCELLED
+
+
+def test_job_manager_forgets_finished_jobs():
+    manager = JobManager(max_workers=1, ttl=0)
+    job = wait(manager.submit("test", lambda job: None))
+
+    manager.submit("test", lambda job: None)
+
+    assert manager.get(job.id) is None
@@ -0,0 +1,92 @@
+import os
+
+import rasterio
+
+from geoproc.server.pool import DatasetPool
+
+
+def test_dataset_pool_reuses_handles(raster_path):
+    pool = DatasetPool(max_size=4, idle_timeout=60)
+
+    with pool.open(raster_path) as src:
+        first = src
+    with pool.open(raster_path) as src:
+        assert src is first
+        assert not src.closed
+
+    info = pool.info()
+    assert info["hits"] == 1
+    assert info["misses"] == 1
+    assert info["idle"] == 1
+    assert info["in_use"] == 0
+
+
+def test_dataset_pool_does_not_share_handles_in_use(raster_path):
+    pool = DatasetPool(max_size=4, idle_timeout=60)
+
+    with pool.open(raster_path) as a, pool.open(raster_path) as b:
+        assert a is not b
+        assert pool.info()["in_use"] == 2
+
+    assert pool.info()["idle"] == 2
+
+
+def test_dataset_pool_keys_by_open_options(raster_path):
+    pool = DatasetPool(max_size=4, idle_timeout=60)
+
+    with pool.open(raster_path) as src:
+        first = src
+    with pool.open(raster_path, sharing=False) as src:
+        assert src is not first
+
+
+def test_dataset_pool_does_not_reuse_handles_of_rewritten_files(raster_path):
+    pool = DatasetPool(max_size=4, idle_timeout=60)
+
+    with pool.open(raster_path) as src:
+        first = src
+        profile, data = src.profile, src.read()
+    with rasterio.open(raster_path, "w", **profile) as dst:
+        dst.write(data[:, ::-1])
+    os.utime(raster_path, ns=(1, 1))
+
+    with pool.open(raster_path) as src:
+        assert src is not first
+        assert (src.read() == data[:, ::-1]).all()
+
+
+def test_dataset_pool_evicts_least_recently_used(raster_path):
+    pool = DatasetPool(max_size=1, idle_timeout=60)
+
+    with pool.open(raster_path) as a, pool.open(raster_path) as b:
+        pass
+
+    # `b` is returned to the pool first, so it is the least recently used
+    assert pool.info()["evictions"] == 1
+    assert b.closed
+    assert not a.closed
+
+
+def test_dataset_pool_expires_idle_handles(raster_path):
+    pool = DatasetPool(max_size=4, idle_timeout=0)
+
+    with pool.open(raster_path) as src:
+        first = src
+    with pool.open(raster_path) as src:
+        assert src is not first
+
+    assert first.closed
+    assert pool.info()["expirations"] == 1
+
+
+def test_dataset_pool_closes_handle_on_error(raster_path):
+    pool = DatasetPool(max_size=4, idle_timeout=60)
+
+    try:
+        with pool.open(raster_path) as src:
+            raise ValueError
+    except ValueError:
+        pass
+
+    assert src.closed
+    assert pool.info()["idle"] == 0
@@ -0,0 +1,50 @@
+import numpy as np
+import pytest
+from rio_tiler.utils import get_array_statistics
+
+from geoproc.server import stats as stats_module
+from geoproc.server.stats import BandAccumulator
+
+
+def accumulate(values, chunks=7):
+    acc = BandAccumulator()
+    for chunk in np.array_split(values, chunks):
+        acc.merge(BandAccumulator.from_values(chunk))
+    return acc
+
+
+def test_band_accumulator_matches_array_statistics():
+    values = np.random.default_rng(0).integers(0, 100, 10000)
+
+    result = accumulate(values).result().dict()
+    expected = get_array_statistics(np.ma.array(values[None, :]))[0]
+
+    assert result.pop("histogram") == expected.pop("histogram")
+    for key, value in expected.items():
+        assert result[key] == pytest.approx(value), key
+
+
+def test_band_accumulator_estimates_percentiles_from_histogram(monkeypatch):
+    monkeypatch.setattr(stats_module, "MAX_UNIQUE_VALUES", 16)
+    values = np.random.default_rng(0).normal(size=10000)
+
+    acc = accumulate(values)
+    result = acc.result().dict()
+
+    assert acc.values is None
+    assert result["mean"] == pytest.approx(values.mean())
+    assert result["std"] == pytest.approx(values.std())
+    assert result["min"] == values.min() and result["max"] == values.max()
+    assert result["median"] == pytest.approx(np.median(values), abs=0.02)
+    assert result["percentile_98"] == pytest.approx(np.percentile(values, 98), abs=0.02)
+    assert sum(result["histogram"][0]) == values.size
+
+
+def test_band_accumulator_counts_masked_pixels():
+    acc = BandAccumulator.from_values(np.array([1, 2, 3]), masked=1)
+    acc.merge(BandAccumulator.from_values(np.array([]), masked=4))
+
+    result = acc.result()
+    assert result.valid_pixels == 3
+    assert result.masked_pixels == 5
+    assert result.valid_percent == 37.5
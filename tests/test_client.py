@@ -1,6 +1,11 @@
-from geoproc.client import APIClient
+import asyncio
+import json
+
+from geoproc.client import APIClient, AsyncAPIClient, default_client
 from geoproc.image import Image
 import httpx
+import numpy as np
+import pytest
 
 
 def test_api_client_default_url():
@@ -8,12 +13,23 @@ def test_api_client_default_url():
     assert client.url == "http://localhost:8000"
 
 
+def test_default_client_is_shared(mocker):
+    assert default_client() is default_client()
+
+    get_info = mocker.patch.object(
+        default_client(), "get_info", return_value={"band_names": ["B1"]}
+    )
+    assert Image("a.tif").band_names == ["B1"]
+    assert Image("b.tif").band_names == ["B1"]
+    assert get_info.call_count == 2
+
+
 def test_api_client_get_map(mocker):
     client = APIClient()
     img = Image(42)
 
     mocker.patch(
-        "httpx.post",
+        "httpx.Client.post",
         return_value=httpx.Response(
             status_code=200,
             json={
@@ -27,6 +43,313 @@ def test_api_client_get_map(mocker):
 
     client.get_map(img)
 
-    httpx.post.assert_called_once_with(
+    httpx.Client.post.assert_called_once_with(
         f"{client.url}/map", json={"image_graph": img.graph, "vis_params": None}
     )
+
+
+def test_api_client_export_non_blocking(mocker):
+    client = APIClient()
+    img = Image(42)
+    job = {"id": "job-id", "status": "pending"}
+
+    mocker.patch(
+        "httpx.Client.post",
+        return_value=httpx.Response(status_code=200, json={"detail": job}),
+    )
+    mocker.patch("httpx.Client.get")
+
+    res = client.export(
+        img,
+        scale=1000,
+        in_crs="epsg:4326",
+        crs="epsg:4326",
+        path="out.tif",
+        block=False,
+    )
+
+    assert res == job
+    assert httpx.Client.post.call_args.args == (f"{client.url}/jobs/export",)
+    httpx.Client.get.assert_not_called()
+
+
+def test_api_client_export_blocks_on_export_endpoint(mocker):
+    client = APIClient()
+    img = Image(42)
+
+    mocker.patch(
+        "httpx.Client.post",
+        return_value=httpx.Response(
+            status_code=200, json={"result": "ok", "path": "out.tif"}
+        ),
+    )
+    mocker.patch("httpx.Client.get")
+
+    res = client.export(
+        img,
+        scale=1000,
+        in_crs="epsg:4326",
+        crs="epsg:4326",
+        path="out.tif",
+    )
+
+    assert res == {"result": "ok", "path": "out.tif"}
+    assert httpx.Client.post.call_args.args == (f"{client.url}/export",)
+    httpx.Client.get.assert_not_called()
+
+
+def test_api_client_seed_reports_progress(mocker):
+    client = APIClient()
+    progress = mocker.Mock()
+
+    mocker.patch(
+        "httpx.Client.post",
+        return_value=httpx.Response(
+            status_code=200, json={"detail": {"id": "job-id", "status": "pending"}}
+        ),
+    )
+    mocker.patch(
+        "httpx.Client.get",
+        side_effect=[
+            httpx.Response(
+                status_code=200,
+                json={"detail": {"status": "running", "done": 1, "total": 4}},
+            ),
+            httpx.Response(
+                status_code=200,
+                json={"detail": {"status": "done", "done": 4, "total": 4}},
+            ),
+        ],
+    )
+
+    job = client.seed(
+        "map-id", min_zoom=0, max_zoom=2, poll_interval=0, progress=progress
+    )
+
+    assert job["status"] == "done"
+    assert httpx.Client.post.call_args.args == (f"{client.url}/jobs/seed",)
+    assert httpx.Client.post.call_args.kwargs["json"]["map_id"] == "map-id"
+    assert progress.call_args_list == [mocker.call(1, 4), mocker.call(4, 4)]
+
+
+def test_api_client_get_statistics(mocker):
+    client = APIClient()
+    img = Image(42)
+    stats = {"CONSTANT": {"min": 42, "max": 42}}
+
+    mocker.patch(
+        "httpx.Client.post",
+        return_value=httpx.Response(status_code=200, json={"detail": stats}),
+    )
+
+    assert client.get_statistics(img, max_size=256) == stats
+    assert httpx.Client.post.call_args.args == (f"{client.url}/statistics",)
+    assert httpx.Client.post.call_args.kwargs["json"]["max_size"] == 256
+    assert httpx.Client.post.call_args.kwargs["json"]["scale"] is None
+
+
+def test_api_client_get_preview(mocker):
+    client = APIClient()
+    img = Image(42)
+
+    mocker.patch(
+        "httpx.Client.post",
+        return_value=httpx.Response(status_code=200, content=b"PNG"),
+    )
+
+    assert client.get_preview(img, max_size=256) == b"PNG"
+    assert httpx.Client.post.call_args.args == (f"{client.url}/preview",)
+    assert httpx.Client.post.call_args.kwargs["json"]["max_size"] == 256
+    assert httpx.Client.post.call_args.kwargs["json"]["vis_params"]["bands"] is None
+
+
+def test_api_client_sample(mocker):
+    client = APIClient()
+    img = Image(42)
+
+    mocker.patch(
+        "httpx.Client.post",
+        return_value=httpx.Response(
+            status_code=200, json={"detail": {"B1": [1, None], "B2": [3, None]}}
+        ),
+    )
+
+    points = {
+        "type": "FeatureCollection",
+        "features": [
+            {"type": "Feature", "geometry": {"type": "Point", "coordinates": [1, 2]}},
+            {"type": "Feature", "geometry": {"type": "Point", "coordinates": [3, 4]}},
+        ],
+    }
+    res = client.sample(img, points)
+
+    assert httpx.Client.post.call_args.kwargs["json"]["coordinates"] == [[1, 2], [3, 4]]
+    assert res["B1"].tolist() == [1, None]
+    assert res["B2"].mask.tolist() == [False, True]
+
+    client.sample(img, np.array([[1, 2], [3, 4]]))
+    assert httpx.Client.post.call_args.kwargs["json"]["coordinates"] == [[1, 2], [3, 4]]
+
+
+def test_api_client_zonal_statistics(mocker):
+    client = APIClient()
+    img = Image(42)
+    lines = [
+        {"index": 1, "id": "b", "stats": {"CONSTANT": {"count": 4}}},
+        {"index": 0, "id": "a", "stats": {"CONSTANT": {"count": 2}}},
+    ]
+    content = "".join(json.dumps(line) + "\n" for line in lines).encode()
+
+    stream = mocker.patch("httpx.Client.stream")
+    stream.return_value.__enter__.return_value = httpx.Response(
+        status_code=200, content=content
+    )
+
+    features = {"type": "FeatureCollection", "features": []}
+    assert list(client.zonal_statistics(img, features)) == lines
+    assert stream.call_args.args == ("POST", f"{client.url}/zonal-statistics")
+    assert stream.call_args.kwargs["json"]["features"] == features
+
+
+def test_async_api_client_runs_requests_concurrently(mocker):
+    stats = {"CONSTANT": {"min": 42, "max": 42}}
+    post = mocker.patch(
+        "httpx.AsyncClient.post",
+        return_value=httpx.Response(status_code=200, json={"detail": stats}),
+    )
+
+    async def _run():
+        async with AsyncAPIClient() as client:
+            images = [Image(i) for i in range(3)]
+            return await asyncio.gather(*(client.get_statistics(img) for img in images))
+
+    assert asyncio.run(_run()) == [stats] * 3
+    assert post.call_count == 3
+    assert post.call_args.args == ("http://localhost:8000/statistics",)
+
+
+def test_api_client_memoizes_info(mocker):
+    client = APIClient()
+    info = {"band_names": ["B1"]}
+    mocker.patch(
+        "httpx.Client.post",
+        return_value=httpx.Response(status_code=200, json={"detail": info}),
+    )
+
+    assert client.get_info(Image("a.tif")) == info
+    assert client.get_info(Image("a.tif")) == info
+    assert httpx.Client.post.call_count == 1
+
+
+def test_api_client_get_infos_sends_missing_graphs_once(mocker):
+    client = APIClient()
+    items = [{"status": 200, "detail": {"band_names": [name]}} for name in "ab"]
+    mocker.patch(
+        "httpx.Client.post",
+        return_value=httpx.Response(status_code=200, json={"detail": items}),
+    )
+
+    images = [Image("a.tif"), Image("b.tif"), Image("a.tif")]
+    infos = client.get_infos(images)
+
+    assert [info["band_names"] for info in infos] == [["a"], ["b"], ["a"]]
+    assert httpx.Client.post.call_args.args == (f"{client.url}/info/batch",)
+    assert httpx.Client.post.call_args.kwargs["json"] == [
+        images[0].graph,
+        images[1].graph,
+    ]
+    assert client.get_info(Image("b.tif")) == {"band_names": ["b"]}
+    assert httpx.Client.post.call_count == 1
+
+
+def test_async_api_client_batches_concurrent_info_requests(mocker):
+    def _batch_info(url, json):
+        items = [{"status": 200, "detail": {"graph": graph}} for graph in json]
+        return httpx.Response(status_code=200, json={"detail": items})
+
+    post = mocker.patch("httpx.AsyncClient.post", side_effect=_batch_info)
+    images = [Image(f"{i % 50}.tif") for i in range(500)]
+
+    async def _run():
+        async with AsyncAPIClient() as client:
+            infos = await asyncio.gather(*(client.get_info(img) for img in images))
+            return infos, await client.get_info(images[0])
+
+    infos, info = asyncio.run(_run())
+
+    assert [info["graph"] for info in infos] == [img.graph for img in images]
+    assert info == infos[0]
+    assert post.call_count == 1
+    assert post.call_args.args == ("http://localhost:8000/info/batch",)
+    assert len(post.call_args.kwargs["json"]) == 50
+
+
+def test_api_client_get_array_decodes_without_copies(mocker):
+    client = APIClient()
+    data = np.arange(2 * 3 * 4, dtype=np.float32).reshape(2, 3, 4)
+    mask = np.full((3, 4), 255, dtype=np.uint8)
+    headers = {
+        "X-Array-Dtype": data.dtype.str,
+        "X-Array-Shape": "2,3,4",
+        "X-Array-Band-Names": json.dumps(["B1", "B2"]),
+        "X-Array-Bounds": json.dumps([0, 0, 1, 1]),
+        "X-Array-Crs": "EPSG:4326",
+    }
+    mocker.patch(
+        "httpx.Client.post",
+        return_value=httpx.Response(
+            status_code=200, headers=headers, content=data.tobytes() + mask.tobytes()
+        ),
+    )
+
+    res = client.get_array(Image("a.tif"), tile=(1, 0, 0))
+
+    assert httpx.Client.post.call_args.kwargs["json"]["tile"] == (1, 0, 0)
+    np.testing.assert_array_equal(res["data"], data)
+    np.testing.assert_array_equal(res["mask"], mask)
+    assert res["data"].base is not None and not res["data"].flags.writeable
+    assert res["band_names"] == ["B1", "B2"]
+    assert res["bounds"] == (0, 0, 1, 1)
+
+    httpx.Client.post.return_value = httpx.Response(status_code=204)
+    assert client.get_array(Image("a.tif"), tile=(9, 0, 0)) is None
+
+
+def test_clients_raise_server_errors(mocker):
+    error = httpx.Response(status_code=400, json={"detail": "Invalid band names"})
+    mocker.patch("httpx.Client.post", return_value=error)
+    mocker.patch("httpx.AsyncClient.post", return_value=error)
+
+    with pytest.raises(RuntimeError, match="Invalid band names"):
+        APIClient().get_preview(Image(42))
+
+    async def _run():
+        async with AsyncAPIClient() as client:
+            await client.get_preview(Image(42))
+
+    with pytest.raises(RuntimeError, match="Invalid band names"):
+        asyncio.run(_run())
+
+
+def test_async_api_client_keeps_info_batches_in_flight(mocker):
+    async def _batch_info(url, json):
+        await asyncio.sleep(0.01)
+        items = [{"status": 200, "detail": {"graph": graph}} for graph in json]
+        return httpx.Response(status_code=200, json={"detail": items})
+
+    post = mocker.patch("httpx.AsyncClient.post", side_effect=_batch_info)
+
+    async def _run():
+        async with AsyncAPIClient() as client:
+            first = asyncio.ensure_future(client.get_info(Image("a.tif")))
+            # Let the first batch be sent before requesting another image
+            for _ in range(3):
+                await asyncio.sleep(0)
+            second = asyncio.ensure_future(client.get_info(Image("b.tif")))
+            await asyncio.sleep(0)
+            in_flight = len(client._info_tasks)
+            await asyncio.gather(first, second)
+            return in_flight, len(client._info_tasks)
+
+    assert asyncio.run(_run()) == (2, 0)
+    assert post.call_count == 2
@@ -21,6 +21,14 @@ def test_image_init_load():
     assert img.graph == {"args": ["tci.tif"], "name": "load"}
 
 
+def test_image_astype():
+    img = Image(2).astype("float32")
+    assert img.graph == {
+        "name": "astype",
+        "args": [{"name": "constant", "args": [2]}, "float32"],
+    }
+
+
 def test_image_abs():
     img = Image(-4)
     assert abs(img).graph == {